@@ -0,0 +1,235 @@
+"""Offline end-to-end benchmark of the Interaction Agent.
+
+Swaps the Gemini model for `ScriptedChatModel`, then drives
+
+- `graph`: the real `build_graph()` workflow via `app.ainvoke`, and
+- `http`: the real FastAPI `app_service` (`POST /chat`) in-process over ASGI,
+
+with `--concurrency` concurrent clients until `--requests` runs have
+completed. Reports p50/p95/p99 latency, throughput, errors and the time
+spent per graph node (model vs tools), and writes everything to a JSON file
+so results can be compared between commits.
+
+Usage:
+    python -m benchmarks.bench_agent --requests 200 --concurrency 16 --latency 0.2 [--mode graph|http|both]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.scripted_model import ScriptedChatModel, load_scenarios
+
+SCENARIOS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios.json")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list (0 for an empty one)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(-(-p * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], wall_s: float, errors: int) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "wall_s": round(wall_s, 4),
+        "throughput_rps": round(len(latencies) / wall_s, 2) if wall_s > 0 else 0.0,
+        "mean_ms": round(1000 * sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "p50_ms": round(1000 * percentile(ordered, 50), 3),
+        "p95_ms": round(1000 * percentile(ordered, 95), 3),
+        "p99_ms": round(1000 * percentile(ordered, 99), 3),
+        "max_ms": round(1000 * ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+class NodeTimer:
+    """Wraps graph node functions and accumulates their wall time."""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        async def timed(state):
+            start = time.perf_counter()
+            try:
+                return await fn(state)
+            finally:
+                self.totals[name] += time.perf_counter() - start
+                self.calls[name] += 1
+        timed.__name__ = getattr(fn, "__name__", name)
+        return timed
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        grand = sum(self.totals.values()) or 1.0
+        return {
+            name: {
+                "calls": self.calls[name],
+                "total_ms": round(1000 * total, 3),
+                "mean_ms": round(1000 * total / self.calls[name], 3) if self.calls[name] else 0.0,
+                "share": round(total / grand, 4),
+            }
+            for name, total in sorted(self.totals.items())
+        }
+
+
+async def drive(run_one: Callable[[int], Any], requests: int, concurrency: int) -> Dict[str, float]:
+    """Run `run_one(i)` for i in range(requests) with `concurrency` workers."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await run_one(i)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def setup_agent(model: ScriptedChatModel, timer: NodeTimer):
+    """Install `model` in `src.main` and compile the real graph with timed nodes."""
+    import src.main as main
+
+    main.llm = model
+    main.tools = main.build_tools(model)
+    main.tools_by_name = {tool.name: tool for tool in main.tools}
+    main.model_router = main.ModelRouter([main.ModelBackend("scripted", model, provider="scripted")])
+    main.model_router.bind_tools(main.tools)
+    original = main.call_model, main.tool_node
+    main.call_model = timer.wrap("agent", original[0])
+    main.tool_node = timer.wrap("tools", original[1])
+    try:
+        main.app = main.build_graph()
+    finally:
+        main.call_model, main.tool_node = original
+    main.schema_digest.refresh(force=True)
+    return main
+
+
+async def bench_graph(main, questions: List[str], requests: int, concurrency: int) -> Dict[str, float]:
+    async def run_one(i):
+        state = {"messages": [main.build_system_message(), HumanMessage(content=questions[i % len(questions)])]}
+        await main.app.ainvoke(state, config=main.new_run_config())
+    return await drive(run_one, requests, concurrency)
+
+
+async def bench_http(main, questions: List[str], requests: int, concurrency: int) -> Dict[str, float]:
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app_service)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def run_one(i):
+            response = await client.post("/chat", params={"question": questions[i % len(questions)]})
+            response.raise_for_status()
+            if response.json().get("response", "").startswith("An error occurred"):
+                raise RuntimeError(response.json()["response"])
+        return await drive(run_one, requests, concurrency)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_benchmark(requests: int = 100, concurrency: int = 8, latency_s: float = 0.05, jitter_s: float = 0.0,
+                        mode: str = "both", scenarios_file: str = SCENARIOS_FILE,
+                        answer_cache: bool = False, templates: bool = False, coalesce: bool = False) -> Dict[str, Any]:
+    """Run the selected modes and return the full results dict.
+
+    The answer cache, SQL templates and request coalescing all answer a
+    repeated question without the model, so they are off unless asked for:
+    by default every request reaches the graph.
+    """
+    scenarios = load_scenarios(scenarios_file)
+    model = ScriptedChatModel(scenarios=scenarios, latency_s=latency_s, jitter_s=jitter_s)
+    questions = [s["question"] for s in scenarios]
+    results: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "requests": requests,
+            "concurrency": concurrency,
+            "model_latency_s": latency_s,
+            "model_jitter_s": jitter_s,
+            "answer_cache": answer_cache,
+            "templates": templates,
+            "coalesce": coalesce,
+            "scenarios": len(scenarios),
+        },
+    }
+    for name in (["graph", "http"] if mode == "both" else [mode]):
+        timer = NodeTimer()
+        main = setup_agent(model, timer)
+        if not answer_cache:
+            main.answer_cache.max_entries = 0
+        if not templates:
+            main.template_store.max_patterns = 0
+        main.COALESCE = coalesce
+        main.query_cache.invalidate()
+        calls_before = model.calls
+        bench = bench_graph if name == "graph" else bench_http
+        summary = await bench(main, questions, requests, concurrency)
+        summary["model_calls"] = model.calls - calls_before
+        summary["nodes"] = timer.report()
+        results[name] = summary
+    return results
+
+
+def save_results(results: Dict[str, Any], path: str = None) -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = results["meta"]["timestamp"].replace(":", "")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{results['meta']['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the AEGIS agent with a scripted model.")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="artificial model latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra 0..jitter seconds per call")
+    parser.add_argument("--mode", choices=["graph", "http", "both"], default="both")
+    parser.add_argument("--scenarios", default=SCENARIOS_FILE)
+    parser.add_argument("--answer-cache", action="store_true", help="leave the answer cache on")
+    parser.add_argument("--templates", action="store_true", help="leave SQL templates on")
+    parser.add_argument("--coalesce", action="store_true", help="leave request coalescing on")
+    parser.add_argument("--out", help="results file (default benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args.requests, args.concurrency, args.latency, args.jitter,
+                                        args.mode, args.scenarios, args.answer_cache, args.templates,
+                                        args.coalesce))
+    for name in ("graph", "http"):
+        if name in results:
+            r = results[name]
+            split = ", ".join(f"{node} {v['share']:.0%}" for node, v in r["nodes"].items())
+            print(f"{name:>5}: {r['throughput_rps']} req/s  p50 {r['p50_ms']}ms  p95 {r['p95_ms']}ms  "
+                  f"p99 {r['p99_ms']}ms  errors {r['errors']}  [{split}]")
+    print(f"Results written to {save_results(results, args.out)}")
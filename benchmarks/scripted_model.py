@@ -0,0 +1,96 @@
+"""A deterministic stand-in for the Gemini chat model.
+
+`ScriptedChatModel` replays recorded tool-call sequences instead of calling an
+API. A scenario is a question plus the model turns that answered it:
+
+    {"question": "How many films are there?",
+     "turns": [{"tool_calls": [{"name": "sql_db_query", "args": {"query": "SELECT COUNT(*) FROM film"}}]},
+               {"content": "There are 1000 films."}]}
+
+The turn to play is chosen from the conversation itself (the latest human
+message picks the scenario, the number of model messages after it picks the
+turn), so one instance can serve any number of concurrent runs. Every call
+sleeps `latency_s` (plus up to `jitter_s`, derived from the conversation so
+runs are repeatable) to stand in for model time, and reports token usage
+estimated from message sizes.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.cache import normalize_question
+
+
+def load_scenarios(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return json.load(f)["scenarios"]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that replays `scenarios` with artificial latency."""
+
+    scenarios: List[Dict[str, Any]]
+    latency_s: float = 0.0
+    jitter_s: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _scenario(self, question: str) -> Dict[str, Any]:
+        key = normalize_question(question)
+        for scenario in self.scenarios:
+            if normalize_question(scenario["question"]) == key:
+                return scenario
+        digest = hashlib.blake2b(key.encode(), digest_size=4).digest()
+        return self.scenarios[int.from_bytes(digest, "big") % len(self.scenarios)]
+
+    def _delay(self, messages: List[BaseMessage]) -> float:
+        if not self.jitter_s:
+            return self.latency_s
+        seed = hashlib.blake2b(f"{len(messages)}:{messages[-1].content}".encode(), digest_size=4).digest()
+        return self.latency_s + self.jitter_s * int.from_bytes(seed, "big") / 0xFFFFFFFF
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        question = messages[last_human].content if last_human >= 0 else ""
+        step = sum(1 for m in messages[last_human + 1:] if isinstance(m, AIMessage))
+        turns = self._scenario(str(question))["turns"]
+        turn = turns[min(step, len(turns) - 1)]
+        if step >= len(turns) - 1 and turn.get("tool_calls"):
+            turn = {"content": "Done."}  # never loop forever on a script that ends in a tool call
+
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        content = turn.get("content", "")
+        tool_calls = [
+            {"name": call["name"], "args": call["args"], "id": f"call_{last_human}_{step}_{i}", "type": "tool_call"}
+            for i, call in enumerate(turn.get("tool_calls", []))
+        ]
+        output_tokens = max(1, (len(content) + len(json.dumps(tool_calls))) // 4)
+        self.calls += 1
+        return AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens,
+                            "total_tokens": input_tokens + output_tokens},
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
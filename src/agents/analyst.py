@@ -4,27 +4,44 @@ This module provides a minimal, testable scaffold for the Analyst agent describe
 in `docs/agents/analyst.md`. It intentionally avoids heavy dependencies and can
 be integrated into the LangGraph workflow later.
 """
-from typing import Dict, Any, Tuple
-import sqlite3
+from typing import Dict, Optional, Tuple
 import time
 
+from src.db import get_pool
+from src.agents.baseline import BaselineStore
+from src.agents.workload import WorkloadRecorder
 
-def sample_query_latency(db_path: str, sample_sql: str = "SELECT 1") -> float:
-    """Run a simple query and return elapsed time in seconds."""
-    start = time.perf_counter()
-    conn = sqlite3.connect(db_path)
-    try:
-        cur = conn.cursor()
+
+def sample_query_latency(
+    db_path: str,
+    sample_sql: str = "SELECT 1",
+    recorder: Optional[WorkloadRecorder] = None,
+) -> float:
+    """Run `sample_sql` and return its elapsed time in seconds.
+
+    Uses the calling thread's connection from a writable pool that leaves the
+    journal mode alone, so a sampled write runs (and is committed) like any
+    other statement and the sample measures execution, fetch and commit, not
+    connection setup. If a `recorder` is given the sample is also captured as
+    workload.
+    """
+    with get_pool(db_path, read_only=False, wal=False).cursor() as cur:
+        start = time.perf_counter()
         cur.execute(sample_sql)
-        _ = cur.fetchall()
-        conn.commit()
-    finally:
-        conn.close()
-    return time.perf_counter() - start
+        rows = cur.fetchall()
+        cur.connection.commit()
+        elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.record(sample_sql, elapsed, len(rows), source="analyst")
+    return elapsed
 
 
 def compute_baseline(latencies: "list[float]") -> Dict[str, float]:
-    """Compute simple baseline statistics (mean, median, max)."""
+    """Compute simple baseline statistics (mean, median, max).
+
+    Exact, but sorts the whole list; for continuous monitoring use
+    `BaselineStore` (src/agents/baseline.py), which updates in O(1) per sample.
+    """
     if not latencies:
         return {"mean": 0.0, "median": 0.0, "max": 0.0}
     sorted_l = sorted(latencies)
@@ -34,15 +51,50 @@ def compute_baseline(latencies: "list[float]") -> Dict[str, float]:
     return {"mean": mean, "median": median, "max": max(sorted_l)}
 
 
-def detect_anomaly(current_latency: float, baseline: Dict[str, float], threshold: float = 3.0) -> Tuple[bool, str]:
-    """Detect if current latency exceeds threshold * baseline_mean."""
-    mean = baseline.get("mean", 0.0)
-    if mean <= 0:
+def detect_anomaly(
+    current_latency: float,
+    baseline: Dict[str, float],
+    threshold: float = 3.0,
+    stat: str = "mean",
+    min_samples: int = 0,
+) -> Tuple[bool, str]:
+    """Detect if current latency exceeds threshold * baseline[stat].
+
+    `stat` defaults to the mean; with a `BaselineStore` summary it can be a
+    percentile such as "p95" or "p99". `min_samples` requires that many
+    samples (baseline["count"]) before anything is flagged.
+    """
+    reference = baseline.get(stat, 0.0)
+    if reference <= 0 or baseline.get("count", min_samples) < min_samples:
         return False, "baseline not established"
-    if current_latency > threshold * mean:
-        return True, f"latency {current_latency:.3f}s > {threshold}x baseline mean ({mean:.3f}s)"
+    if current_latency > threshold * reference:
+        return True, f"latency {current_latency:.3f}s > {threshold}x baseline {stat} ({reference:.3f}s)"
     return False, "ok"
 
 
+def sample_and_check(
+    store: BaselineStore,
+    db_path: str,
+    sample_sql: str,
+    threshold: float = 2.0,
+    stat: str = "p99",
+    min_samples: int = 30,
+) -> Tuple[float, bool, str]:
+    """Sample `sample_sql`, check it against its fingerprint's baseline, then record it.
+
+    The check runs before the sample is added so an outlier is judged against
+    history, not against itself. Returns (latency, is_anomaly, reason).
+    """
+    latency = sample_query_latency(db_path, sample_sql)
+    key, fingerprint = store.key_for(sample_sql)
+    baseline = store.baseline(key)
+    if baseline is None:
+        is_anomaly, reason = False, "baseline not established"
+    else:
+        is_anomaly, reason = detect_anomaly(latency, baseline, threshold, stat=stat, min_samples=min_samples)
+    store.record_fingerprint(key, fingerprint, latency)
+    return latency, is_anomaly, reason
+
+
 if __name__ == "__main__":
     print("Analyst scaffold loaded. Use functions for baseline sampling and anomaly detection.")
@@ -0,0 +1,335 @@
+"""Streaming latency baselines for the Analyst agent.
+
+`compute_baseline` in `analyst.py` needs the full list of samples. For
+continuous monitoring that does not scale, so `BaselineStore` keeps one
+`QueryBaseline` per query fingerprint and updates it in O(1) per sample:
+
+- `RunningStats`: count, mean, variance (Welford), min and max.
+- `P2Quantile`: the P² streaming quantile estimator (Jain & Chlamtac) for
+  p50/p95/p99, five markers each, no raw samples kept.
+- `DecayingMean`: exponentially time-decayed mean for 1m/1h/1d windows, so
+  recent behaviour can be compared with the long-run baseline.
+
+The store persists to a JSON file and reloads it on start. A file that
+cannot be read or parsed is logged and the store starts empty.
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.sqltext import fingerprint_id, fingerprint_sql
+
+log = logging.getLogger("aegis.baseline")
+
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOWS = {"1m": 60.0, "1h": 3600.0, "1d": 86400.0}
+
+
+class RunningStats:
+    """Welford's online mean/variance plus min/max."""
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2,
+                "min": self.min if self.count else None, "max": self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, float]) -> "RunningStats":
+        stats = cls()
+        stats.count = int(data["count"])
+        stats.mean = float(data["mean"])
+        stats.m2 = float(data["m2"])
+        stats.min = math.inf if data.get("min") is None else float(data["min"])
+        stats.max = -math.inf if data.get("max") is None else float(data["max"])
+        return stats
+
+
+class P2Quantile:
+    """P² estimator of one quantile `p` in O(1) memory and time per sample."""
+
+    __slots__ = ("p", "q", "n", "ns", "dns", "initial")
+
+    def __init__(self, p: float):
+        self.p = p
+        self.q: List[float] = []  # marker heights
+        self.n = [0, 1, 2, 3, 4]  # marker positions
+        self.ns = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]  # desired positions
+        self.dns = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+        self.initial: List[float] = []
+
+    def add(self, x: float) -> None:
+        if len(self.initial) < 5:
+            self.initial.append(x)
+            if len(self.initial) == 5:
+                self.q = sorted(self.initial)
+            return
+
+        q, n = self.q, self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.ns[i] += self.dns[i]
+
+        for i in (1, 2, 3):
+            d = self.ns[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> float:
+        if len(self.initial) < 5:
+            if not self.initial:
+                return 0.0
+            ordered = sorted(self.initial)
+            return ordered[min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))]
+        return self.q[2]
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"p": self.p, "q": self.q, "n": self.n, "ns": self.ns, "initial": self.initial}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "P2Quantile":
+        est = cls(float(data["p"]))
+        est.q = [float(v) for v in data["q"]]
+        est.n = [int(v) for v in data["n"]]
+        est.ns = [float(v) for v in data["ns"]]
+        est.initial = [float(v) for v in data["initial"]]
+        return est
+
+
+class DecayingMean:
+    """Mean whose sample weights halve every `half_life` seconds."""
+
+    __slots__ = ("half_life", "weight", "total", "last_ts")
+
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self.weight = 0.0
+        self.total = 0.0
+        self.last_ts: Optional[float] = None
+
+    def _decay(self, ts: float) -> None:
+        if self.last_ts is not None and ts > self.last_ts:
+            factor = 0.5 ** ((ts - self.last_ts) / self.half_life)
+            self.weight *= factor
+            self.total *= factor
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+
+    def add(self, x: float, ts: float) -> None:
+        self._decay(ts)
+        self.weight += 1.0
+        self.total += x
+
+    def value(self) -> float:
+        return self.total / self.weight if self.weight > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"half_life": self.half_life, "weight": self.weight, "total": self.total, "last_ts": self.last_ts}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "DecayingMean":
+        window = cls(float(data["half_life"]))
+        window.weight = float(data["weight"])
+        window.total = float(data["total"])
+        window.last_ts = data.get("last_ts")
+        return window
+
+
+class QueryBaseline:
+    """All online statistics for one query fingerprint."""
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.stats = RunningStats()
+        self.quantiles = {p: P2Quantile(p) for p in QUANTILES}
+        self.windows = {name: DecayingMean(hl) for name, hl in WINDOWS.items()}
+        self.updated_at = 0.0
+
+    def add(self, latency: float, ts: float) -> None:
+        self.stats.add(latency)
+        for est in self.quantiles.values():
+            est.add(latency)
+        for window in self.windows.values():
+            window.add(latency, ts)
+        self.updated_at = ts
+
+    def summary(self) -> Dict[str, float]:
+        """Baseline dict compatible with `analyst.detect_anomaly` (has `mean`, `median`, `max`)."""
+        s = self.stats
+        out = {
+            "count": s.count,
+            "mean": s.mean,
+            "stddev": s.stddev,
+            "min": s.min if s.count else 0.0,
+            "max": s.max if s.count else 0.0,
+            "median": self.quantiles[0.5].value(),
+            "p50": self.quantiles[0.5].value(),
+            "p95": self.quantiles[0.95].value(),
+            "p99": self.quantiles[0.99].value(),
+        }
+        for name, window in self.windows.items():
+            out[f"mean_{name}"] = window.value()
+        return out
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "fingerprint": self.fingerprint,
+            "stats": self.stats.to_dict(),
+            "quantiles": [est.to_dict() for est in self.quantiles.values()],
+            "windows": {name: w.to_dict() for name, w in self.windows.items()},
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "QueryBaseline":
+        baseline = cls(str(data["fingerprint"]))
+        baseline.stats = RunningStats.from_dict(data["stats"])
+        for est_data in data["quantiles"]:
+            est = P2Quantile.from_dict(est_data)
+            baseline.quantiles[est.p] = est
+        for name, w in data.get("windows", {}).items():
+            baseline.windows[name] = DecayingMean.from_dict(w)
+        baseline.updated_at = float(data.get("updated_at", 0.0))
+        return baseline
+
+
+class BaselineStore:
+    """Per-fingerprint streaming baselines with JSON persistence.
+
+    At most `max_queries` fingerprints are tracked; the least recently
+    updated one is dropped when a new fingerprint would exceed the cap.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_queries: int = 10000):
+        self.path = path
+        self.max_queries = max_queries
+        self._baselines: "OrderedDict[str, QueryBaseline]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                self.load(path)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # A corrupt or truncated file must not stop startup; the next save replaces it
+                log.error(f"Ignoring unreadable baselines file {path}: {e!r}")
+
+    def __len__(self) -> int:
+        return len(self._baselines)
+
+    @staticmethod
+    def key_for(sql: str) -> Tuple[str, str]:
+        """(fingerprint id, fingerprint text) for a raw SQL statement."""
+        fingerprint = fingerprint_sql(sql)
+        return fingerprint_id(fingerprint), fingerprint
+
+    def record(self, sql: str, latency: float, ts: Optional[float] = None) -> str:
+        """Add one latency sample (seconds) for `sql`; returns its fingerprint id."""
+        key, fingerprint = self.key_for(sql)
+        self.record_fingerprint(key, fingerprint, latency, ts)
+        return key
+
+    def record_fingerprint(self, key: str, fingerprint: str, latency: float, ts: Optional[float] = None) -> None:
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            baseline = self._baselines.get(key)
+            if baseline is None:
+                baseline = QueryBaseline(fingerprint)
+                self._baselines[key] = baseline
+                while len(self._baselines) > self.max_queries:
+                    self._baselines.popitem(last=False)
+            else:
+                self._baselines.move_to_end(key)
+            baseline.add(latency, ts)
+
+    def baseline(self, key_or_sql: str) -> Optional[Dict[str, float]]:
+        """Summary for a fingerprint id (or raw SQL), or None if never seen."""
+        with self._lock:
+            baseline = self._baselines.get(key_or_sql)
+            if baseline is None:
+                baseline = self._baselines.get(self.key_for(key_or_sql)[0])
+            return baseline.summary() if baseline else None
+
+    def fingerprints(self) -> Dict[str, str]:
+        with self._lock:
+            return {key: b.fingerprint for key, b in self._baselines.items()}
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Atomically write every baseline to `path` (JSON)."""
+        path = path or self.path
+        if not path:
+            raise ValueError("no path given for BaselineStore.save")
+        with self._lock:
+            payload = {"version": 1, "baselines": {k: b.to_dict() for k, b in self._baselines.items()}}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".baselines-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def load(self, path: str) -> None:
+        with open(path) as f:
+            payload = json.load(f)
+        loaded = OrderedDict(
+            (key, QueryBaseline.from_dict(data)) for key, data in payload.get("baselines", {}).items()
+        )
+        with self._lock:
+            self._baselines = loaded
@@ -0,0 +1,342 @@
+"""Continuous monitoring loop for the Analyst.
+
+`Monitor` is started from the FastAPI lifespan. It runs a set of canary
+queries, each on its own jittered interval, concurrently on a small private
+thread pool, so sampling never takes a request's tool thread. Writes to the
+store, pruning and baseline saves run on a separate writer thread, so a
+stuck sample cannot hold them up. A canary whose previous sample is still
+running (e.g. past its timeout) is skipped rather than sampled again. Every sample
+goes through `sample_and_check` (the canary's streaming baseline plus
+`detect_anomaly`); failures and anomalies become alerts.
+
+Samples land in `TimeSeriesStore`, a local SQLite file that stays small over
+months:
+- series names are interned, so each row holds only (series id, ts, value);
+- raw samples are kept for `raw_retention` seconds (1 day);
+- 1-minute and 1-hour rollups (count, errors, sum, min, max) are upserted as
+  each sample arrives and kept for 14 and 400 days;
+- `prune()` runs hourly, deletes expired rows and returns freed pages to the
+  file system (`auto_vacuum=INCREMENTAL`).
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from src.agents.analyst import sample_and_check
+from src.agents.baseline import BaselineStore
+
+log = logging.getLogger("aegis.monitor")
+
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+DEFAULT_CANARIES = [
+    {"name": "ping", "sql": "SELECT 1", "interval_s": 30},
+    {"name": "catalog", "sql": "SELECT COUNT(*) FROM sqlite_master", "interval_s": 60},
+]
+
+
+class Canary(NamedTuple):
+    name: str
+    sql: str
+    interval_s: float = 60.0
+
+
+def load_canaries(spec: Optional[str] = None) -> List[Canary]:
+    """Canaries from a JSON list (inline, or the path of a file holding one); the defaults if empty."""
+    if not spec:
+        items = DEFAULT_CANARIES
+    elif os.path.exists(spec):
+        with open(spec) as f:
+            items = json.load(f)
+    else:
+        items = json.loads(spec)
+    return [Canary(item["name"], item["sql"], float(item.get("interval_s", 60.0))) for item in items]
+
+
+# --- Time-series store ---
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS raw (
+    series_id INTEGER NOT NULL, ts REAL NOT NULL, value REAL,
+    PRIMARY KEY (series_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup (
+    series_id INTEGER NOT NULL, res INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL, errors INTEGER NOT NULL, total REAL NOT NULL, lo REAL, hi REAL,
+    PRIMARY KEY (series_id, res, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alert (ts REAL NOT NULL, series TEXT NOT NULL, value REAL, reason TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS alert_ts ON alert (ts);
+"""
+
+_UPSERT_ROLLUP = """
+INSERT INTO rollup (series_id, res, bucket, count, errors, total, lo, hi) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (series_id, res, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    errors = errors + excluded.errors,
+    total = total + excluded.total,
+    lo = CASE WHEN lo IS NULL OR excluded.lo < lo THEN excluded.lo ELSE lo END,
+    hi = CASE WHEN hi IS NULL OR excluded.hi > hi THEN excluded.hi ELSE hi END
+RETURNING count
+"""
+
+
+class TimeSeriesStore:
+    """Raw samples plus 1m/1h rollups in one SQLite file, with retention limits (seconds).
+
+    Row counts are counted once on open and then kept in memory, so `stats()`
+    (served by /health on the event loop) never queries the file.
+    """
+
+    def __init__(self, path: str, raw_retention: float = 86400.0, minute_retention: float = 14 * 86400.0,
+                 hour_retention: float = 400 * 86400.0, alert_retention: float = 90 * 86400.0):
+        self.path = path
+        self.retention = {"raw": raw_retention, "1m": minute_retention, "1h": hour_retention,
+                          "alert": alert_retention}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a new file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._series: Dict[str, int] = dict(
+            (name, series_id) for series_id, name in self._conn.execute("SELECT id, name FROM series"))
+        self._counts = {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                        for table in ("raw", "rollup", "alert")}
+        self._lock = threading.Lock()
+        self.written = 0
+        self.pruned = 0
+
+    def _series_id(self, name: str) -> int:
+        series_id = self._series.get(name)
+        if series_id is None:
+            self._conn.execute("INSERT OR IGNORE INTO series (name) VALUES (?)", (name,))
+            series_id = self._conn.execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()[0]
+            self._series[name] = series_id
+        return series_id
+
+    def record(self, name: str, ts: float, value: Optional[float]) -> None:
+        """Store one sample; `value=None` records a failed sample."""
+        ok = value is not None
+        with self._lock:
+            with self._conn:
+                series_id = self._series_id(name)
+                new_raw = self._conn.execute("INSERT OR IGNORE INTO raw VALUES (?, ?, ?)",
+                                             (series_id, ts, value)).rowcount
+                if not new_raw:
+                    self._conn.execute("UPDATE raw SET value = ? WHERE series_id = ? AND ts = ?",
+                                       (value, series_id, ts))
+                new_buckets = 0
+                for res in RESOLUTIONS.values():
+                    count, = self._conn.execute(_UPSERT_ROLLUP, (
+                        series_id, res, int(ts // res) * res, int(ok), int(not ok), value or 0.0, value, value,
+                    )).fetchone()
+                    new_buckets += count == 1
+            self._counts["raw"] += new_raw
+            self._counts["rollup"] += new_buckets
+            self.written += 1
+
+    def add_alert(self, ts: float, name: str, value: Optional[float], reason: str) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT INTO alert VALUES (?, ?, ?, ?)", (ts, name, value, reason))
+            self._counts["alert"] += 1
+
+    def points(self, name: str, resolution: str = "raw", since: float = 0.0) -> List[Dict[str, object]]:
+        """Samples (`raw`) or rollup buckets (`1m`, `1h`) of one series since `since`, oldest first."""
+        with self._lock:
+            series_id = self._series.get(name)
+            if series_id is None:
+                return []
+            if resolution == "raw":
+                rows = self._conn.execute("SELECT ts, value FROM raw WHERE series_id = ? AND ts >= ? ORDER BY ts",
+                                          (series_id, since)).fetchall()
+                return [{"ts": ts, "value": value} for ts, value in rows]
+            rows = self._conn.execute(
+                "SELECT bucket, count, errors, total, lo, hi FROM rollup "
+                "WHERE series_id = ? AND res = ? AND bucket >= ? ORDER BY bucket",
+                (series_id, RESOLUTIONS[resolution], int(since))).fetchall()
+        return [{"ts": bucket, "count": count, "errors": errors, "mean": total / count if count else None,
+                 "min": lo, "max": hi} for bucket, count, errors, total, lo, hi in rows]
+
+    def alerts(self, limit: int = 50) -> List[Dict[str, object]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT ts, series, value, reason FROM alert ORDER BY ts DESC LIMIT ?",
+                                      (limit,)).fetchall()
+        return [{"ts": ts, "series": series, "value": value, "reason": reason} for ts, series, value, reason in rows]
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete rows past their retention and release the freed pages; returns rows deleted."""
+        now = time.time() if now is None else now
+        with self._lock:
+            with self._conn:
+                removed = {"raw": self._conn.execute("DELETE FROM raw WHERE ts < ?",
+                                                     (now - self.retention["raw"],)).rowcount,
+                           "rollup": 0}
+                for name, res in RESOLUTIONS.items():
+                    removed["rollup"] += self._conn.execute("DELETE FROM rollup WHERE res = ? AND bucket < ?",
+                                                            (res, now - self.retention[name])).rowcount
+                removed["alert"] = self._conn.execute("DELETE FROM alert WHERE ts < ?",
+                                                      (now - self.retention["alert"],)).rowcount
+            for table, rows in removed.items():
+                self._counts[table] -= rows
+            self._conn.execute("PRAGMA incremental_vacuum")
+            deleted = sum(removed.values())
+            self.pruned += deleted
+        return deleted
+
+    def stats(self) -> Dict[str, object]:
+        """Counters only: no lock and no query, so it is safe to call from the event loop."""
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {**self._counts, "series": len(self._series), "written": self.written, "pruned": self.pruned,
+                "bytes": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- Scheduler ---
+
+class Monitor:
+    """Runs canaries on jittered intervals, stores their latencies and raises alerts.
+
+    - `jitter`: each wait is `interval_s` times a random factor in
+      [1 - jitter, 1 + jitter], so canaries do not fire in lockstep.
+    - `threshold`, `stat`, `min_samples`: passed to `sample_and_check`.
+    - `timeout`: seconds to wait for one sample before it counts as failed.
+      The sample's thread may still be busy; that canary is skipped until
+      it finishes.
+    - `on_alert`: optional callback given each alert dict (e.g. for metrics).
+    """
+
+    def __init__(self, db_path: str, store: TimeSeriesStore, canaries: List[Canary],
+                 baselines: Optional[BaselineStore] = None, threshold: float = 2.0, stat: str = "p99",
+                 min_samples: int = 30, jitter: float = 0.2, timeout: float = 10.0,
+                 prune_interval: float = 3600.0, workers: int = 2, max_alerts: int = 100,
+                 on_alert: Optional[Callable[[Dict[str, object]], None]] = None):
+        self.db_path = db_path
+        self.store = store
+        self.canaries = canaries
+        self.baselines = baselines if baselines is not None else BaselineStore()
+        self.threshold = threshold
+        self.stat = stat
+        self.min_samples = min_samples
+        self.jitter = jitter
+        self.timeout = timeout
+        self.prune_interval = prune_interval
+        self.on_alert = on_alert
+        self.recent_alerts: deque = deque(maxlen=max_alerts)
+        self.last: Dict[str, Dict[str, object]] = {}
+        self.samples = 0
+        self.failures = 0
+        self.alerts = 0
+        self.skipped = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aegis-monitor")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aegis-monitor-write")
+        self._sampling: Dict[str, Future] = {}  # canary name -> its latest sample
+        self._tasks: List[asyncio.Task] = []
+
+    def next_delay(self, interval: float) -> float:
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def start(self) -> None:
+        """Schedule every canary and the pruner on the running loop (idempotent)."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run(canary), name=f"canary-{canary.name}")
+                       for canary in self.canaries]
+        self._tasks.append(asyncio.create_task(self._prune_forever(), name="monitor-prune"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._writer.shutdown(wait=True)
+        if self.baselines.path:
+            self.baselines.save()
+        self.store.close()
+
+    async def _run(self, canary: Canary) -> None:
+        # Start at a random point of the first interval to spread canaries out
+        await asyncio.sleep(random.uniform(0, canary.interval_s))
+        while True:
+            try:
+                await self.check(canary)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # never let one bad sample end the loop
+                log.error(f"Canary {canary.name} could not be recorded: {e!r}")
+            await asyncio.sleep(self.next_delay(canary.interval_s))
+
+    async def _prune_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            deleted = await loop.run_in_executor(self._writer, self.store.prune)
+            if self.baselines.path:
+                await loop.run_in_executor(self._writer, self.baselines.save)
+            if deleted:
+                log.info(f"Pruned {deleted} expired monitoring rows")
+            await asyncio.sleep(self.prune_interval)
+
+    async def check(self, canary: Canary) -> Dict[str, object]:
+        """Sample one canary now, store the result and alert on a failure or an anomaly."""
+        loop = asyncio.get_running_loop()
+        ts = time.time()
+        previous = self._sampling.get(canary.name)
+        if previous is not None and not previous.done():
+            self.skipped += 1
+            log.warning(f"Canary {canary.name} skipped: its previous sample is still running")
+            return {"ts": ts, "latency_s": None, "status": "skipped"}
+        sample = self._sampling[canary.name] = self._executor.submit(
+            sample_and_check, self.baselines, self.db_path, canary.sql, self.threshold, self.stat, self.min_samples)
+        try:
+            latency, is_anomaly, reason = await asyncio.wait_for(asyncio.wrap_future(sample), timeout=self.timeout)
+        except (sqlite3.Error, asyncio.TimeoutError) as e:
+            self.failures += 1
+            latency, is_anomaly, reason = None, True, f"canary failed: {e!r}"
+        self.samples += 1
+
+        alert = None
+        if is_anomaly:
+            alert = {"ts": ts, "series": canary.name, "value": latency, "reason": reason}
+        await loop.run_in_executor(self._writer, self._persist, canary.name, ts, latency, alert)
+        if alert is not None:
+            self.alerts += 1
+            self.recent_alerts.append(alert)
+            log.warning(f"Monitoring alert for {canary.name}: {reason}")
+            if self.on_alert is not None:
+                self.on_alert(alert)
+        self.last[canary.name] = {"ts": ts, "latency_s": latency, "status": "alert" if is_anomaly else reason}
+        return self.last[canary.name]
+
+    def _persist(self, name: str, ts: float, latency: Optional[float], alert: Optional[Dict[str, object]]) -> None:
+        self.store.record(name, ts, latency)
+        if alert is not None:
+            self.store.add_alert(ts, name, latency, alert["reason"])
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "running": bool(self._tasks),
+            "canaries": len(self.canaries),
+            "samples": self.samples,
+            "failures": self.failures,
+            "alerts": self.alerts,
+            "skipped": self.skipped,
+            "store": self.store.stats(),
+        }
@@ -0,0 +1,466 @@
+"""Performance agent: index advisor.
+
+Implements steps 2–3 of the Analyst design ("run EXPLAIN and identify missing
+indexes") against the captured workload:
+
+1. `EXPLAIN QUERY PLAN` each workload query and flag full table scans,
+   temporary B-trees (ORDER BY / GROUP BY / DISTINCT) and automatic indexes.
+2. For the flagged tables, derive candidate single- and multi-column indexes
+   from the columns the query filters, joins, groups and sorts on.
+3. Copy the database to a scratch file (SQLite backup API) and measure every
+   candidate there: plan and median latency of the affected queries before
+   and after `CREATE INDEX`, plus the index's storage cost. Replays go
+   through a `QueryGuard` like agent SQL: a runaway plan is not replayed and
+   each execution runs under the guard's time and step budgets.
+4. Report estimated speedup and cost per index. `apply=True` creates the
+   winning indexes on the live database; it is off by default.
+
+Usage:
+    python -m src.agents.performance --db data/sakila.db --queries queries.sql [--apply]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from src.guard import QueryGuard, QueryRejected
+from src.sqltext import fingerprint_sql, iter_tokens, table_aliases, unquote_identifier
+
+_CLAUSES = {"select", "from", "where", "on", "group", "order", "having", "limit", "join", "set", "values"}
+_EQ_OPS = {"=", "==", "in", "is"}
+_RANGE_OPS = {"<", ">", "<=", ">=", "between", "like", "glob"}
+
+
+# --- Plan inspection ---
+
+def explain_plan(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """The `detail` column of EXPLAIN QUERY PLAN, one string per plan step."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+
+
+def plan_problems(plan: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    """(kind, table) for each costly step: full_scan, temp_btree or auto_index."""
+    problems = []
+    for detail in plan:
+        words = detail.split()
+        if words[:1] == ["SCAN"] and len(words) > 1 and "INDEX" not in words and words[1] != "CONSTANT":
+            problems.append(("full_scan", words[1]))
+        elif detail.startswith("USE TEMP B-TREE"):
+            problems.append(("temp_btree", None))
+        elif "AUTOMATIC" in words and "INDEX" in words:
+            table = words[1] if words[0] in ("SEARCH", "SCAN") and len(words) > 1 else None
+            problems.append(("auto_index", table))
+    return problems
+
+
+# --- Candidate generation ---
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall()]
+
+
+def existing_index_prefixes(conn: sqlite3.Connection, table: str) -> Set[Tuple[str, ...]]:
+    """Column tuples already served by an index (every leading prefix) or the rowid."""
+    prefixes: Set[Tuple[str, ...]] = set()
+    for _, name, *_ in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+        cols = tuple(r[2] for r in conn.execute(f'PRAGMA index_info("{name}")').fetchall())
+        for i in range(1, len(cols) + 1):
+            prefixes.add(cols[:i])
+    for _, name, col_type, _, _, pk in conn.execute(f'PRAGMA table_info("{table}")').fetchall():
+        if pk == 1 and str(col_type).upper() == "INTEGER":
+            prefixes.add((name,))  # rowid alias
+    return prefixes
+
+
+def column_usage(sql: str, schema: Dict[str, List[str]]) -> Dict[str, Dict[str, List[str]]]:
+    """Per table: columns used with equality, range and ordering/grouping.
+
+    A heuristic token scan, not a parser: it resolves `alias.column` and bare
+    column names (when only one referenced table has that column) and notes
+    the operator next to them and the clause they appear in.
+    """
+    tokens = [(kind, unquote_identifier(text) if kind == "quoted_ident" else text) for kind, text in iter_tokens(sql)]
+    texts = [t for _, t in tokens]
+    aliases = table_aliases(sql, schema)
+
+    referenced = sorted(set(aliases.values()))
+    usage = {t: {"eq": [], "range": [], "order": []} for t in referenced}
+    if not referenced:
+        return usage
+    column_owner: Dict[str, List[str]] = {}
+    for table in referenced:
+        for col in schema[table]:
+            column_owner.setdefault(col.lower(), []).append(table)
+
+    def add(table: str, bucket: str, col: str) -> None:
+        if col not in usage[table][bucket]:
+            usage[table][bucket].append(col)
+
+    # Pass 2: column references in context.
+    clause = None
+    i = 0
+    while i < len(tokens):
+        text = texts[i]
+        if text in _CLAUSES:
+            clause = text
+            i += 1
+            continue
+        table = col = None
+        end = i
+        if i + 2 < len(tokens) and texts[i + 1] == "." and text.lower() in aliases:
+            table = aliases[text.lower()]
+            col = next((c for c in schema[table] if c.lower() == texts[i + 2].lower()), None)
+            end = i + 2
+        elif tokens[i][0] in ("word", "quoted_ident") and len(column_owner.get(text.lower(), [])) == 1:
+            if i == 0 or texts[i - 1] != ".":
+                table = column_owner[text.lower()][0]
+                col = next(c for c in schema[table] if c.lower() == text.lower())
+        if table and col:
+            after = texts[end + 1] if end + 1 < len(texts) else ""
+            before = texts[i - 1] if i > 0 else ""
+            if after == "not" and end + 2 < len(texts):
+                after = texts[end + 2]
+            if clause in ("where", "on", "having"):
+                if after in _EQ_OPS or before in ("=", "=="):
+                    add(table, "eq", col)
+                elif after in _RANGE_OPS or before in _RANGE_OPS:
+                    add(table, "range", col)
+            elif clause in ("group", "order"):
+                add(table, "order", col)
+            i = end + 1
+            continue
+        i += 1
+    return usage
+
+
+def candidate_indexes(
+    usage: Dict[str, Dict[str, List[str]]],
+    existing: Dict[str, Set[Tuple[str, ...]]],
+) -> List[Tuple[str, Tuple[str, ...]]]:
+    """Single- and multi-column (table, columns) candidates not already indexed."""
+    out: List[Tuple[str, Tuple[str, ...]]] = []
+    for table, cols in usage.items():
+        eq, rng, order = cols["eq"], cols["range"], cols["order"]
+        options: List[Tuple[str, ...]] = [(c,) for c in eq + rng + order]
+        if len(eq) > 1:
+            options.append(tuple(eq[:3]))
+        if eq and rng:
+            options.append(tuple(eq[:2]) + (rng[0],))
+        if eq and order:
+            options.append(tuple(eq[:2]) + tuple(c for c in order[:2] if c not in eq))
+        if len(order) > 1:
+            options.append(tuple(order[:3]))
+        for columns in options:
+            columns = tuple(dict.fromkeys(columns))
+            if columns in existing.get(table, set()):
+                continue
+            if (table, columns) not in out:
+                out.append((table, columns))
+    return out
+
+
+def index_name(table: str, columns: Sequence[str]) -> str:
+    return f"aegis_idx_{table}_{'_'.join(columns)}"[:120]
+
+
+def create_index_sql(table: str, columns: Sequence[str]) -> str:
+    cols = ", ".join(f'"{c}"' for c in columns)
+    return f'CREATE INDEX IF NOT EXISTS "{index_name(table, columns)}" ON "{table}" ({cols})'
+
+
+# --- Measurement ---
+
+def time_query(conn: sqlite3.Connection, sql: str, repeat: int = 5, guard: Optional[QueryGuard] = None) -> float:
+    """Median wall time (seconds) of executing and fully fetching `sql`.
+
+    With a `guard`, every execution runs under its budgets (QueryRejected
+    when one is spent).
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with guard.budget(conn) if guard else nullcontext():
+            conn.execute(sql).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def index_size_bytes(conn: sqlite3.Connection, name: str, pages_before: int) -> int:
+    """On-disk size of index `name` (dbstat if compiled in, else page-count delta)."""
+    try:
+        row = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (name,)).fetchone()
+        if row and row[0] is not None:
+            return int(row[0])
+    except sqlite3.Error:
+        pass
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return max(0, pages - pages_before) * page_size
+
+
+def scratch_copy(db_path: str, directory: Optional[str] = None) -> str:
+    """Consistent copy of `db_path` via the backup API; caller removes it."""
+    fd, path = tempfile.mkstemp(prefix="aegis-scratch-", suffix=".db", dir=directory)
+    os.close(fd)
+    src = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    dst = sqlite3.connect(path)
+    try:
+        src.backup(dst)
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        src.close()
+        dst.close()
+    return path
+
+
+# --- Advisor ---
+
+class WorkloadQuery:
+    """One workload entry: a concrete statement and how often its shape runs."""
+
+    __slots__ = ("sql", "calls", "fingerprint")
+
+    def __init__(self, sql: str, calls: int = 1):
+        self.sql = sql
+        self.calls = max(1, int(calls))
+        self.fingerprint = fingerprint_sql(sql)
+
+
+def workload_from_recorder(top: Iterable[Dict[str, object]]) -> List[WorkloadQuery]:
+    """Convert `WorkloadRecorder.top()` rows to advisor input.
+
+    Errored-only shapes are skipped, and so is any shape the guard ever
+    stopped: replaying it would only hit the same budget again.
+    """
+    return [
+        WorkloadQuery(str(row["sample_sql"]), int(row["calls"]))
+        for row in top
+        if row.get("sample_sql") and int(row.get("errors", 0)) < int(row["calls"]) and not row.get("rejected")
+    ]
+
+
+class IndexAdvisor:
+    """Find, measure and (optionally) apply missing indexes for a workload.
+
+    `guard` costs each query before it is replayed and bounds every replay
+    (a default `QueryGuard` if not given).
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        repeat: int = 5,
+        min_speedup: float = 1.2,
+        max_candidates: int = 40,
+        guard: Optional[QueryGuard] = None,
+    ):
+        self.db_path = db_path
+        self.repeat = repeat
+        self.min_speedup = min_speedup
+        self.max_candidates = max_candidates
+        self.guard = guard or QueryGuard()
+
+    def analyze(self, workload: Iterable[WorkloadQuery]) -> Dict[str, object]:
+        """Plan, generate and measure candidates on a scratch copy. Never touches the live DB."""
+        queries = self._dedupe(workload)
+        scratch = scratch_copy(self.db_path)
+        try:
+            conn = sqlite3.connect(scratch)
+            try:
+                return self._analyze(conn, queries)
+            finally:
+                conn.close()
+        finally:
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                if os.path.exists(scratch + suffix):
+                    os.unlink(scratch + suffix)
+
+    @staticmethod
+    def _dedupe(workload: Iterable[WorkloadQuery]) -> List[WorkloadQuery]:
+        merged: Dict[str, WorkloadQuery] = {}
+        for q in workload:
+            if q.fingerprint in merged:
+                merged[q.fingerprint].calls += q.calls
+            else:
+                merged[q.fingerprint] = WorkloadQuery(q.sql, q.calls)
+        return list(merged.values())
+
+    def _analyze(self, conn: sqlite3.Connection, queries: List[WorkloadQuery]) -> Dict[str, object]:
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()]
+        schema = {t: table_columns(conn, t) for t in tables}
+        existing = {t: existing_index_prefixes(conn, t) for t in tables}
+
+        findings = []
+        finding_of: Dict[int, Dict[str, object]] = {}
+        statements: Dict[int, str] = {}  # what is replayed: the guard may add a LIMIT
+        candidates: List[Tuple[str, Tuple[str, ...]]] = []
+        affected: Dict[Tuple[str, Tuple[str, ...]], List[int]] = {}
+        for qi, q in enumerate(queries):
+            try:
+                statements[qi] = self.guard.prepare(conn, q.sql)
+                plan = explain_plan(conn, q.sql)
+            except QueryRejected as e:
+                findings.append({"sql": q.sql, "calls": q.calls, "rejected": e.reason, "error": str(e)})
+                continue
+            except sqlite3.Error as e:
+                findings.append({"sql": q.sql, "error": str(e)})
+                continue
+            problems = plan_problems(plan)
+            finding_of[qi] = {"sql": q.sql, "calls": q.calls, "plan": plan,
+                              "problems": [kind + (f":{t}" if t else "") for kind, t in problems]}
+            findings.append(finding_of[qi])
+            if not problems:
+                continue
+            usage = column_usage(q.sql, schema)
+            # Plans name the alias when there is one ("SCAN r"); map back to tables.
+            aliases = table_aliases(q.sql, schema)
+            flagged = {aliases.get(t.lower(), t) for _, t in problems if t}
+            if any(kind == "temp_btree" for kind, _ in problems):
+                flagged |= {t for t, u in usage.items() if u["order"]}
+            usage = {t: u for t, u in usage.items() if t in flagged}
+            for cand in candidate_indexes(usage, existing):
+                if cand not in affected:
+                    candidates.append(cand)
+                    affected[cand] = []
+                affected[cand].append(qi)
+
+        candidates = candidates[: self.max_candidates]
+        baseline_cache: Dict[int, Optional[float]] = {}
+
+        def before(qi: int) -> Optional[float]:
+            """Baseline time, or None once the guard has stopped the query (it is then left out)."""
+            if qi not in baseline_cache:
+                try:
+                    baseline_cache[qi] = time_query(conn, statements[qi], self.repeat, self.guard)
+                except QueryRejected as e:
+                    baseline_cache[qi] = None
+                    finding_of[qi].update(rejected=e.reason, error=str(e))
+            return baseline_cache[qi]
+
+        results = []
+        for table, columns in candidates:
+            before_s = {qi: before(qi) for qi in affected[(table, columns)]}
+            qis = [qi for qi, seconds in before_s.items() if seconds is not None]
+            if not qis:
+                continue
+            pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+            name = index_name(table, columns)
+            build_start = time.perf_counter()
+            conn.execute(create_index_sql(table, columns))
+            conn.commit()
+            build_s = time.perf_counter() - build_start
+            try:
+                size = index_size_bytes(conn, name, pages_before)
+                after_s = {qi: time_query(conn, statements[qi], self.repeat, self.guard) for qi in qis}
+                plans_after = {qi: explain_plan(conn, queries[qi].sql) for qi in qis}
+            except QueryRejected:
+                continue  # slower than the budget with this index: not a candidate worth reporting
+            finally:
+                conn.execute(f'DROP INDEX "{name}"')
+                conn.commit()
+
+            weighted_before = sum(before_s[qi] * queries[qi].calls for qi in qis)
+            weighted_after = sum(after_s[qi] * queries[qi].calls for qi in qis)
+            used = any(name in " ".join(plans_after[qi]) for qi in qis)
+            speedup = weighted_before / weighted_after if weighted_after > 0 else float("inf")
+            results.append({
+                "table": table,
+                "columns": list(columns),
+                "create_sql": create_index_sql(table, columns),
+                "used_by_planner": used,
+                "queries": [queries[qi].fingerprint for qi in qis],
+                "before_ms": round(1000 * weighted_before, 3),
+                "after_ms": round(1000 * weighted_after, 3),
+                "speedup": round(speedup, 2),
+                "saved_ms_per_workload": round(1000 * (weighted_before - weighted_after), 3),
+                "size_bytes": size,
+                "build_ms": round(1000 * build_s, 2),
+                "winner": used and speedup >= self.min_speedup,
+            })
+
+        results.sort(key=lambda r: r["saved_ms_per_workload"], reverse=True)
+        return {"queries": findings, "candidates": results, "winners": self._pick_winners(results)}
+
+    @staticmethod
+    def _pick_winners(results: List[Dict[str, object]]) -> List[Dict[str, object]]:
+        """Winning candidates minus redundant ones.
+
+        An index whose columns are a leading prefix of another winner on the
+        same table is dropped: the wider index serves the same lookups.
+        """
+        winners = [r for r in results if r["winner"]]
+        chosen = []
+        for r in winners:
+            cols = tuple(r["columns"])
+            if any(o is not r and o["table"] == r["table"] and len(o["columns"]) > len(cols)
+                   and tuple(o["columns"][: len(cols)]) == cols for o in winners):
+                continue
+            chosen.append(r)
+        return chosen
+
+    def apply(self, winners: Iterable[Dict[str, object]]) -> List[str]:
+        """Create `winners` on the live database and refresh planner statistics."""
+        statements = [str(w["create_sql"]) for w in winners]
+        if not statements:
+            return []
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        return statements
+
+    def advise(self, workload: Iterable[WorkloadQuery], apply: bool = False) -> Dict[str, object]:
+        report = self.analyze(workload)
+        report["applied"] = self.apply(report["winners"]) if apply else []
+        return report
+
+
+def format_report(report: Dict[str, object]) -> str:
+    lines = []
+    for r in report["candidates"]:
+        mark = "WIN " if r["winner"] else "    "
+        lines.append(
+            f"{mark}{r['create_sql']}\n"
+            f"      {r['before_ms']:.2f}ms -> {r['after_ms']:.2f}ms (x{r['speedup']}), "
+            f"size {r['size_bytes'] / 1024:.1f} KiB, {len(r['queries'])} query shape(s)"
+        )
+    if not lines:
+        lines.append("No missing indexes found for this workload.")
+    for sql in report.get("applied", []):
+        lines.append(f"applied: {sql}")
+    return "\n".join(lines)
+
+
+def _read_queries(path: str) -> List[WorkloadQuery]:
+    with open(path) as f:
+        text = f.read()
+    statements, buf = [], ""
+    for line in text.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip().rstrip(";"))
+            buf = ""
+    if buf.strip():
+        statements.append(buf.strip())
+    return [WorkloadQuery(s) for s in statements if s]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend (and optionally apply) missing indexes.")
+    parser.add_argument("--db", default="data/sakila.db")
+    parser.add_argument("--queries", required=True, help="file of ';'-terminated SQL statements")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=1.2)
+    parser.add_argument("--apply", action="store_true", help="create winning indexes on the live DB")
+    args = parser.parse_args()
+    advisor = IndexAdvisor(args.db, repeat=args.repeat, min_speedup=args.min_speedup)
+    print(format_report(advisor.advise(_read_queries(args.queries), apply=args.apply)))
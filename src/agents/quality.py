@@ -0,0 +1,644 @@
+"""Data Quality agent: duplicate and dangling-reference detector.
+
+Finds three kinds of problems without comparing rows pairwise:
+
+1. Exact duplicates: rows whose compared columns match value for value. Every
+   column is compared except primary keys and `ignore_columns` (by default
+   `last_update`). Each row is reduced to an 8-byte BLAKE2 digest, and rows
+   are grouped by digest.
+2. Near duplicates: rows whose normalized text columns are similar (casefolded,
+   accents and punctuation stripped, e.g. "Mary  Smith" vs "MARY SMYTH").
+   - Each row's text becomes a set of character 3-grams, summarized by a
+     MinHash signature. One-permutation hashing with rotation densification
+     costs one hash per 3-gram, not one per permutation.
+   - Signatures are split into LSH bands. Only rows sharing a band, and the
+     same blocking key (`block_by`, e.g. `store_id`), become candidates.
+   - Candidates are kept when their estimated Jaccard similarity reaches
+     `threshold`.
+3. Dangling foreign keys: each declared foreign key is checked with one
+   `NOT EXISTS` anti-join, so SQLite walks the parent's key index instead
+   of Python holding either side.
+
+Memory is bounded by hash partitioning. A table too large for one task is
+streamed once in `fetchmany` chunks of `chunk_rows`, and each row's records
+are spilled to the partitions that need them: its exact digest to the
+digest's partition, its signature to the partition of each LSH bucket
+(blocking key, band, band key). Partitions are sized so no task holds more
+than `memory_rows` rows, with or without a blocking key. With `workers > 1`
+the partition tasks (and the foreign-key checks) run in a process pool. The
+report gives rows read, seconds and rows/second per table and for the whole
+run.
+
+Usage:
+    python -m src.agents.quality --db data/sakila.db [--tables customer address] [--block customer=store_id] [--workers 4]
+"""
+import argparse
+import hashlib
+import heapq
+import math
+import operator
+import os
+import pickle
+import re
+import sqlite3
+import tempfile
+import time
+import unicodedata
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.schema_digest import row_estimates
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_TEXT_TYPES = ("CHAR", "TEXT", "CLOB")
+_MIX = 0x9E3779B1  # Fibonacci hashing constant: spreads CRC32 values over all 32 bits
+
+
+class TableSpec(NamedTuple):
+    table: str
+    id_columns: Tuple[str, ...]  # rowid, or the primary key of a WITHOUT ROWID table
+    exact_columns: Tuple[str, ...]
+    text_columns: Tuple[str, ...]
+    block_by: Optional[str]
+    rows: int  # estimate, used to size partitions
+
+
+class ForeignKey(NamedTuple):
+    table: str
+    columns: Tuple[str, ...]
+    parent: str
+    parent_columns: Tuple[str, ...]
+
+
+# --- Row reduction ---
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def stream_rows(conn: sqlite3.Connection, sql: str, params: Sequence = (), chunk_rows: int = 5000) -> Iterator[list]:
+    """Chunks of at most `chunk_rows` rows from `sql`, fetched with `fetchmany`."""
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            chunk = cur.fetchmany(chunk_rows)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        cur.close()
+
+
+def _digest(encoded: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "big")
+
+
+def row_digest(values: Sequence) -> int:
+    """8-byte digest of a row's values (stable across processes; type-aware, so 1 != '1')."""
+    return _digest(repr(tuple(values)).encode("utf-8"))
+
+
+def normalize_text(value: object) -> str:
+    """Casefolded text without accents or punctuation, single-spaced; '' for NULL."""
+    if value is None:
+        return ""
+    text = str(value)
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    text = text.casefold()
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """32-bit hashes of the character `size`-grams of `text` (padded, so short values still count)."""
+    padded = f" {text} "
+    if len(padded) <= size:
+        return {zlib.crc32(padded.encode("utf-8"))} if text else set()
+    return {zlib.crc32(padded[i:i + size].encode("utf-8")) for i in range(len(padded) - size + 1)}
+
+
+def minhash(hashes: Iterable[int], num_hashes: int = 32) -> Optional[array]:
+    """One-permutation MinHash signature of a hash set; None if the set is empty.
+
+    Each mixed hash goes to bin `h & (num_hashes - 1)` and the bin keeps the
+    minimum of the remaining bits. Empty bins borrow the next non-empty bin's
+    value plus an offset per step (rotation densification), so two sets agree
+    on a bin with probability ~ their Jaccard similarity.
+    """
+    bits = num_hashes.bit_length() - 1
+    if num_hashes != 1 << bits:
+        raise ValueError("num_hashes must be a power of two")
+    empty = 1 << (32 - bits)
+    sig = [empty] * num_hashes
+    for h in hashes:
+        h = (h * _MIX) & 0xFFFFFFFF
+        b, v = h & (num_hashes - 1), h >> bits
+        if v < sig[b]:
+            sig[b] = v
+    filled = sum(1 for v in sig if v < empty)
+    if not filled:
+        return None
+    if filled < num_hashes:
+        dense = list(sig)
+        for i in range(num_hashes):
+            if sig[i] == empty:
+                step = 1
+                while sig[(i + step) % num_hashes] == empty:
+                    step += 1
+                dense[i] = sig[(i + step) % num_hashes] + step * empty  # stays below 2**32
+        sig = dense
+    return array("I", sig)
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of two signatures: the share of agreeing bins."""
+    return sum(map(operator.eq, a, b)) / len(a)
+
+
+# --- Schema inspection ---
+
+def table_spec(conn: sqlite3.Connection, table: str, block_by: Optional[str] = None,
+               ignore_columns: Iterable[str] = ("last_update",), rows: int = 0) -> TableSpec:
+    """Which columns identify, are compared exactly, and are compared as text for `table`."""
+    info = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    without_rowid = bool(sql and sql[0] and re.search(r"without\s+rowid", sql[0], re.IGNORECASE))
+    pk = tuple(name for _, name, _, _, _, pk in sorted(info, key=lambda r: r[5]) if pk)
+    ignored = {c.lower() for c in ignore_columns}
+    compared = [(name, str(col_type or "").upper()) for _, name, col_type, _, _, is_pk in info
+                if not is_pk and name.lower() not in ignored]
+    if block_by is not None and block_by not in [r[1] for r in info]:
+        raise ValueError(f"{table} has no column {block_by!r} to block by")
+    return TableSpec(
+        table=table,
+        id_columns=pk if without_rowid else ("rowid",),
+        exact_columns=tuple(name for name, _ in compared),
+        text_columns=tuple(name for name, t in compared if any(k in t for k in _TEXT_TYPES) and name != block_by),
+        block_by=block_by,
+        rows=rows,
+    )
+
+
+def foreign_keys(conn: sqlite3.Connection, table: str) -> List[ForeignKey]:
+    """Declared foreign keys of `table`; an omitted parent column list means the parent's primary key."""
+    groups: Dict[int, List[tuple]] = {}
+    for fk_id, seq, parent, column, parent_column, *_ in conn.execute(
+            f"PRAGMA foreign_key_list({_quote(table)})").fetchall():
+        groups.setdefault(fk_id, []).append((seq, parent, column, parent_column))
+    keys = []
+    for rows in groups.values():
+        rows.sort()
+        parent = rows[0][1]
+        parent_columns = tuple(r[3] for r in rows)
+        if any(c is None for c in parent_columns):
+            info = conn.execute(f"PRAGMA table_info({_quote(parent)})").fetchall()
+            parent_columns = tuple(name for _, name, _, _, _, pk in sorted(info, key=lambda r: r[5]) if pk)
+        keys.append(ForeignKey(table, tuple(r[2] for r in rows), parent, parent_columns))
+    return keys
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+# --- Tasks (module-level so a process pool can run them) ---
+
+def fetch_values(conn: sqlite3.Connection, spec: TableSpec, ids: Sequence, columns: Sequence[str]) -> Dict[object, tuple]:
+    """`columns` of the rows with these ids (rowids, or primary-key tuples of a WITHOUT ROWID table)."""
+    if not ids or not columns:
+        return {}
+    selected = ", ".join(_quote(c) for c in columns)
+    if spec.id_columns == ("rowid",):
+        sql = f"SELECT rowid, {selected} FROM {_quote(spec.table)} WHERE rowid IN ({', '.join('?' * len(ids))})"
+        return {r[0]: r[1:] for r in conn.execute(sql, list(ids)).fetchall()}
+    key = " AND ".join(f"{_quote(c)} = ?" for c in spec.id_columns)
+    sql = f"SELECT {selected} FROM {_quote(spec.table)} WHERE {key}"
+    found = {}
+    for row_id in ids:
+        row = conn.execute(sql, list(row_id)).fetchone()
+        if row is not None:
+            found[tuple(row_id)] = row
+    return found
+
+
+def _bucket_partition(block: object, band: int, band_key: tuple, partitions: int) -> int:
+    return zlib.crc32(repr((block, band, band_key)).encode("utf-8")) % partitions
+
+
+def row_records(conn: sqlite3.Connection, spec: TableSpec, chunk_rows: int = 5000,
+                num_hashes: int = 32) -> Iterator[Tuple[int, list]]:
+    """One scan of `spec.table`, as (rows read, records) per chunk.
+
+    A row becomes an exact record `(digest, id)` if it has compared columns,
+    and a near record `(id, digest, block, signature)` if its text is not empty.
+    """
+    n_id = len(spec.id_columns)
+    n_exact = len(spec.exact_columns)
+    columns = list(spec.id_columns) + list(spec.exact_columns) + ([spec.block_by] if spec.block_by else [])
+    sql = f"SELECT {', '.join(_quote(c) if c != 'rowid' else c for c in columns)} FROM {_quote(spec.table)}"
+    text_at = [n_id + spec.exact_columns.index(c) for c in spec.text_columns]
+    for chunk in stream_rows(conn, sql, chunk_rows=chunk_rows):
+        records = []
+        for row in chunk:
+            row_id = row[0] if n_id == 1 else tuple(row[:n_id])
+            digest = _digest(repr(row[n_id:n_id + n_exact]).encode("utf-8"))
+            if n_exact:
+                records.append((digest, row_id))
+            if text_at:
+                text = " ".join(t for t in (normalize_text(row[i]) for i in text_at) if t)
+                sig = minhash(shingles(text), num_hashes) if text else None
+                if sig is not None:
+                    records.append((row_id, digest, row[-1] if spec.block_by else None, sig))
+        yield len(chunk), records
+
+
+def route_table(db_path: str, spec: TableSpec, partitions: int, spill_dir: str, chunk_rows: int = 5000,
+                num_hashes: int = 32, bands: int = 8, flush_rows: int = 5000) -> Dict[str, object]:
+    """Scan `spec.table` once and spill every record to the partition(s) that need it.
+
+    An exact record goes to the partition of its digest. A near record goes to
+    the partition of each of its LSH buckets (blocking key, band, band key),
+    once per distinct partition. Partition `p` is written to
+    `<spill_dir>/<table>.<p>` as pickled batches of at most `flush_rows`.
+    """
+    started = time.perf_counter()
+    width = num_hashes // bands
+    buffers: List[list] = [[] for _ in range(partitions)]
+    paths = [os.path.join(spill_dir, f"{spec.table}.{p}") for p in range(partitions)]
+    files = [open(path, "wb") for path in paths]
+    rows_read = 0
+
+    def flush(p):
+        pickle.dump(buffers[p], files[p], protocol=pickle.HIGHEST_PROTOCOL)
+        buffers[p] = []
+
+    conn = _connect(db_path)
+    try:
+        for rows, records in row_records(conn, spec, chunk_rows, num_hashes):
+            rows_read += rows
+            for record in records:
+                if len(record) == 2:
+                    targets = {record[0] % partitions}
+                else:
+                    _, _, block, sig = record
+                    targets = {_bucket_partition(block, band, tuple(sig[band * width:(band + 1) * width]), partitions)
+                               for band in range(bands)}
+                for p in targets:
+                    buffers[p].append(record)
+                    if len(buffers[p]) >= flush_rows:
+                        flush(p)
+        for p in range(partitions):
+            if buffers[p]:
+                flush(p)
+    finally:
+        conn.close()
+        for f in files:
+            f.close()
+    return {"table": spec.table, "paths": paths, "rows_read": rows_read, "seconds": time.perf_counter() - started}
+
+
+def read_spill(path: str) -> Iterator[list]:
+    """The record batches `route_table` wrote to `path`."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def scan_partition(spec: TableSpec, batches: Iterable[list], partition: int = 0, partitions: int = 1,
+                   num_hashes: int = 32, bands: int = 8, threshold: float = 0.7, max_bucket: int = 50,
+                   max_examples: int = 10, path: Optional[str] = None) -> Dict[str, object]:
+    """Exact and near duplicates among the records of one partition.
+
+    `batches` yields record lists (see `row_records`); a process pool passes
+    a spill file `path` instead. Near records are compared only in the bands
+    whose bucket belongs to this partition. Records are streamed; the task
+    holds one entry per distinct exact digest and the signatures of at most
+    `max_bucket` rows per bucket, reported as `kept`.
+    """
+    started = time.perf_counter()
+    if path is not None:
+        batches = read_spill(path)
+    width = num_hashes // bands
+    first_seen: Dict[int, object] = {}  # digest -> id of its first row
+    groups: Dict[int, list] = {}  # digest -> [duplicate rows, first ids], for digests seen more than once
+    buckets: Dict[tuple, List[tuple]] = {}  # (block, band, band key) -> [(id, digest, signature)]
+    pairs = 0
+    best: List[Tuple[float, object, object]] = []  # top `max_examples` pairs by similarity
+    oversized = 0
+    members_held = 0
+
+    for records in batches:
+        for record in records:
+            if len(record) == 2:
+                digest, row_id = record
+                first = first_seen.setdefault(digest, row_id)
+                if first != row_id:
+                    group = groups.get(digest)
+                    if group is None:
+                        group = groups[digest] = [0, [first]]
+                    group[0] += 1
+                    if len(group[1]) < max_examples:
+                        group[1].append(row_id)
+                continue
+            row_id, digest, block, sig = record
+            stored = False  # a record's signature is held once, however many of its buckets keep it
+            for band in range(bands):
+                band_key = tuple(sig[band * width:(band + 1) * width])
+                if partitions > 1 and _bucket_partition(block, band, band_key, partitions) != partition:
+                    continue
+                members = buckets.setdefault((block, band, band_key), [])
+                if any(d == digest for _, d, _ in members):
+                    continue  # an exact copy of a member: reported as an exact duplicate instead
+                for other, _, other_sig in members:
+                    # Count each pair once: in the first band the two signatures share
+                    if any(other_sig[b * width:(b + 1) * width] == sig[b * width:(b + 1) * width]
+                           for b in range(band)):
+                        continue
+                    score = similarity(sig, other_sig)
+                    if score >= threshold:
+                        pairs += 1
+                        if len(best) < max_examples:
+                            heapq.heappush(best, (score, other, row_id))
+                        elif score > best[0][0]:
+                            heapq.heapreplace(best, (score, other, row_id))
+                if len(members) < max_bucket:
+                    members.append((row_id, digest, sig))
+                    stored = True
+                    if len(members) == max_bucket:
+                        oversized += 1  # full: later rows are compared with these members only
+            members_held += stored
+
+    exact_examples = sorted(groups.values(), key=lambda g: -g[0])[:max_examples]
+    return {
+        "table": spec.table,
+        "partition": partition,
+        "kept": len(first_seen) + members_held,
+        "seconds": time.perf_counter() - started,
+        "exact": {
+            "groups": len(groups),
+            "duplicate_rows": sum(rows for rows, _ in groups.values()),
+            "examples": [{"ids": ids, "rows": rows + 1} for rows, ids in exact_examples],
+        },
+        "near": {
+            "pairs": pairs,
+            "oversized_buckets": oversized,
+            "examples": [{"ids": [a, b], "similarity": round(score, 3)}
+                         for score, a, b in sorted(best, key=lambda e: -e[0])],
+        },
+    }
+
+
+def check_foreign_key(db_path: str, fk: ForeignKey, chunk_rows: int = 5000, max_examples: int = 10) -> Dict[str, object]:
+    """Child rows whose non-NULL key has no parent row, found with one NOT EXISTS anti-join."""
+    started = time.perf_counter()
+    report = {"table": fk.table, "columns": list(fk.columns), "parent": fk.parent,
+              "parent_columns": list(fk.parent_columns), "dangling": 0, "examples": []}
+    keys = ", ".join(f"c.{_quote(c)}" for c in fk.columns)
+    not_null = " AND ".join(f"c.{_quote(c)} IS NOT NULL" for c in fk.columns)
+    match = " AND ".join(f"p.{_quote(pc)} = c.{_quote(c)}" for c, pc in zip(fk.columns, fk.parent_columns))
+    sql = (f"SELECT c.rowid, {keys} FROM {_quote(fk.table)} AS c WHERE {not_null} "
+           f"AND NOT EXISTS (SELECT 1 FROM {_quote(fk.parent)} AS p WHERE {match})")
+    conn = _connect(db_path)
+    try:
+        for chunk in stream_rows(conn, sql, chunk_rows=chunk_rows):
+            report["dangling"] += len(chunk)
+            for row in chunk[:max_examples - len(report["examples"])]:
+                report["examples"].append({"id": row[0], "values": list(row[1:])})
+    except sqlite3.Error as e:  # e.g. the parent table does not exist
+        report["error"] = str(e)
+    finally:
+        conn.close()
+    report["seconds"] = round(time.perf_counter() - started, 4)
+    return report
+
+
+# --- Detector ---
+
+class QualityDetector:
+    """Scan tables for exact duplicates, near duplicates and dangling foreign keys.
+
+    `memory_rows` caps the records one partition task holds, and so sizes the
+    partition count. A table that needs more than one partition is scanned
+    once and its records are spilled to per-partition temporary files.
+    `workers > 1` runs the tasks in that many processes; tables of at least
+    `min_parallel_rows` rows are split at least that many ways.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        chunk_rows: int = 5000,
+        memory_rows: int = 250_000,
+        workers: int = 1,
+        num_hashes: int = 32,
+        bands: int = 8,
+        threshold: float = 0.7,
+        max_bucket: int = 50,
+        max_examples: int = 10,
+        ignore_columns: Sequence[str] = ("last_update",),
+        min_parallel_rows: int = 100_000,
+    ):
+        if num_hashes % bands:
+            raise ValueError("bands must divide num_hashes")
+        self.db_path = db_path
+        self.chunk_rows = chunk_rows
+        self.memory_rows = memory_rows
+        self.workers = workers
+        self.num_hashes = num_hashes
+        self.bands = bands
+        self.threshold = threshold
+        self.max_bucket = max_bucket
+        self.max_examples = max_examples
+        self.ignore_columns = tuple(ignore_columns)
+        self.min_parallel_rows = min_parallel_rows
+
+    def partition_load(self, spec: TableSpec, partitions: int) -> float:
+        """Expected records per partition: exact records split evenly, near ones once per distinct band partition."""
+        exact = spec.rows if spec.exact_columns else 0
+        near = spec.rows if spec.text_columns else 0
+        return exact / partitions + near * (1 - (1 - 1 / partitions) ** self.bands)
+
+    def partitions_for(self, spec: TableSpec) -> int:
+        """Enough partitions to keep each under `memory_rows` (with headroom for uneven hashing);
+        at least one per worker for large tables."""
+        partitions = self.workers if spec.rows >= self.min_parallel_rows else 1
+        if self.memory_rows:
+            while self.partition_load(spec, partitions) > 0.7 * self.memory_rows:
+                partitions = max(partitions + 1, int(partitions * 1.1))
+        return max(1, partitions)
+
+    def plan(self, tables: Optional[Sequence[str]] = None,
+             block_by: Optional[Dict[str, str]] = None) -> Tuple[List[TableSpec], List[ForeignKey]]:
+        block_by = block_by or {}
+        conn = _connect(self.db_path)
+        try:
+            estimates = row_estimates(conn)
+            names = list(tables) if tables else list(estimates)
+            missing = [t for t in names if t not in estimates]
+            if missing:
+                raise ValueError(f"unknown table(s): {', '.join(missing)}")
+            specs = [table_spec(conn, t, block_by.get(t), self.ignore_columns, estimates[t]) for t in names]
+            fks = [fk for t in names for fk in foreign_keys(conn, t)]
+        finally:
+            conn.close()
+        return specs, fks
+
+    def _scan_in_memory(self, spec: TableSpec, scan_args: dict) -> Tuple[Dict[str, object], Dict[str, object]]:
+        """One partition: scan the table and find duplicates in the same pass, without spilling."""
+        started = time.perf_counter()
+        read = {"rows_read": 0}
+        conn = _connect(self.db_path)
+        try:
+            def batches():
+                for rows, records in row_records(conn, spec, self.chunk_rows, self.num_hashes):
+                    read["rows_read"] += rows
+                    yield records
+            partial = scan_partition(spec, batches(), **scan_args)
+        finally:
+            conn.close()
+        return {"table": spec.table, "rows_read": read["rows_read"], "seconds": 0.0}, {
+            **partial, "seconds": time.perf_counter() - started}
+
+    def analyze(self, tables: Optional[Sequence[str]] = None,
+                block_by: Optional[Dict[str, str]] = None) -> Dict[str, object]:
+        """Run every check on `tables` (default: all) and return the merged report."""
+        started = time.perf_counter()
+        specs, fks = self.plan(tables, block_by)
+        scan_args = {"num_hashes": self.num_hashes, "bands": self.bands, "threshold": self.threshold,
+                     "max_bucket": self.max_bucket, "max_examples": self.max_examples}
+        sizes = {spec.table: self.partitions_for(spec) for spec in specs}
+        small = [spec for spec in specs if sizes[spec.table] == 1]
+        large = [spec for spec in specs if sizes[spec.table] > 1]
+        routes: List[Dict[str, object]] = []
+        partials: List[Dict[str, object]] = []
+        for spec in small:
+            route, partial = self._scan_in_memory(spec, scan_args)
+            routes.append(route)
+            partials.append(partial)
+
+        with tempfile.TemporaryDirectory(prefix="aegis-quality-") as spill_dir:
+            def route_args(spec):
+                n = sizes[spec.table]
+                return (self.db_path, spec, n, spill_dir, self.chunk_rows, self.num_hashes, self.bands,
+                        max(100, min(self.chunk_rows, self.memory_rows // n if self.memory_rows else self.chunk_rows)))
+
+            def scan_jobs(spec, route):
+                n = sizes[spec.table]
+                return [dict(spec=spec, batches=(), partition=p, partitions=n, path=path, **scan_args)
+                        for p, path in enumerate(route["paths"])]
+
+            if self.workers > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    fk_futures = [pool.submit(check_foreign_key, self.db_path, fk, self.chunk_rows, self.max_examples)
+                                  for fk in fks]
+                    large_routes = [f.result() for f in [pool.submit(route_table, *route_args(spec))
+                                                         for spec in large]]
+                    jobs = [job for spec, route in zip(large, large_routes) for job in scan_jobs(spec, route)]
+                    partials += [f.result() for f in [pool.submit(scan_partition, **job) for job in jobs]]
+                    fk_reports = [f.result() for f in fk_futures]
+            else:
+                large_routes = [route_table(*route_args(spec)) for spec in large]
+                jobs = [job for spec, route in zip(large, large_routes) for job in scan_jobs(spec, route)]
+                partials += [scan_partition(**job) for job in jobs]
+                fk_reports = [check_foreign_key(self.db_path, fk, self.chunk_rows, self.max_examples) for fk in fks]
+            routes += large_routes
+
+        conn = _connect(self.db_path)
+        try:
+            table_reports = [self._merge(conn, spec, next(r for r in routes if r["table"] == spec.table),
+                                         [r for r in partials if r["table"] == spec.table]) for spec in specs]
+        finally:
+            conn.close()
+        seconds = time.perf_counter() - started
+        rows = sum(t["rows"] for t in table_reports)
+        return {
+            "tables": table_reports,
+            "foreign_keys": fk_reports,
+            "workers": self.workers,
+            "rows": rows,
+            "rows_read": sum(t["rows_read"] for t in table_reports),
+            "seconds": round(seconds, 4),
+            "rows_per_s": round(rows / seconds, 1) if seconds > 0 else None,
+        }
+
+    def _merge(self, conn: sqlite3.Connection, spec: TableSpec, route: Dict[str, object],
+               partials: List[Dict[str, object]]) -> Dict[str, object]:
+        exact_examples = sorted((e for r in partials for e in r["exact"]["examples"]),
+                                key=lambda e: -e["rows"])[: self.max_examples]
+        values = fetch_values(conn, spec, [e["ids"][0] for e in exact_examples], spec.exact_columns)
+        for e in exact_examples:
+            e["values"] = dict(zip(spec.exact_columns, values.get(e["ids"][0], ())))
+        near_examples = sorted((e for r in partials for e in r["near"]["examples"]),
+                               key=lambda e: -e["similarity"])[: self.max_examples]
+        texts = fetch_values(conn, spec, sorted({i for e in near_examples for i in e["ids"]}, key=repr),
+                             spec.text_columns)
+        for e in near_examples:
+            e["values"] = [" | ".join("" if v is None else str(v) for v in texts.get(i, ())) for i in e["ids"]]
+        busy = route["seconds"] + sum(r["seconds"] for r in partials)
+        return {
+            "table": spec.table,
+            "rows": route["rows_read"],
+            "partitions": len(partials),
+            "rows_read": route["rows_read"],
+            "max_partition_rows": max((r["kept"] for r in partials), default=0),
+            "exact": {
+                "columns": list(spec.exact_columns),
+                "groups": sum(r["exact"]["groups"] for r in partials),
+                "duplicate_rows": sum(r["exact"]["duplicate_rows"] for r in partials),
+                "examples": exact_examples,
+            },
+            "near": {
+                "columns": list(spec.text_columns),
+                "block_by": spec.block_by,
+                "pairs": sum(r["near"]["pairs"] for r in partials),
+                "oversized_buckets": sum(r["near"]["oversized_buckets"] for r in partials),
+                "examples": near_examples,
+            },
+            "task_seconds": round(busy, 4),
+            "rows_per_s": round(route["rows_read"] / busy, 1) if busy > 0 else None,
+        }
+
+
+def format_report(report: Dict[str, object]) -> str:
+    lines = []
+    for t in report["tables"]:
+        lines.append(
+            f"{t['table']}: {t['rows']:,} rows, {t['exact']['duplicate_rows']} exact duplicate(s) in "
+            f"{t['exact']['groups']} group(s), {t['near']['pairs']} near-duplicate pair(s) "
+            f"[{t['partitions']} partition(s), {t['rows_per_s'] or 0:,.0f} rows/s per task]"
+        )
+        for e in t["exact"]["examples"][:3]:
+            lines.append(f"    exact {e['ids']}")
+        for e in t["near"]["examples"][:3]:
+            lines.append(f"    near  {e['ids']} ~{e['similarity']}: {e.get('values')}")
+    for fk in report["foreign_keys"]:
+        target = f"{fk['table']}({', '.join(fk['columns'])}) -> {fk['parent']}({', '.join(fk['parent_columns'])})"
+        status = fk.get("error") or f"{fk['dangling']} dangling"
+        lines.append(f"{target}: {status}")
+    lines.append(f"{report['rows']:,} rows in {report['seconds']:.2f}s ({report['rows_per_s'] or 0:,.0f} rows/s, "
+                 f"{report['workers']} worker(s))")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find duplicate rows and dangling foreign keys.")
+    parser.add_argument("--db", default="data/sakila.db")
+    parser.add_argument("--tables", nargs="*", help="tables to scan (default: all)")
+    parser.add_argument("--block", action="append", default=[], metavar="TABLE=COLUMN",
+                        help="blocking column for near duplicates (repeatable)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-rows", type=int, default=5000)
+    parser.add_argument("--memory-rows", type=int, default=250_000)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    args = parser.parse_args()
+    detector = QualityDetector(args.db, chunk_rows=args.chunk_rows, memory_rows=args.memory_rows,
+                               workers=args.workers, threshold=args.threshold)
+    blocks = dict(item.split("=", 1) for item in args.block)
+    print(format_report(detector.analyze(args.tables, blocks)))
@@ -0,0 +1,244 @@
+"""Workload capture for the Analyst and Performance agents.
+
+`WorkloadRecorder` sits around every SQL statement the system executes. Each
+statement is reduced to a literal-free fingerprint (`fingerprint_sql`) and
+aggregated per fingerprint: call count, total/mean/max time, rows returned,
+errors and how many of those the query guard stopped. The most recent executions are also kept in a fixed-size ring and
+appended to a JSON-lines log by a background flusher.
+
+The hot path is one cached fingerprint lookup, a dict update and a deque
+append under a lock; all file I/O happens on the flusher thread.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from src.sqltext import fingerprint_id, fingerprint_sql
+
+
+class FingerprintStats:
+    """Aggregate for one query shape."""
+
+    __slots__ = ("fingerprint", "sample_sql", "calls", "total_time", "max_time", "rows", "errors", "rejected", "last_seen")
+
+    def __init__(self, fingerprint: str, sample_sql: str):
+        self.fingerprint = fingerprint
+        self.sample_sql = sample_sql  # one concrete statement, e.g. for EXPLAIN
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.rejected = 0  # stopped by the query guard
+        self.last_seen = 0.0
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "fingerprint": self.fingerprint,
+            "sample_sql": self.sample_sql,
+            "calls": self.calls,
+            "total_time_s": self.total_time,
+            "mean_time_s": self.total_time / self.calls if self.calls else 0.0,
+            "max_time_s": self.max_time,
+            "rows": self.rows,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "last_seen": self.last_seen,
+        }
+
+
+class WorkloadRecorder:
+    """Fingerprinted, aggregated record of executed SQL.
+
+    - `ring_size`: how many individual executions to keep in memory.
+    - `max_fingerprints`: cap on distinct aggregates; when full, the cheapest
+      tenth (least total time) is dropped in one pass to make room, so the
+      scan is paid once per `max_fingerprints // 10` new shapes.
+    - `log_path`: JSON-lines log, appended every `flush_interval` seconds by
+      `start()`'s background thread and rotated at `max_log_bytes`.
+    - `max_pending`: cap on executions waiting for the log (default
+      `ring_size`). If nothing flushes, the oldest are dropped and counted.
+      A failed flush puts its entries back, under the same cap.
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[str] = None,
+        ring_size: int = 10000,
+        max_fingerprints: int = 5000,
+        flush_interval: float = 10.0,
+        max_log_bytes: int = 64 * 1024 * 1024,
+        max_pending: Optional[int] = None,
+    ):
+        self.log_path = log_path
+        self.max_fingerprints = max_fingerprints
+        self.flush_interval = flush_interval
+        self.max_log_bytes = max_log_bytes
+        self._aggregates: Dict[str, FingerprintStats] = {}
+        self._ring: deque = deque(maxlen=ring_size)
+        self._pending: deque = deque()
+        self.max_pending = ring_size if max_pending is None else max_pending
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.recorded = 0
+        self.dropped_fingerprints = 0
+        self.dropped_pending = 0
+        self.flushed = 0
+
+    # --- hot path ---
+
+    def record(self, sql: str, elapsed: float, rows: int = 0, source: str = "agent", error: Optional[str] = None) -> str:
+        """Account one execution of `sql`; returns its fingerprint id."""
+        fingerprint = fingerprint_sql(sql)
+        key = fingerprint_id(fingerprint)
+        now = time.time()
+        entry = (now, key, elapsed, rows, source, error)
+        with self._lock:
+            agg = self._aggregates.get(key)
+            if agg is None:
+                if len(self._aggregates) >= self.max_fingerprints:
+                    self._drop_cheapest_locked()
+                agg = FingerprintStats(fingerprint, sql)
+                self._aggregates[key] = agg
+            agg.calls += 1
+            agg.total_time += elapsed
+            if elapsed > agg.max_time:
+                agg.max_time = elapsed
+            agg.rows += rows
+            agg.last_seen = now
+            if error:
+                agg.errors += 1
+                if error == "QueryRejected":
+                    agg.rejected += 1
+            self._ring.append(entry)
+            if self.log_path:
+                if len(self._pending) >= self.max_pending:
+                    self._pending.popleft()
+                    self.dropped_pending += 1
+                self._pending.append(entry)
+            self.recorded += 1
+        return key
+
+    @contextmanager
+    def timed(self, sql: str, source: str = "agent"):
+        """Time the block as one execution of `sql`. Set `.rows` on the yielded dict."""
+        box = {"rows": 0}
+        start = time.perf_counter()
+        error = None
+        try:
+            yield box
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(sql, time.perf_counter() - start, box["rows"], source, error)
+
+    def _drop_cheapest_locked(self) -> None:
+        count = max(1, self.max_fingerprints // 10)
+        for key in heapq.nsmallest(count, self._aggregates, key=lambda k: self._aggregates[k].total_time):
+            del self._aggregates[key]
+        self.dropped_fingerprints += count
+
+    # --- reading ---
+
+    def top(self, n: int = 20, by: str = "total_time_s") -> List[Dict[str, object]]:
+        """The `n` most expensive fingerprints (by total time unless `by` says otherwise)."""
+        with self._lock:
+            rows = [dict(agg.to_dict(), id=key) for key, agg in self._aggregates.items()]
+        rows.sort(key=lambda r: r[by], reverse=True)
+        return rows[:n]
+
+    def recent(self, n: int = 100) -> List[Dict[str, object]]:
+        with self._lock:
+            entries = list(self._ring)[-n:]
+        return [self._entry_dict(e) for e in entries]
+
+    def _entry_dict(self, entry: tuple) -> Dict[str, object]:
+        ts, key, elapsed, rows, source, error = entry
+        agg = self._aggregates.get(key)
+        return {
+            "ts": ts,
+            "id": key,
+            "fingerprint": agg.fingerprint if agg else None,
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "rows": rows,
+            "source": source,
+            "error": error,
+        }
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "recorded": self.recorded,
+            "fingerprints": len(self._aggregates),
+            "ring": len(self._ring),
+            "pending_flush": len(self._pending),
+            "flushed": self.flushed,
+            "dropped_pending": self.dropped_pending,
+            "dropped_fingerprints": self.dropped_fingerprints,
+            "log_path": self.log_path,
+        }
+
+    # --- persistence ---
+
+    def flush(self) -> int:
+        """Append pending executions to the log; returns how many were written."""
+        if not self.log_path:
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, deque()
+            lines = [json.dumps(self._entry_dict(e), separators=(",", ":")) for e in pending]
+        if not lines:
+            return 0
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            try:
+                if os.path.getsize(self.log_path) > self.max_log_bytes:
+                    os.replace(self.log_path, self.log_path + ".1")
+            except OSError:
+                pass
+            with open(self.log_path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            self._restore_pending(pending)
+            raise
+        self.flushed += len(lines)
+        return len(lines)
+
+    def _restore_pending(self, entries: deque) -> None:
+        """Put unwritten `entries` back ahead of newer ones, keeping the newest `max_pending`."""
+        with self._lock:
+            entries.extend(self._pending)
+            overflow = max(0, len(entries) - self.max_pending)
+            for _ in range(overflow):
+                entries.popleft()
+            self.dropped_pending += overflow
+            self._pending = entries
+
+    def start(self) -> None:
+        """Start the background flusher (no-op without a log path)."""
+        if not self.log_path or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="aegis-workload-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flusher and write whatever is still pending."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Warning: workload log flush failed: {e}")
@@ -0,0 +1,75 @@
+"""Helpers for `POST /chat/batch`.
+
+Report jobs send hundreds of questions at once, often with repeats that
+differ only in filler words or punctuation. `dedupe_questions` groups them so
+each distinct question is answered once. `run_concurrently` then answers the
+groups with bounded parallelism and yields each result as soon as it is
+ready, so a slow question never holds back the ones behind it.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.cache import normalize_question
+
+# Words that never change what is being asked: articles and politeness.
+# Question words and verbs ("what", "which", "is", "list") are content:
+# "which customers are active" and "are customers active" differ.
+FILLER_WORDS = frozenset({"a", "an", "the", "please", "kindly"})
+# Request openers, dropped only at the start of a question
+FILLER_OPENERS = (("show", "me"), ("show", "us"), ("tell", "me"), ("tell", "us"), ("give", "me"),
+                  ("can", "you"), ("could", "you"), ("would", "you"))
+
+
+def question_key(question: str) -> Tuple[str, ...]:
+    """Near-duplicate key: normalized words in order, minus filler words and leading openers.
+
+    "Show me the top 5 actors" and "top 5 actors please" share a key;
+    "top 5 actors" and "top 6 actors" do not, nor do reorderings.
+    """
+    words = normalize_question(question).split()
+    key = [w for w in words if w not in FILLER_WORDS]
+    while tuple(key[:2]) in FILLER_OPENERS:
+        del key[:2]
+    return tuple(key) or tuple(words)
+
+
+def dedupe_questions(questions: List[str]) -> List[Tuple[int, List[int]]]:
+    """Group near-identical questions: [(representative index, all indexes in the group)], in first-seen order."""
+    groups: Dict[Tuple[str, ...], Tuple[int, List[int]]] = {}
+    for i, question in enumerate(questions):
+        group = groups.setdefault(question_key(question), (i, []))
+        group[1].append(i)
+    return list(groups.values())
+
+
+async def run_concurrently(
+    jobs: List[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    parallelism: int,
+) -> AsyncIterator[Tuple[Any, Any, Optional[BaseException], float]]:
+    """Run `worker(job)` for every job, at most `parallelism` at a time.
+
+    Yields (job, result, error, elapsed seconds) in completion order. Closing
+    the iterator early (e.g. the client went away) cancels what is left.
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+
+    async def run(job):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                return job, await worker(job), None, time.perf_counter() - started
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return job, None, e, time.perf_counter() - started
+
+    tasks = [asyncio.ensure_future(run(job)) for job in jobs]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
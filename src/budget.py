@@ -0,0 +1,143 @@
+"""Per-run budgets and tool-call memoization for the agent loop.
+
+Without a cap, the agent/tools loop runs for as long as the model keeps asking
+for tools. A `RunBudget` is created for every graph run and bounds it three
+ways: graph steps (agent and tools node executions), model calls, and wall-
+clock seconds. `call_model` checks `limit_ahead()` before each model call;
+when another tools round would not fit, that call is the last one. It is made
+without tools, so the model answers from what it has. If even that answer is
+empty, `best_effort_answer` reports the last tool result instead.
+
+The budget also memoizes tool calls: an identical `(tool name, args)` call in
+the same run gets the earlier result instead of running again. That includes
+a duplicate issued while the first call is still running. Timeouts are not
+memoized, since a retry may succeed.
+
+A budget belongs to one run on the event loop, so it needs no lock.
+"""
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+
+WRAP_UP_PROMPT = (
+    "This run has reached its step budget. Do not call any more tools: answer the "
+    "question now from the results you already have, and say if the answer is incomplete."
+)
+
+
+def memo_key(tool_name: str, args) -> str:
+    """Canonical key of one tool call (argument order does not matter)."""
+    return f"{tool_name}:{json.dumps(args, sort_keys=True, default=str)}"
+
+
+def best_effort_answer(messages: List[BaseMessage], reason: str, max_chars: int = 2000) -> str:
+    """A model-free answer for a run that ran out of budget: the last successful tool result, if any."""
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+    for message in reversed(messages[last_human + 1:]):
+        if isinstance(message, ToolMessage) and not str(message.content).startswith("Error"):
+            content = str(message.content)
+            if len(content) > max_chars:
+                content = content[:max_chars] + "\n... (truncated)"
+            return (f"I stopped before finishing ({reason} budget reached). "
+                    f"The last result I got from the database was:\n{content}")
+    return f"I could not answer within this run's {reason} budget. Try a narrower question."
+
+
+class RunBudget:
+    """Step, model-call and time limits of one graph run, plus its counters and tool memo.
+
+    - `max_steps`: graph node executions (one agent or tools step each).
+    - `max_llm_calls`: model calls, including re-asks on the top tier.
+    - `max_seconds`: wall-clock time since the run started.
+    - `memoize`: answer identical tool calls from the run's memo.
+
+    A limit of 0 disables it.
+    """
+
+    def __init__(self, max_steps: int = 24, max_llm_calls: int = 10, max_seconds: float = 120.0,
+                 memoize: bool = True):
+        self.max_steps = max_steps
+        self.max_llm_calls = max_llm_calls
+        self.max_seconds = max_seconds
+        self.memoize = memoize
+        self.started = time.perf_counter()
+        self.steps = 0
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.memo_hits = 0
+        self.exhausted: Optional[str] = None  # which limit ended the run early
+        self._memo: Dict[str, asyncio.Future] = {}
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def recursion_limit(self) -> int:
+        """A LangGraph recursion limit that never fires before `max_steps` does."""
+        return (self.max_steps or 1000) + 2
+
+    def limit_ahead(self) -> Optional[str]:
+        """None if another tools round fits, else the limit it would break.
+
+        Called before a model call. The round needs this call and one more,
+        plus a tools step and an agent step.
+        """
+        if self.max_llm_calls and self.llm_calls + 2 > self.max_llm_calls:
+            return "llm_calls"
+        if self.max_steps and self.steps + 2 > self.max_steps:
+            return "steps"
+        if self.max_seconds and self.elapsed >= self.max_seconds:
+            return "time"
+        return None
+
+    def can_continue(self) -> bool:
+        """True if another tools round fits (see `limit_ahead`)."""
+        return self.limit_ahead() is None
+
+    def allows_llm_call(self) -> bool:
+        return not self.max_llm_calls or self.llm_calls < self.max_llm_calls
+
+    async def memoized(self, key: str, run: Callable[[], Awaitable[str]],
+                       keep: Callable[[str], bool] = lambda result: True) -> Tuple[str, bool]:
+        """(result, hit): `run()`'s result, shared by every call with the same `key` in this run.
+
+        Results for which `keep` is false are returned but not memoized.
+        """
+        self.tool_calls += 1
+        if not self.memoize:
+            return await run(), False
+        future = self._memo.get(key)
+        if future is not None:
+            self.memo_hits += 1
+            return await asyncio.shield(future), True
+        future = asyncio.get_running_loop().create_future()
+        self._memo[key] = future
+        try:
+            result = await run()
+        except asyncio.CancelledError:
+            del self._memo[key]
+            future.cancel()
+            raise
+        except Exception as e:
+            del self._memo[key]
+            future.set_exception(e)
+            future.exception()  # mark retrieved: there may be no duplicate waiting
+            raise
+        if not keep(result):
+            del self._memo[key]
+        future.set_result(result)
+        return result, False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "steps": self.steps,
+            "llm_calls": self.llm_calls,
+            "tool_calls": self.tool_calls,
+            "memo_hits": self.memo_hits,
+            "elapsed_s": round(self.elapsed, 4),
+            "exhausted": self.exhausted,
+        }
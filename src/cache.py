@@ -0,0 +1,261 @@
+"""Caches in front of the Interaction Agent.
+
+`AnswerCache` stores final `/chat` answers keyed by a normalized form of the
+question; `QueryResultCache` stores `sql_db_query` results keyed by
+canonicalized SQL and bounded by total bytes. Both are tied to the database
+version they were computed against, so any write to the SQLite file
+invalidates stale entries without an explicit purge.
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# --- Database version ---
+
+def database_version(db_path: str) -> Tuple[int, ...]:
+    """Cheap change token for a SQLite file.
+
+    Combines the header's file change counter (bumped by every commit in
+    rollback-journal mode) with (mtime_ns, size) of the main file and its WAL,
+    so the token changes even when the writer is another process. Missing
+    files count as zeros.
+    """
+    token = []
+    try:
+        with open(db_path, "rb") as f:
+            f.seek(24)
+            token.append(int.from_bytes(f.read(4), "big"))
+    except OSError:
+        token.append(0)
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            token.extend((st.st_mtime_ns, st.st_size))
+        except OSError:
+            token.extend((0, 0))
+    return tuple(token)
+
+
+# --- Question normalization ---
+
+_NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17,
+    "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40,
+    "fifty": 50, "hundred": 100,
+}
+_NUMBER_RE = re.compile(r"(?<![\w.])(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?![\w])")
+_PUNCT_RE = re.compile(r"[^\w\s.]|(?<!\d)\.|\.(?!\d)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _canonical_number(match: "re.Match") -> str:
+    text = match.group(0).replace(",", "")
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return str(int(text)) if text.isdigit() else text
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, punctuation, whitespace and number spellings.
+
+    "Top 10 actors?", "  top TEN actors " and "top 010 actors!" all map to
+    "top 10 actors". Different literals stay different on purpose: they are
+    different questions.
+    """
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = _NUMBER_RE.sub(_canonical_number, text)
+    text = _PUNCT_RE.sub(" ", text)
+    words = [str(_NUMBER_WORDS.get(w, w)) for w in _SPACE_RE.split(text) if w]
+    return " ".join(words)
+
+
+# --- Answer cache ---
+
+class AnswerCache:
+    """Size-bounded LRU with TTL whose entries are tied to a database version.
+
+    `get`/`put` take the current `version` token (see `database_version`). When
+    the token changes every entry is dropped at once; entries older than
+    `ttl` seconds expire individually. `max_entries <= 0` disables the cache.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[str, float]]" = OrderedDict()
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            answer, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key: Hashable, answer: str, version: Hashable) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (answer, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# --- Query result cache ---
+
+class QueryResultCache:
+    """LRU of SQL results bounded by the total size of the cached results.
+
+    Keys are canonicalized SQL (see `src.sqltext.canonicalize_sql`). Results
+    larger than `max_entry_bytes` are not cached at all, so one huge scan
+    cannot flush everything else. A changed `version` token, or `invalidate()`
+    after a write statement, drops every entry.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self._entries: "OrderedDict[Hashable, Tuple[object, int]]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.skipped_too_large = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def bytes_used(self) -> int:
+        return self._bytes
+
+    @staticmethod
+    def sizeof(result: object) -> int:
+        """Approximate memory cost of a cached result (its UTF-8 text size)."""
+        if isinstance(result, (bytes, bytearray)):
+            return len(result)
+        return len(str(result).encode("utf-8"))
+
+    def _drop_all(self) -> None:
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self._version:
+            self._drop_all()
+            self._version = version
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[object]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, result: object, version: Hashable, size: Optional[int] = None) -> bool:
+        """Cache `result`; returns False if it was too large to keep."""
+        if not self.enabled:
+            return False
+        size = self.sizeof(result) if size is None else size
+        with self._lock:
+            self._check_version(version)
+            if size > self.max_entry_bytes:
+                self.skipped_too_large += 1
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+            return True
+
+    def invalidate(self) -> None:
+        """Drop everything (call after executing a write statement)."""
+        with self._lock:
+            self._drop_all()
+            self._version = None
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "skipped_too_large": self.skipped_too_large,
+        }
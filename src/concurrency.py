@@ -0,0 +1,198 @@
+"""Admission control and request coalescing for graph runs.
+
+The FastAPI service runs every LangGraph invocation on the event loop, so an
+unbounded number of concurrent conversations would pile up model calls and
+SQLite reads without limit. `RunLimiter` caps the number of in-flight graph
+runs, keeps a bounded wait queue in front of them and rejects quickly once the
+queue is full so clients can back off and retry. `SingleFlight` lets
+concurrent identical requests share one run instead of each starting its own.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LimiterRejected(Exception):
+    """Raised when a run cannot be admitted. `status_code` maps to HTTP."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFull(LimiterRejected):
+    """The wait queue is at capacity; the caller should retry later."""
+
+    status_code = 429
+
+
+class QueueTimeout(LimiterRejected):
+    """The caller waited in the queue for longer than `queue_timeout`."""
+
+    status_code = 503
+
+
+class RunLimiter:
+    """Bounded concurrency with a bounded FIFO wait queue.
+
+    - `max_in_flight`: how many graph runs may execute at the same time.
+    - `max_queue`: how many callers may wait for a free slot. Once this many
+      are waiting, new callers are rejected immediately with `QueueFull`.
+    - `queue_timeout`: how long (seconds) a queued caller waits before
+      giving up with `QueueTimeout`.
+    - `on_admit`: optional callback given the queue wait (seconds) of every
+      admitted run, called in the caller's task (e.g. for metrics).
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 30.0,
+        on_admit: Optional[Callable[[float], None]] = None,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be >= 1")
+        if max_queue < 0:
+            raise ValueError("max_queue must be >= 0")
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.on_admit = on_admit
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected_full = 0
+        self._rejected_timeout = 0
+        self._total_wait = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one run slot for the duration of the `async with` block."""
+        start = time.perf_counter()
+        wait = 0.0
+        if not self._semaphore.locked() and not self._waiting:
+            # Fast path: a slot is free and nobody is queued ahead of us.
+            await self._semaphore.acquire()
+        else:
+            if self._waiting >= self.max_queue:
+                self._rejected_full += 1
+                raise QueueFull(
+                    f"Server busy: {self._in_flight} runs in flight and {self._waiting} queued.",
+                    retry_after=max(1.0, self.queue_timeout / 4),
+                )
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._rejected_timeout += 1
+                raise QueueTimeout(
+                    f"Timed out after {self.queue_timeout:.1f}s waiting for a free run slot.",
+                    retry_after=max(1.0, self.queue_timeout / 4),
+                )
+            finally:
+                self._waiting -= 1
+            wait = time.perf_counter() - start
+            self._total_wait += wait
+        self._admitted += 1
+        self._in_flight += 1
+        try:
+            if self.on_admit is not None:
+                self.on_admit(wait)
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of limiter counters (cheap; safe to expose on /health)."""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "admitted": self._admitted,
+            "rejected_queue_full": self._rejected_full,
+            "rejected_timeout": self._rejected_timeout,
+            "mean_queue_wait_s": self._total_wait / self._admitted if self._admitted else 0.0,
+        }
+
+
+class _LeaderCancelled(Exception):
+    """Internal: the run followers were waiting on was cancelled; they retry."""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key onto one execution.
+
+    The first caller for a key (the leader) runs `fn`; callers arriving while
+    it runs (followers) wait for the leader's result instead of running `fn`
+    themselves. A leader error is raised to every follower too, since they
+    asked the same thing. A cancelled leader (client gone) is not their
+    problem: one follower is promoted and runs `fn` again. A cancelled
+    follower just stops waiting.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._leaders = 0
+        self._followers = 0
+        self._leader_errors = 0
+        self._leader_cancellations = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result, shared): `shared` is True when the result came from another caller's run."""
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self._followers += 1
+            try:
+                return await asyncio.shield(future), True
+            except _LeaderCancelled:
+                self._followers -= 1  # not served after all; try again, maybe as the leader
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self._leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._leader_cancellations += 1
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            self._leader_errors += 1
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+            future.exception()  # mark retrieved: there may be no follower to see it
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self._leaders,
+            "coalesced": self._followers,
+            "leader_errors": self._leader_errors,
+            "leader_cancellations": self._leader_cancellations,
+        }
@@ -0,0 +1,178 @@
+"""Shared SQLite connection layer.
+
+Both the Interaction Agent's SQL tools (through SQLAlchemy) and the Analyst's
+latency sampling use `sakila.db`. `ConnectionPool` hands out read-only
+connections tuned for that workload:
+
+- WAL journal mode (set once on the file) so readers never block each other
+  or a writer.
+- `mmap_size`, `cache_size` and `temp_store=MEMORY` tuned per connection.
+- A per-connection prepared-statement cache (`cached_statements`).
+- One long-lived connection per thread via `connection()`, so repeated reads
+  (and latency samples) do not pay connection setup.
+
+Latency samples may be writes, so they use a separate writable pool that
+leaves the journal mode alone (`read_only=False, wal=False`).
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MMAP_BYTES = 256 * 1024 * 1024
+DEFAULT_CACHE_KIB = 64 * 1024
+DEFAULT_STATEMENT_CACHE = 256
+
+
+def enable_wal(db_path: str) -> Optional[str]:
+    """Switch the database file to WAL mode (persistent). Returns the resulting mode.
+
+    Needs write access; if the file is read-only the current mode is kept and
+    returned unchanged.
+    """
+    try:
+        conn = sqlite3.connect(db_path)
+    except sqlite3.Error:
+        return None
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+class ConnectionPool:
+    """Per-thread, read-only, tuned SQLite connections for one database file."""
+
+    def __init__(
+        self,
+        db_path: str,
+        mmap_bytes: int = DEFAULT_MMAP_BYTES,
+        cache_kib: int = DEFAULT_CACHE_KIB,
+        statement_cache: int = DEFAULT_STATEMENT_CACHE,
+        read_only: bool = True,
+        wal: bool = True,
+    ):
+        self.db_path = os.path.abspath(db_path)
+        self.mmap_bytes = mmap_bytes
+        self.cache_kib = cache_kib
+        self.statement_cache = statement_cache
+        self.read_only = read_only
+        self.journal_mode = enable_wal(self.db_path) if wal else None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []  # per-thread connections, closed by `close_all`
+        self.opened = 0
+        self.checkouts = 0
+        self.connect_time = 0.0
+
+    def connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """Open a new tuned connection (also used as SQLAlchemy's `creator`).
+
+        The caller owns it: only `connection()`'s per-thread connections are
+        tracked and closed by the pool.
+        """
+        start = time.perf_counter()
+        if self.read_only:
+            conn = sqlite3.connect(
+                f"file:{self.db_path}?mode=ro",
+                uri=True,
+                cached_statements=self.statement_cache,
+                check_same_thread=check_same_thread,
+            )
+        else:
+            conn = sqlite3.connect(
+                self.db_path,
+                cached_statements=self.statement_cache,
+                check_same_thread=check_same_thread,
+            )
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+        conn.execute(f"PRAGMA cache_size={-int(self.cache_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.read_only:
+            conn.execute("PRAGMA query_only=ON")
+        with self._lock:
+            self.opened += 1
+            self.connect_time += time.perf_counter() - start
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        opened = conn is None
+        if opened:
+            conn = self.connect()
+            self._local.conn = conn
+        with self._lock:
+            if opened:
+                self._connections.append(conn)
+            self.checkouts += 1
+        return conn
+
+    @contextmanager
+    def cursor(self):
+        """Cursor on the calling thread's connection; closed on exit."""
+        cur = self.connection().cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    def sqlalchemy_engine_args(self, pool_size: int = 8) -> Dict[str, object]:
+        """`engine_args` for `SQLDatabase.from_uri("sqlite://", ...)` backed by this pool."""
+        from sqlalchemy.pool import QueuePool
+
+        return {
+            # SQLAlchemy moves pooled connections between threads, one at a time.
+            "creator": lambda: self.connect(check_same_thread=False),
+            "poolclass": QueuePool,
+            "pool_size": pool_size,
+            "max_overflow": pool_size,
+        }
+
+    def close_all(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "db_path": self.db_path,
+            "journal_mode": self.journal_mode,
+            "read_only": self.read_only,
+            "open_connections": len(self._connections),  # per-thread ones; SQLAlchemy closes its own
+            "opened": self.opened,
+            "checkouts": self.checkouts,
+            "mean_connect_ms": 1000 * self.connect_time / self.opened if self.opened else 0.0,
+            "mmap_bytes": self.mmap_bytes,
+            "cache_kib": self.cache_kib,
+            "statement_cache": self.statement_cache,
+        }
+
+
+_pools: Dict[Tuple[str, bool, bool], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, **kwargs) -> ConnectionPool:
+    """Process-wide pool for `db_path` (created with `kwargs` on first call).
+
+    Pools are shared per file and per `read_only`/`wal` choice; the tuning
+    kwargs only apply to the call that creates the pool.
+    """
+    path = os.path.abspath(db_path)
+    key = (path, kwargs.get("read_only", True), kwargs.get("wal", True))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(path, **kwargs)
+            _pools[key] = pool
+        return pool
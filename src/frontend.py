@@ -2,35 +2,92 @@ import gradio as gr
 import requests
 import json
 
-# Define the endpoint of your running FastAPI service
+# Define the endpoints of your running FastAPI service
 FASTAPI_ENDPOINT = "http://127.0.0.1:8000/chat"
+FASTAPI_STREAM_ENDPOINT = "http://127.0.0.1:8000/chat/stream"
 
-def query_agent(message, history):
+# Gradio browser session -> AEGIS conversation session_id
+SESSION_IDS = {}
+
+
+def iter_sse(response):
+    """
+    Parses a server-sent events response into (event, data) pairs.
+    """
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            # A blank line terminates one event
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+def query_agent(message, history, request: gr.Request = None):
     """
-    Sends the user message to the running FastAPI service and returns the response.
+    Streams the agent's progress from the running FastAPI service.
+
+    Tool activity is shown as status lines while it happens, then the final
+    answer is rendered incrementally as tokens arrive.
     """
-    # FastAPI only takes the current question, so we ignore history for this simple demo
-    
-    # Prepare the data payload
+    # The server keeps the conversation history; we only pass its session_id.
+    # An empty chat history means the user started a new conversation.
+    browser_key = getattr(request, "session_hash", None) or "default"
+    if not history:
+        SESSION_IDS.pop(browser_key, None)
+    params = {"question": message}
+    if browser_key in SESSION_IDS:
+        params["session_id"] = SESSION_IDS[browser_key]
+
+    status_lines = []
+    answer = ""
+
+    def render():
+        status = "\n".join(status_lines)
+        return f"{status}\n\n{answer}" if status and answer else (answer or status or "…")
+
     try:
-        response = requests.post(
-            FASTAPI_ENDPOINT, 
+        with requests.post(
+            FASTAPI_STREAM_ENDPOINT,
             # The FastAPI endpoint expects the question as a query parameter in this simple setup
-            params={"question": message}
-        )
-        
-        # Check if the API call was successful
-        if response.status_code == 200:
-            # Parse the JSON response
-            api_response = response.json()
-            return api_response.get("response", "Error: Response field missing from API.")
-        else:
-            return f"Error: API returned status code {response.status_code}. Response: {response.text}"
-            
+            params=params,
+            stream=True,
+        ) as response:
+            # Check if the API call was successful
+            if response.status_code != 200:
+                yield f"Error: API returned status code {response.status_code}. Response: {response.text}"
+                return
+
+            for event, data in iter_sse(response):
+                if event == "tool_start":
+                    # Text streamed before a tool call was the model thinking aloud
+                    answer = ""
+                    status_lines.append(f"🛠️ Running `{data.get('name')}`…")
+                elif event == "tool_end":
+                    if data.get("memo"):
+                        status_lines.append(f"♻️ `{data.get('name')}` reused an earlier result")
+                    else:
+                        status_lines.append(f"✅ `{data.get('name')}` finished in {data.get('elapsed_s', 0):.2f}s")
+                elif event == "token":
+                    answer += data.get("text", "")
+                elif event == "done":
+                    answer = data.get("response") or answer
+                    if data.get("session_id"):
+                        SESSION_IDS[browser_key] = data["session_id"]
+                elif event == "error":
+                    answer = f"An error occurred: {data.get('error')}"
+                yield render()
+
     except requests.exceptions.ConnectionError:
-        return "Error: Could not connect to the FastAPI backend. Is the server running (uvicorn)? "
+        yield "Error: Could not connect to the FastAPI backend. Is the server running (uvicorn)? "
     except Exception as e:
-        return f"An unexpected error occurred: {str(e)}"
+        yield f"An unexpected error occurred: {str(e)}"
 
 
 # Define the Gradio Chat Interface
@@ -39,4 +96,4 @@ if __name__ == "__main__":
         query_agent,
         title="AEGIS: Autonomous Database Chatbot (Interaction Agent)",
         description="Ask questions about the Sakila database. The agent translates your text to SQL.",
-    ).launch()
\ No newline at end of file
+    ).launch()
@@ -0,0 +1,245 @@
+"""Cost guardrail for agent-generated SQL.
+
+The model occasionally writes an accidental cartesian join or an unbounded
+scan. Left alone, such a statement pins a tool thread and the SQLite file for
+as long as it runs (the tool timeout only stops *waiting* for it).
+`QueryGuard` puts three checks around every `sql_db_query` execution:
+
+1. Before running: `EXPLAIN QUERY PLAN` is costed as nested loops (full scans
+   count the table's estimated rows, index lookups a small fan-out). A plan
+   above `max_plan_rows` row combinations is rejected without running. A
+   SELECT without a top-level LIMIT gets `LIMIT max_rows + 1` appended, so
+   SQLite can stop (or top-N sort) instead of producing rows nobody keeps.
+2. While running: SQLite's progress handler enforces a wall-clock budget
+   (`max_seconds`) and a VM instruction budget (`max_steps`) and interrupts
+   the statement once either is spent.
+3. The row cap: at most `max_rows` rows are materialized.
+
+`EXPLAIN` / `EXPLAIN QUERY PLAN` statements skip step 1: they only compile
+the statement, and `EXPLAIN QUERY PLAN EXPLAIN ...` is not valid SQL.
+
+Refusals raise `QueryRejected`, whose `tool_error()` is a structured message
+the model can act on (what was wrong and how to make the query cheaper).
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.schema_digest import row_estimates
+from src.sqltext import iter_tokens, table_aliases
+
+SEARCH_FANOUT = 10  # rows assumed per equality/primary-key lookup
+PROGRESS_INTERVAL = 1000  # VM instructions between progress-handler calls
+
+
+class QueryRejected(Exception):
+    """The guard refused a statement or stopped it mid-flight."""
+
+    def __init__(self, reason: str, detail: str, hint: str):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+        self.hint = hint
+
+    def tool_error(self) -> str:
+        payload = {"error": "query_rejected", "reason": self.reason, "detail": self.detail, "hint": self.hint}
+        return "Error: " + json.dumps(payload)
+
+
+class PlanLoop(NamedTuple):
+    table: str
+    access: str  # "scan" or "search"
+    rows: int
+
+
+class PlanCost(NamedTuple):
+    rows: int  # estimated row combinations visited
+    loops: List[PlanLoop]
+
+
+def _plan_target(words: List[str]) -> str:
+    # "SCAN f", "SEARCH f USING ...", and older "SCAN TABLE film AS f"
+    if len(words) > 2 and words[1] == "TABLE":
+        return words[4] if len(words) > 4 and words[3] == "AS" else words[2]
+    return words[1]
+
+
+def cost_plan(plan: Sequence[Tuple[int, int, int, str]], aliases: Dict[str, str],
+              estimates: Dict[str, int]) -> PlanCost:
+    """Estimate the rows an EXPLAIN QUERY PLAN visits, treating each SELECT's steps as nested loops.
+
+    Loops under the same parent multiply; separate subqueries add up; a
+    correlated subquery is multiplied by the loops of the query it runs in.
+    """
+    nodes = {node_id: (parent, detail) for node_id, parent, _, detail in plan}
+    groups: Dict[int, int] = {}
+    loops: List[PlanLoop] = []
+    for node_id, parent, _, detail in plan:
+        words = detail.split()
+        if words[:1] not in (["SCAN"], ["SEARCH"]) or len(words) < 2 or words[1] == "CONSTANT":
+            continue
+        name = _plan_target(words)
+        table = aliases.get(name.lower(), name)
+        size = estimates.get(table)
+        if words[0] == "SCAN":
+            rows = size if size is not None else 1  # a CTE or subquery: costed in its own group
+        elif size is None:
+            rows = SEARCH_FANOUT
+        elif "=" in detail.replace(">=", "").replace("<=", ""):
+            rows = min(size, SEARCH_FANOUT)
+        else:
+            rows = max(1, size // 3)  # range lookup
+        rows = max(1, rows)
+        loops.append(PlanLoop(table, words[0].lower(), rows))
+        groups[parent] = groups.get(parent, 1) * rows
+
+    def group_cost(parent: int) -> int:
+        cost = groups.get(parent, 1)
+        node = nodes.get(parent)
+        if node is not None and node[1].startswith("CORRELATED"):
+            cost *= group_cost(node[0])
+        return cost
+
+    return PlanCost(sum(group_cost(parent) for parent in groups), loops)
+
+
+def has_top_level_limit(sql: str) -> bool:
+    depth = 0
+    for kind, text in iter_tokens(sql):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word" and text == "limit":
+            return True
+    return False
+
+
+def is_explain(sql: str) -> bool:
+    """True for `EXPLAIN ...` and `EXPLAIN QUERY PLAN ...`."""
+    return next((text for _, text in iter_tokens(sql)), None) == "explain"
+
+
+def add_limit(sql: str, limit: int) -> str:
+    """`sql` with `LIMIT limit` appended, unless it is not a SELECT or already has a top-level LIMIT."""
+    tokens = [text for _, text in iter_tokens(sql)]
+    if not tokens or tokens[0] not in ("select", "with", "values") or has_top_level_limit(sql):
+        return sql
+    body = sql.rstrip().rstrip(";").rstrip()
+    return f"{body}\nLIMIT {int(limit)}"
+
+
+class QueryGuard:
+    """Plan check, LIMIT rewrite and execution budgets for one database.
+
+    A budget of 0 turns that check off. Row estimates come from
+    `schema_digest.row_estimates` and are reloaded when the schema changes.
+    """
+
+    def __init__(self, max_seconds: float = 10.0, max_steps: int = 200_000_000,
+                 max_plan_rows: int = 50_000_000, max_rows: int = 100_000):
+        self.max_seconds = max_seconds
+        self.max_steps = max_steps
+        self.max_plan_rows = max_plan_rows
+        self.max_rows = max_rows
+        self._estimates: Dict[str, int] = {}
+        self._schema_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rewritten = 0
+        self.rejected_plan = 0
+        self.aborted_time = 0
+        self.aborted_steps = 0
+
+    def _row_estimates(self, conn: sqlite3.Connection) -> Dict[str, int]:
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if version != self._schema_version:
+            estimates = row_estimates(conn)
+            with self._lock:
+                self._estimates, self._schema_version = estimates, version
+        return self._estimates
+
+    def prepare(self, conn: sqlite3.Connection, sql: str) -> str:
+        """The statement to execute in place of `sql`; raises QueryRejected for a runaway plan."""
+        with self._lock:
+            self.checked += 1
+        if is_explain(sql):
+            return sql  # nothing runs, and the plan of a plan cannot be costed
+        if self.max_plan_rows:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            estimates = self._row_estimates(conn)
+            cost = cost_plan(plan, table_aliases(sql, {t: [] for t in estimates}), estimates)
+            if cost.rows > self.max_plan_rows:
+                with self._lock:
+                    self.rejected_plan += 1
+                scans = " x ".join(f"{loop.access} {loop.table} (~{loop.rows:,})" for loop in cost.loops)
+                raise QueryRejected(
+                    "plan_too_expensive",
+                    f"the plan visits ~{cost.rows:,} row combinations ({scans}); the limit is {self.max_plan_rows:,}",
+                    "Join every table on a key, filter with WHERE on indexed columns, or aggregate; "
+                    "comma-joined tables without a join condition multiply.",
+                )
+        if not self.max_rows:
+            return sql
+        limited = add_limit(sql, self.max_rows + 1)  # one extra row still flags truncation
+        if limited is not sql:
+            with self._lock:
+                self.rewritten += 1
+        return limited
+
+    @contextmanager
+    def budget(self, conn: sqlite3.Connection):
+        """Interrupt statements run on `conn` inside the block once a budget is spent."""
+        if not self.max_seconds and not self.max_steps:
+            yield
+            return
+        started = time.perf_counter()
+        deadline = started + self.max_seconds if self.max_seconds else float("inf")
+        steps = 0
+        reason = None
+
+        def progress() -> int:
+            nonlocal steps, reason
+            steps += PROGRESS_INTERVAL
+            if self.max_steps and steps > self.max_steps:
+                reason = "step_budget"
+            elif time.perf_counter() > deadline:
+                reason = "time_budget"
+            return 1 if reason else 0
+
+        conn.set_progress_handler(progress, PROGRESS_INTERVAL)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if reason is None:
+                raise
+            with self._lock:
+                if reason == "time_budget":
+                    self.aborted_time += 1
+                else:
+                    self.aborted_steps += 1
+            raise QueryRejected(
+                reason,
+                f"stopped after {time.perf_counter() - started:.1f}s and ~{steps:,} VM steps "
+                f"(budget {self.max_seconds:g}s / {self.max_steps:,} steps)",
+                "Make the query cheaper: filter on indexed columns, join on keys, aggregate in SQL "
+                "and add a LIMIT.",
+            ) from e
+        finally:
+            conn.set_progress_handler(None, PROGRESS_INTERVAL)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "checked": self.checked,
+            "rewritten": self.rewritten,
+            "rejected_plan": self.rejected_plan,
+            "aborted_time": self.aborted_time,
+            "aborted_steps": self.aborted_steps,
+            "max_seconds": self.max_seconds,
+            "max_steps": self.max_steps,
+            "max_plan_rows": self.max_plan_rows,
+            "max_rows": self.max_rows,
+        }
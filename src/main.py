@@ -1,66 +1,293 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import sqlite3
 import os
+import asyncio
+import contextvars
+import functools
+import json
 import operator
-from typing import Annotated, TypedDict, List
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, TypedDict, List, Optional
 
 # --- Imports for LangChain ---
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, ToolMessage
+# Only the message types are imported eagerly. The Gemini client, the SQL
+# toolkit and LangGraph each take most of a second to import, so they are
+# imported where they are first used (startup), keeping `import src.main`
+# cheap for workers, tests and tools.
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, HumanMessage, ToolMessage
 
-# --- Imports for LangGraph ---
-# Note: We are NOT importing ToolNode anymore to avoid your error
-from langgraph.graph import StateGraph, END, START
+from src.concurrency import RunLimiter, LimiterRejected, SingleFlight
+from src.schema_digest import SchemaDigest
+from src.batch import dedupe_questions, run_concurrently
+from src.budget import WRAP_UP_PROMPT, RunBudget, best_effort_answer, memo_key
+from src.cache import AnswerCache, QueryResultCache, database_version, normalize_question
+from src.sqltext import canonicalize_sql, fingerprint_id, fingerprint_sql, is_read_only_sql
+from src.guard import QueryGuard, QueryRejected
+from src.models import (ModelBackend, ModelRouter, answer_problem, escalation_reason, is_simple_question,
+                        load_backends)
+from src.db import DEFAULT_CACHE_KIB, DEFAULT_MMAP_BYTES, get_pool
+from src.results import ResultStore, cursor_id_for, execute_query, format_page
+from src.sessions import SessionStore
+from src.templates import TemplateStore, answer_sql, format_answer
+from src.agents.performance import IndexAdvisor, workload_from_recorder
+from src.agents.baseline import BaselineStore
+from src.agents.monitor import Monitor, TimeSeriesStore, load_canaries
+from src.agents.workload import WorkloadRecorder
+from src.telemetry import MetricsRegistry, RequestTracingMiddleware, Tracer, configure_logging
 
 # --- 1. Environment & Database Setup ---
 # os.environ["GOOGLE_API_KEY"] = "Your-Key-Here" 
 
-DB_FILE = "data/sakila.db"
-if not os.path.exists(DB_FILE):
-    print(f"Error: Database file '{DB_FILE}' not found. Run create_db.py first.")
-    exit()
+DB_FILE = os.environ.get("AEGIS_DB_FILE", "data/sakila.db")
+
+# --- Concurrency settings ---
+# Graph runs execute on the event loop; blocking tool calls (SQLite reads) are
+# pushed onto a dedicated thread pool so they never stall other requests.
+MAX_IN_FLIGHT = int(os.environ.get("AEGIS_MAX_IN_FLIGHT", "16"))
+MAX_QUEUE = int(os.environ.get("AEGIS_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.environ.get("AEGIS_QUEUE_TIMEOUT", "30"))
+TOOL_WORKERS = int(os.environ.get("AEGIS_TOOL_WORKERS", "8"))
+TOOL_TIMEOUT = float(os.environ.get("AEGIS_TOOL_TIMEOUT", "30"))
+STREAM_PREVIEW_CHARS = int(os.environ.get("AEGIS_STREAM_PREVIEW_CHARS", "500"))
+
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="aegis-tool")
+run_limiter = RunLimiter(max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT)
+
+# Identical first-turn questions (same normalized text and database version)
+# that arrive while one is already running wait for that run's answer.
+COALESCE = os.environ.get("AEGIS_COALESCE", "1") == "1"
+inflight = SingleFlight()
+
+# Index advice copies the database and times every candidate index. It runs
+# on its own thread, so it never holds a tool worker, and its last report is
+# kept per (query shapes, database version).
+advisor_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aegis-advisor")
+advice_flight = SingleFlight()
+index_advice_cache: dict = {}
+
+# --- Connection pool ---
+# One tuned, read-only connection layer (WAL, mmap, page cache, statement
+# cache) shared by the SQL tools and the Analyst. SQLAlchemy draws its
+# connections from it, sized to the tool thread pool. Both are opened by
+# `init_database()` at startup, not at import.
+db_pool = None
+db = None
+
+def init_database():
+    """Open the connection pool and the toolkit's SQLDatabase (idempotent)."""
+    global db_pool, db
+    if db is not None:
+        return
+    if not os.path.exists(DB_FILE):
+        raise RuntimeError(f"Database file '{DB_FILE}' not found. Run utility/create_db.py first.")
+    from langchain_community.utilities import SQLDatabase
+    
+    db_pool = get_pool(
+        DB_FILE,
+        mmap_bytes=int(os.environ.get("AEGIS_SQLITE_MMAP_BYTES", str(DEFAULT_MMAP_BYTES))),
+        cache_kib=int(os.environ.get("AEGIS_SQLITE_CACHE_KIB", str(DEFAULT_CACHE_KIB))),
+    )
+    db = SQLDatabase.from_uri("sqlite://", engine_args=db_pool.sqlalchemy_engine_args(pool_size=TOOL_WORKERS))
 
-db = SQLDatabase.from_uri(f"sqlite:///{DB_FILE}")
+# --- Schema digest ---
+# Built at startup and injected into the system message so the model can go
+# straight to `sql_db_query` instead of discovering the schema tool by tool.
+SCHEMA_DIGEST_CHARS = int(os.environ.get("AEGIS_SCHEMA_DIGEST_CHARS", "6000"))
+schema_digest = SchemaDigest(DB_FILE, max_chars=SCHEMA_DIGEST_CHARS)
+
+# --- Answer cache ---
+# Final answers keyed by normalized question; invalidated when the DB file changes.
+ANSWER_CACHE_SIZE = int(os.environ.get("AEGIS_ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = float(os.environ.get("AEGIS_ANSWER_CACHE_TTL", "3600"))
+answer_cache = AnswerCache(max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+# --- Query result cache ---
+# `sql_db_query` results keyed by canonical SQL, shared by every request in
+# this worker and bounded by total cached bytes.
+QUERY_CACHE_BYTES = int(os.environ.get("AEGIS_QUERY_CACHE_BYTES", str(32 * 1024 * 1024)))
+query_cache = QueryResultCache(max_bytes=QUERY_CACHE_BYTES)
+
+# --- SQL templates ---
+# Question shapes learned from successful first-turn runs. A confident match
+# is answered by running its parameterized SQL directly, without the model.
+template_store = TemplateStore(
+    min_support=int(os.environ.get("AEGIS_TEMPLATE_MIN_SUPPORT", "2")),
+    min_share=float(os.environ.get("AEGIS_TEMPLATE_MIN_SHARE", "0.8")),
+    max_patterns=int(os.environ.get("AEGIS_TEMPLATE_MAX_PATTERNS", "512")),
+)
+
+# --- Paged tool results ---
+# `sql_db_query` returns one compact page; the full result stays server-side
+# behind a cursor handle that the model pages through with `fetch_more`.
+TOOL_MAX_ROWS = int(os.environ.get("AEGIS_TOOL_MAX_ROWS", "50"))
+TOOL_MAX_BYTES = int(os.environ.get("AEGIS_TOOL_MAX_BYTES", "8000"))
+RESULT_STORE_MAX_ROWS = int(os.environ.get("AEGIS_RESULT_STORE_MAX_ROWS", "100000"))
+RESULT_STORE_BYTES = int(os.environ.get("AEGIS_RESULT_STORE_BYTES", str(64 * 1024 * 1024)))
+result_store = ResultStore(max_bytes=RESULT_STORE_BYTES)
+
+# --- SQL cost guard ---
+# Every agent statement is costed from EXPLAIN QUERY PLAN first (runaway
+# plans are refused, a missing LIMIT is added) and then runs under wall-clock
+# and VM-step budgets enforced by SQLite's progress handler.
+query_guard = QueryGuard(
+    max_seconds=float(os.environ.get("AEGIS_SQL_MAX_SECONDS", "10")),
+    max_steps=int(os.environ.get("AEGIS_SQL_MAX_STEPS", "200000000")),
+    max_plan_rows=int(os.environ.get("AEGIS_SQL_MAX_PLAN_ROWS", "50000000")),
+    max_rows=RESULT_STORE_MAX_ROWS,
+)
+# The index advisor replays captured SQL under the same budgets, counted apart
+advisor_guard = QueryGuard(query_guard.max_seconds, query_guard.max_steps, query_guard.max_plan_rows,
+                           query_guard.max_rows)
+
+# --- Sessions ---
+# Multi-turn history per session_id, compacted to a per-session byte budget
+# and evicted when idle.
+session_store = SessionStore(
+    max_bytes_per_session=int(os.environ.get("AEGIS_SESSION_MAX_BYTES", str(64 * 1024))),
+    idle_ttl=float(os.environ.get("AEGIS_SESSION_IDLE_TTL", "1800")),
+    max_sessions=int(os.environ.get("AEGIS_MAX_SESSIONS", "1000")),
+)
+
+# --- Batch chat ---
+# `POST /chat/batch` answers many independent questions in one call: near-
+# identical ones are answered once, the rest run with bounded parallelism.
+BATCH_PARALLELISM = int(os.environ.get("AEGIS_BATCH_PARALLELISM", "4"))
+BATCH_MAX_QUESTIONS = int(os.environ.get("AEGIS_BATCH_MAX_QUESTIONS", "1000"))
+
+# --- Run budget ---
+# Every graph run gets a budget of graph steps, model calls and seconds (0
+# disables a limit). Once another tools round would not fit, the model is asked
+# to answer without tools. Identical tool calls within one run are answered
+# from the run's memo (AEGIS_TOOL_MEMO).
+RUN_MAX_STEPS = int(os.environ.get("AEGIS_RUN_MAX_STEPS", "24"))
+RUN_MAX_LLM_CALLS = int(os.environ.get("AEGIS_RUN_MAX_LLM_CALLS", "10"))
+RUN_MAX_SECONDS = float(os.environ.get("AEGIS_RUN_MAX_SECONDS", "120"))
+TOOL_MEMO = os.environ.get("AEGIS_TOOL_MEMO", "1") == "1"
+
+def new_run_config() -> dict:
+    """LangGraph config for one run: a fresh `RunBudget` and a recursion limit above its step cap."""
+    budget = RunBudget(RUN_MAX_STEPS, RUN_MAX_LLM_CALLS, RUN_MAX_SECONDS, memoize=TOOL_MEMO)
+    return {"configurable": {"budget": budget}, "recursion_limit": budget.recursion_limit}
+
+# --- Workload capture ---
+# Every statement the agent executes is fingerprinted and aggregated for the
+# Analyst; recent executions are flushed to a JSON-lines log in the background.
+workload = WorkloadRecorder(
+    log_path=os.environ.get("AEGIS_WORKLOAD_LOG", "data/workload.jsonl") or None,
+    ring_size=int(os.environ.get("AEGIS_WORKLOAD_RING", "10000")),
+    flush_interval=float(os.environ.get("AEGIS_WORKLOAD_FLUSH_INTERVAL", "10")),
+)
+
+# --- Continuous monitoring ---
+# Canary queries run on jittered intervals off the request path; their
+# latencies go to a small time-series file (raw + 1m/1h rollups) and are
+# checked against streaming baselines. An empty AEGIS_MONITOR_DB disables it.
+MONITOR_DB = os.environ.get("AEGIS_MONITOR_DB", "data/monitor.db")
+MONITOR_CANARIES = os.environ.get("AEGIS_MONITOR_CANARIES", "")  # JSON list, or a path to one
+MONITOR_THRESHOLD = float(os.environ.get("AEGIS_MONITOR_THRESHOLD", "2.0"))
+MONITOR_MIN_SAMPLES = int(os.environ.get("AEGIS_MONITOR_MIN_SAMPLES", "30"))
+MONITOR_JITTER = float(os.environ.get("AEGIS_MONITOR_JITTER", "0.2"))
+MONITOR_RAW_RETENTION = float(os.environ.get("AEGIS_MONITOR_RAW_RETENTION", str(24 * 3600)))
+MONITOR_1M_RETENTION = float(os.environ.get("AEGIS_MONITOR_1M_RETENTION", str(14 * 86400)))
+MONITOR_1H_RETENTION = float(os.environ.get("AEGIS_MONITOR_1H_RETENTION", str(400 * 86400)))
+monitor: Optional[Monitor] = None  # created at startup
+
+# --- Tracing & metrics ---
+# Spans per request (HTTP handler, graph steps, LLM calls, tools, SQL) carry
+# the request ID into the `aegis.*` logs; `GET /metrics` serves Prometheus text.
+configure_logging()
+log = logging.getLogger("aegis.agent")
+tracer = Tracer(max_traces=int(os.environ.get("AEGIS_TRACE_HISTORY", "200")))
+metrics = MetricsRegistry()
+HTTP_SECONDS = metrics.histogram("aegis_http_request_seconds", "HTTP request latency.", ["method", "route", "status"])
+HTTP_IN_FLIGHT = metrics.gauge("aegis_http_requests_in_flight", "HTTP requests being handled.")
+STEP_SECONDS = metrics.histogram("aegis_graph_step_seconds", "Graph node latency.", ["node"])
+LLM_SECONDS = metrics.histogram("aegis_llm_call_seconds", "Model call latency.")
+LLM_TOKENS = metrics.counter("aegis_llm_tokens_total", "Model tokens used.", ["kind"])
+MODEL_ESCALATIONS = metrics.counter("aegis_model_escalations_total", "Model calls sent to the top tier, by reason.",
+                                    ["reason"])
+TOOL_SECONDS = metrics.histogram("aegis_tool_call_seconds", "Tool call latency.", ["tool"])
+QUEUE_WAIT_SECONDS = metrics.histogram("aegis_run_queue_wait_seconds", "Time spent waiting for a run slot.")
+SQL_ROWS = metrics.counter("aegis_sql_rows_total", "Rows returned by sql_db_query.")
+MODEL_CALLS_SAVED = metrics.counter("aegis_coalesced_model_calls_saved_total",
+                                    "Model calls avoided by sharing an identical in-flight run.")
+BATCH_QUESTIONS = metrics.counter("aegis_batch_questions_total", "Questions received by /chat/batch.", ["kind"])
+SQL_REJECTED = metrics.counter("aegis_sql_rejected_total", "Statements refused or stopped by the cost guard.",
+                               ["reason"])
+MONITOR_ALERTS = metrics.counter("aegis_monitor_alerts_total", "Canary failures and latency anomalies.",
+                                 ["canary"])
+RUN_STEPS = metrics.histogram("aegis_run_steps", "Graph steps per run.", buckets=(1, 3, 5, 7, 9, 13, 17, 25, 49))
+RUN_LLM_CALLS = metrics.histogram("aegis_run_llm_calls", "Model calls per run.", buckets=(1, 2, 3, 4, 6, 8, 12, 24))
+RUNS_CUT_SHORT = metrics.counter("aegis_runs_budget_exhausted_total", "Runs that hit a budget limit, by limit.",
+                                 ["reason"])
+TOOL_MEMO_HITS = metrics.counter("aegis_tool_memo_hits_total", "Tool calls answered from the run's memo.", ["tool"])
+ERRORS = metrics.counter("aegis_errors_total", "Errors by where they happened.", ["where"])
+
+SYSTEM_PROMPT = "You are a helpful SQL assistant. You have access to a database. Use the tools to answer user questions."
+
+def build_system_message() -> SystemMessage:
+    """System instruction plus the current schema digest (rebuilt if the schema changed)."""
+    digest = schema_digest.text()
+    if not digest:
+        return SystemMessage(content=SYSTEM_PROMPT)
+    return SystemMessage(content=(
+        f"{SYSTEM_PROMPT}\n\n"
+        "The SQLite schema is summarized below (PK = primary key, NN = not null, "
+        "a->t.c = foreign key, ~N rows = estimate). Write SQL directly from it with "
+        "sql_db_query; only call sql_db_list_tables/sql_db_schema if something you "
+        "need is missing.\n"
+        f"{digest}"
+    ))
 
 # --- 2. Initialize LLM and Tools (Lazy Loading) ---
-# These will be initialized only when the FastAPI app starts
+# These will be initialized only when the FastAPI app starts.
+# AEGIS_MODELS lists the model backends and their tiers (see src/models.py);
+# the router starts simple questions on tier 0, escalates after a failed SQL
+# call or an unusable answer, and hedges calls slower than the backend's p95.
+MODEL_SPECS = os.environ.get("AEGIS_MODELS", "")
+ROUTER_SIMPLE_WORDS = int(os.environ.get("AEGIS_ROUTER_SIMPLE_WORDS", "40"))
+HEDGE = os.environ.get("AEGIS_HEDGE", "1") == "1"
+HEDGE_QUANTILE = float(os.environ.get("AEGIS_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("AEGIS_HEDGE_MIN_SAMPLES", "20"))
 llm = None
-toolkit = None
 tools = None
 tools_by_name = None
-llm_with_tools = None
+model_router: Optional[ModelRouter] = None
 
 def initialize_llm():
-    """Initialize LLM and tools. Called at FastAPI startup."""
-    global llm, toolkit, tools, tools_by_name, llm_with_tools
+    """Initialize the model router and tools. Called at FastAPI startup.
+
+    A chat model already assigned to `llm` (e.g. a local stand-in for tests or
+    benchmarks) becomes the only backend, and a `model_router` already set is
+    kept; only the tools are built and bound to them.
+    """
+    global llm, tools, tools_by_name, model_router
     
-    if llm is not None:
+    if tools_by_name is not None:
         return  # Already initialized
     
     print("🚀 Initializing LLM and tools...")
     
-    # Check if API key is set
-    if not os.environ.get("GOOGLE_API_KEY"):
-        raise RuntimeError(
-            "GOOGLE_API_KEY environment variable not set. "
-            "Please set it before starting the server: export GOOGLE_API_KEY=your_key"
-        )
-    
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0,
-    )
+    if model_router is None:
+        backends = [ModelBackend("default", llm)] if llm is not None else load_backends(MODEL_SPECS)
+        model_router = ModelRouter(backends, hedge=HEDGE, hedge_quantile=HEDGE_QUANTILE,
+                                   hedge_min_samples=HEDGE_MIN_SAMPLES)
+    if llm is None:
+        llm = model_router.backends[0].model  # the toolkit's query checker and warm-up use the first backend
     
-    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-    tools = toolkit.get_tools()
+    tools = build_tools(llm)
     
     # Create a dictionary for easy tool lookup (needed for our manual node)
     tools_by_name = {tool.name: tool for tool in tools}
     
-    llm_with_tools = llm.bind_tools(tools)
+    model_router.bind_tools(tools)
     
-    print(f"✅ LLM initialized with {len(tools)} tools")
+    names = ", ".join(f"{b.name} (tier {b.tier})" for b in model_router.backends)
+    print(f"✅ LLM initialized with {len(tools)} tools: {names}")
 
 # --- 3. Define the Graph State ---
 
@@ -69,18 +296,266 @@ class AgentState(TypedDict):
 
 # --- 4. Define the Nodes (Manually) ---
 
-def call_model(state: AgentState):
-    """The 'Brain' node: sends history to Gemini and gets a response."""
-    if llm_with_tools is None:
+async def call_model(state: AgentState):
+    """The 'Brain' node: sends history to the routed model and gets a response."""
+    if model_router is None:
         raise RuntimeError("LLM not initialized. Make sure GOOGLE_API_KEY is set.")
     messages = state["messages"]
-    response = llm_with_tools.invoke(messages)
+    question = next((message_text(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+    reason = escalation_reason(messages)
+    if reason is None and not is_simple_question(question, ROUTER_SIMPLE_WORDS):
+        reason = "complex_question"
+    tier = model_router.top_tier if reason else 0
+    budget = current_budget() or RunBudget(0, 0, 0)
+    # If another tools round would break `limit`, this is the last call: no
+    # tools, so the model has to answer
+    limit = budget.limit_ahead()
+    can_continue = limit is None
+    if not can_continue and not budget.allows_llm_call():
+        budget.exhausted = limit
+        answer = best_effort_answer(messages, limit)
+        emit_event("token", text=answer)  # no model tokens to stream
+        return {"messages": [AIMessage(content=answer)]}
+    if not can_continue:
+        messages = wrap_up_messages(messages)
+    with tracer.span("llm", messages=len(messages)) as span, LLM_SECONDS.time():
+        try:
+            budget.llm_calls += 1
+            routed = await model_router.ainvoke(messages, tier, tools=can_continue)
+            problem = answer_problem(routed.message)
+            if problem and routed.tier < model_router.top_tier and budget.allows_llm_call():
+                # The cheap tier's answer is unusable: ask the strongest tier instead
+                reason = problem
+                budget.llm_calls += 1
+                routed = await model_router.ainvoke(messages, model_router.top_tier, tools=can_continue)
+        except Exception:
+            ERRORS.inc(where="llm")
+            raise
+        response = routed.message
+        span.set(budget_exhausted=not can_continue)
+        if not can_continue:
+            budget.exhausted = limit
+            span.set(budget_limit=limit)
+            # Tool calls cannot run any more; keep only the text, or report what we have
+            text = message_text(response.content).strip()
+            response = AIMessage(content=text or best_effort_answer(state["messages"], limit),
+                                 usage_metadata=response.usage_metadata)
+        # /chat/stream gets the chosen reply only, never a hedge's losing call
+        # or a reply that was re-asked on the top tier
+        text = message_text(response.content)
+        if text:
+            emit_event("token", text=text)
+        usage = getattr(response, "usage_metadata", None) or {}
+        span.set(
+            model=routed.backend,
+            tier=routed.tier,
+            hedged=routed.hedged,
+            failed_over=routed.failed_over,
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            tool_calls=len(response.tool_calls or []),
+        )
+        if reason and routed.tier > min(model_router.tiers):
+            span.set(escalated=reason)
+            MODEL_ESCALATIONS.inc(reason=reason)
+    LLM_TOKENS.inc(usage.get("input_tokens", 0), kind="input")
+    LLM_TOKENS.inc(usage.get("output_tokens", 0), kind="output")
     return {"messages": [response]}
 
-def tool_node(state: AgentState):
+def wrap_up_messages(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """`messages` with the wrap-up instruction appended to the leading system message (or a new one)."""
+    if messages and isinstance(messages[0], SystemMessage):
+        return [SystemMessage(content=f"{message_text(messages[0].content)}\n\n{WRAP_UP_PROMPT}")] + messages[1:]
+    return [SystemMessage(content=WRAP_UP_PROMPT)] + messages
+
+def current_budget() -> Optional[RunBudget]:
+    """The running graph's `RunBudget` (None outside a run, or in a run started without one)."""
+    from langgraph.config import get_config
+    try:
+        return get_config().get("configurable", {}).get("budget")
+    except RuntimeError:
+        return None
+
+def emit_event(kind: str, **payload):
+    """Push a custom event to `/chat/stream` listeners (no-op outside a streamed run)."""
+    from langgraph.config import get_stream_writer
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return
+    writer({"event": kind, **payload})
+
+def message_text(content) -> str:
+    """Flatten message content (str or Gemini-style list of parts) to plain text."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return str(content or "")
+
+def run_query(query: str, source: str = "agent"):
+    """Execute `query` via the pool, `query_cache` and `query_guard`; raises sqlite3.Error or QueryRejected."""
+    read_only = is_read_only_sql(query)
+    key = canonicalize_sql(query)
+    with tracer.span("sql", fingerprint=fingerprint_id(fingerprint_sql(query))) as span:
+        version = database_version(DB_FILE)
+        result = query_cache.get(key, version) if read_only else None
+        span.set(cached=result is not None)
+        if result is None:
+            conn = db_pool.connection()
+            try:
+                statement = query_guard.prepare(conn, query)
+                span.set(rewritten=statement is not query)
+                with workload.timed(query, source=source) as timing, query_guard.budget(conn):
+                    result = execute_query(conn, statement, RESULT_STORE_MAX_ROWS)
+                    timing["rows"] = len(result)
+            except QueryRejected as e:
+                SQL_REJECTED.inc(reason=e.reason)
+                span.set(error=str(e))
+                raise
+            except sqlite3.Error as e:
+                ERRORS.inc(where="sql")
+                span.set(error=str(e))
+                raise
+            finally:
+                if not read_only:
+                    # Writes (or anything we can't prove read-only) flush the cache.
+                    query_cache.invalidate()
+            if read_only:
+                query_cache.put(key, result, version, size=result.nbytes)
+        span.set(rows=len(result))
+        SQL_ROWS.inc(len(result))
+    return result
+
+def sql_db_query(query: str) -> str:
+    """Run a SQL query via `run_query`; return the first page of rows."""
+    try:
+        result = run_query(query)
+    except QueryRejected as e:
+        return e.tool_error()
+    except sqlite3.Error as e:
+        return f"Error: {e}"
+    cursor_id = result_store.put(cursor_id_for(canonicalize_sql(query)), result)
+    return format_page(result, cursor_id, 0, TOOL_MAX_ROWS, TOOL_MAX_BYTES)
+
+def fetch_more(cursor_id: str, offset: int) -> str:
+    """Return the next page of a previous `sql_db_query` result."""
+    result = result_store.get(cursor_id)
+    if result is None:
+        return f"Error: cursor '{cursor_id}' has expired. Re-run the query with sql_db_query."
+    return format_page(result, cursor_id, offset, TOOL_MAX_ROWS, TOOL_MAX_BYTES)
+
+def build_tools(llm) -> list:
+    """SQLDatabaseToolkit tools, with `sql_db_query` replaced by the paged version plus `fetch_more`."""
+    from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+    from langchain_core.tools import StructuredTool
+    
+    init_database()
+    toolkit_tools = SQLDatabaseToolkit(db=db, llm=llm).get_tools()
+    paged_tools = [
+        StructuredTool.from_function(
+            func=sql_db_query,
+            name="sql_db_query",
+            description=(
+                "Input to this tool is a detailed and correct SQLite query, output is the result "
+                "as a compact table: a 'columns:' header line, then one line per row with values "
+                f"separated by ' | '. At most {TOOL_MAX_ROWS} rows are returned; if there are more, "
+                "the last line tells you how to call fetch_more. Prefer LIMIT and aggregates over "
+                "paging through large results. If the query is not correct, an error message "
+                "will be returned; rewrite the query, check it, and try again."
+            ),
+        ),
+        StructuredTool.from_function(
+            func=fetch_more,
+            name="fetch_more",
+            description=(
+                "Fetch the next page of rows of an earlier sql_db_query result. Input is the "
+                "cursor_id and offset printed on the last line of that result."
+            ),
+        ),
+    ]
+    return [t for t in toolkit_tools if t.name != "sql_db_query"] + paged_tools
+
+async def execute_tool(tool_name: str, tool_args) -> str:
+    """Run one tool on `tool_executor` (bounded by TOOL_TIMEOUT); errors come back as text."""
+    # 1. Find the tool
+    if tool_name not in tools_by_name:
+        return f"Error: Tool '{tool_name}' not found."
+    # 2. Run the tool; the copied context carries the request ID and current
+    # span into the worker thread
+    try:
+        tool_instance = tools_by_name[tool_name]
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, tool_instance.invoke, tool_args)
+        result = await asyncio.wait_for(
+            loop.run_in_executor(tool_executor, call),
+            timeout=TOOL_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        return f"Error executing tool: '{tool_name}' timed out after {TOOL_TIMEOUT:.0f}s."
+    except Exception as e:
+        return f"Error executing tool: {e}"
+    return str(result)
+
+def is_timeout(content: str) -> bool:
+    return content.startswith("Error executing tool:") and "timed out after" in content
+
+def tool_label(tool_name) -> str:
+    """Metric label for a model-supplied tool name: a registered tool, else "unknown" (bounded cardinality)."""
+    return tool_name if tools_by_name and tool_name in tools_by_name else "unknown"
+
+async def run_tool_call(tool_call) -> ToolMessage:
+    """Run a single tool call (or reuse an identical one from this run) and wrap the result as a ToolMessage."""
+    tool_name = tool_call["name"]
+    tool_args = tool_call["args"]
+    budget = current_budget() or RunBudget(memoize=False)
+    label = tool_label(tool_name)
+    
+    log.info(f"🛠️  Agent is calling tool: {tool_name}...")
+    emit_event("tool_start", id=tool_call["id"], name=tool_name, args=tool_args)
+    started = time.perf_counter()
+    
+    with tracer.span("tool", tool=tool_name) as span:
+        async def execute():
+            result = await execute_tool(tool_name, tool_args)
+            TOOL_SECONDS.observe(time.perf_counter() - started, tool=label)
+            return result
+        content, memo = await budget.memoized(memo_key(tool_name, tool_args), execute,
+                                              keep=lambda result: not is_timeout(result))
+        span.set(memo=memo)
+        if memo:
+            TOOL_MEMO_HITS.inc(tool=label)
+        elif content.startswith("Error"):
+            ERRORS.inc(where="tool")
+            span.set(error=content[:200])
+    elapsed = time.perf_counter() - started
+    emit_event(
+        "tool_end",
+        id=tool_call["id"],
+        name=tool_name,
+        elapsed_s=round(elapsed, 4),
+        memo=memo,
+        preview=content[:STREAM_PREVIEW_CHARS],
+    )
+    
+    # 3. Create a message acting as the tool's output
+    return ToolMessage(
+        tool_call_id=tool_call["id"],
+        name=tool_name,
+        content=content
+    )
+
+async def tool_node(state: AgentState):
     """
     The Manual 'Tool' node.
     This replaces 'from langgraph.prebuilt import ToolNode'
+
+    Tools are blocking (SQLite via SQLAlchemy), so they run on `tool_executor`
+    instead of the event loop. All tool calls of one LLM turn are independent
+    reads, so they run concurrently; results keep the original call order.
     """
     if tools_by_name is None:
         raise RuntimeError("Tools not initialized. Make sure GOOGLE_API_KEY is set.")
@@ -88,54 +563,46 @@ def tool_node(state: AgentState):
     messages = state["messages"]
     last_message = messages[-1]
     
-    results = []
-    
-    # Iterate over all tool calls requested by the LLM
-    for tool_call in last_message.tool_calls:
-        tool_name = tool_call["name"]
-        tool_args = tool_call["args"]
-        
-        print(f"   🛠️  Agent is calling tool: {tool_name}...")
+    # Run all tool calls requested by the LLM at once; gather preserves order
+    results = await asyncio.gather(*(run_tool_call(tc) for tc in last_message.tool_calls))
         
-        # 1. Find the tool
-        if tool_name not in tools_by_name:
-            result = f"Error: Tool '{tool_name}' not found."
-        else:
-            # 2. Run the tool
-            try:
-                tool_instance = tools_by_name[tool_name]
-                result = tool_instance.invoke(tool_args)
-            except Exception as e:
-                result = f"Error executing tool: {e}"
-        
-        # 3. Create a message acting as the tool's output
-        results.append(ToolMessage(
-            tool_call_id=tool_call["id"],
-            name=tool_name,
-            content=str(result)
-        ))
-        
-    return {"messages": results}
+    return {"messages": list(results)}
 
 def should_continue(state: AgentState):
     """The 'Decision' logic."""
     last_message = state["messages"][-1]
+    budget = current_budget()
     
-    # If the LLM returned a tool call, go to our manual 'tool_node'
-    if last_message.tool_calls:
+    # If the LLM returned a tool call, go to our manual 'tool_node' (while the
+    # run's step budget lasts; `call_model` normally stops asking for tools first)
+    if last_message.tool_calls and not (budget and budget.max_steps and budget.steps >= budget.max_steps):
         return "tools"
     # Otherwise, stop
+    from langgraph.graph import END
     return END
 
 # --- 5. Build the Graph (will be initialized at startup) ---
 
+def traced_step(name: str, node):
+    """Wrap a graph node in a span and the per-node latency histogram; counts the run's steps."""
+    @functools.wraps(node)
+    async def run(state: AgentState):
+        budget = current_budget()
+        if budget is not None:
+            budget.steps += 1
+        with tracer.span(f"graph.{name}"), STEP_SECONDS.time(node=name):
+            return await node(state)
+    return run
+
 def build_graph():
     """Build the LangGraph workflow. Called after LLM is initialized."""
+    from langgraph.graph import StateGraph, START
+    
     workflow = StateGraph(AgentState)
     
     # Add the two nodes
-    workflow.add_node("agent", call_model)
-    workflow.add_node("tools", tool_node) # We use our manual function here
+    workflow.add_node("agent", traced_step("agent", call_model))
+    workflow.add_node("tools", traced_step("tools", tool_node)) # We use our manual function here
     
     # Define the edges
     workflow.add_edge(START, "agent")
@@ -151,29 +618,116 @@ def build_graph():
 
 app = None  # Will be initialized at startup
 
-app = None  # Will be initialized at startup
-
 # --- Replace the old console loop with FastAPI setup ---
 
-from fastapi import FastAPI
-from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from pydantic import BaseModel
 
 # Define a simple Pydantic model for the request (optional but recommended)
-# from pydantic import BaseModel
 # class ChatRequest(BaseModel):
 #     question: str
 
+class BatchRequest(BaseModel):
+    questions: List[str]
+    parallelism: Optional[int] = None
+
+# --- Startup & warm-up ---
+# Optional warm-up before the worker accepts traffic: open one pooled SQLite
+# connection per tool thread plus the SQLAlchemy pool (AEGIS_WARMUP, on by
+# default) and send one tiny prompt to the model (AEGIS_WARMUP_MODEL, off by
+# default because it costs a model call).
+WARMUP = os.environ.get("AEGIS_WARMUP", "1") == "1"
+WARMUP_MODEL = os.environ.get("AEGIS_WARMUP_MODEL", "0") == "1"
+WARMUP_MODEL_TIMEOUT = float(os.environ.get("AEGIS_WARMUP_MODEL_TIMEOUT", "20"))
+startup_report = {}
+
+@contextmanager
+def startup_phase(name: str):
+    """Record how long one startup step took in `startup_report` (seconds)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_report[name] = round(time.perf_counter() - started, 4)
+
+async def warm_pool():
+    """Open a pooled connection on every tool thread and one SQLAlchemy connection."""
+    barrier = threading.Barrier(TOOL_WORKERS)
+    
+    def touch():
+        db_pool.connection().execute("SELECT 1").fetchone()
+        try:
+            # Hold this thread until the others have started, so each task lands on its own thread
+            barrier.wait(timeout=2)
+        except threading.BrokenBarrierError:
+            pass
+    
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(tool_executor, touch) for _ in range(TOOL_WORKERS)))
+    await loop.run_in_executor(tool_executor, db.run, "SELECT 1")
+
+async def warm_model():
+    """One tiny model call so connection setup and auth happen before the first request."""
+    try:
+        await asyncio.wait_for(llm.ainvoke([HumanMessage(content="Reply with OK.")]), timeout=WARMUP_MODEL_TIMEOUT)
+    except Exception as e:
+        log.warning(f"Model warm-up failed (continuing): {e}")
+
+async def start_monitor():
+    """Open the time-series store and schedule the canaries (no-op if AEGIS_MONITOR_DB is empty)."""
+    global monitor
+    if not MONITOR_DB:
+        return
+    store = TimeSeriesStore(MONITOR_DB, raw_retention=MONITOR_RAW_RETENTION,
+                            minute_retention=MONITOR_1M_RETENTION, hour_retention=MONITOR_1H_RETENTION)
+    baselines = BaselineStore(os.path.splitext(MONITOR_DB)[0] + "-baselines.json")
+    monitor = Monitor(DB_FILE, store, load_canaries(MONITOR_CANARIES), baselines, threshold=MONITOR_THRESHOLD,
+                      min_samples=MONITOR_MIN_SAMPLES, jitter=MONITOR_JITTER, timeout=TOOL_TIMEOUT,
+                      on_alert=lambda alert: MONITOR_ALERTS.inc(canary=alert["series"]))
+    await monitor.start()
+    print(f"✅ Monitoring {len(monitor.canaries)} canaries into {MONITOR_DB}")
+
 @asynccontextmanager
 async def lifespan(app_service: FastAPI):
     """Lifespan context for FastAPI startup and shutdown."""
-    # Startup: Initialize LLM and build graph
+    # Startup: open the database, initialize LLM, build graph, then warm up
     global app
-    initialize_llm()
-    app = build_graph()
+    startup_report["import"] = round(_IMPORT_DONE - _IMPORT_STARTED, 4)
+    with startup_phase("database"):
+        init_database()
+    with startup_phase("llm"):
+        initialize_llm()
+    with startup_phase("graph"):
+        app = build_graph()
+    with startup_phase("schema_digest"):
+        schema_digest.refresh(force=True)
+    print(f"✅ Schema digest ready ({len(schema_digest.text())} chars)")
+    if WARMUP:
+        with startup_phase("warmup_pool"):
+            await warm_pool()
+    if WARMUP_MODEL:
+        with startup_phase("warmup_model"):
+            await warm_model()
+    workload.start()
+    with startup_phase("monitor"):
+        await start_monitor()
+    startup_report["ready"] = round(time.perf_counter() - _IMPORT_STARTED, 4)
+    phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in startup_report.items() if name != "ready")
+    print(f"⏱️  Startup: {phases}; ready {startup_report['ready']:.2f}s after import began")
     print("✅ FastAPI app ready!")
     yield
     # Shutdown logic here if needed
     print("🛑 FastAPI app shutting down...")
+    if monitor is not None:
+        await monitor.stop()
+    tool_executor.shutdown(wait=False, cancel_futures=True)
+    advisor_executor.shutdown(wait=False, cancel_futures=True)
+    workload.stop()
+    if db is not None:
+        db._engine.dispose()
+        db_pool.close_all()
 
 # Initialize FastAPI application with lifespan
 app_service = FastAPI(
@@ -181,39 +735,424 @@ app_service = FastAPI(
     description="Exposes the LangGraph AEGIS Interaction Agent as a service.",
     lifespan=lifespan,
 )
+app_service.add_middleware(
+    RequestTracingMiddleware,
+    tracer=tracer,
+    latency=HTTP_SECONDS,
+    in_flight=HTTP_IN_FLIGHT,
+    errors=ERRORS,
+)
+
+def runtime_metrics():
+    """Collector for values that already live in the limiter, caches and stores."""
+    runs = run_limiter.stats()
+    yield "aegis_runs_in_flight", "gauge", "Graph runs executing.", [({}, runs["in_flight"])]
+    yield "aegis_runs_waiting", "gauge", "Graph runs queued for a slot.", [({}, runs["waiting"])]
+    yield "aegis_runs_rejected_total", "counter", "Runs rejected by admission control.", [
+        ({"reason": "queue_full"}, runs["rejected_queue_full"]),
+        ({"reason": "timeout"}, runs["rejected_timeout"]),
+    ]
+    yield "aegis_coalesced_requests_total", "counter", "Requests served by an identical in-flight run.", [
+        ({}, inflight.stats()["coalesced"])]
+    caches = {"answer": answer_cache.stats(), "query": query_cache.stats()}
+    yield "aegis_cache_hits_total", "counter", "Cache hits.", [({"cache": n}, c["hits"]) for n, c in caches.items()]
+    yield "aegis_cache_misses_total", "counter", "Cache misses.", [({"cache": n}, c["misses"]) for n, c in caches.items()]
+    yield "aegis_cache_hit_ratio", "gauge", "Cache hit ratio since start.", [
+        ({"cache": n}, c["hit_rate"]) for n, c in caches.items()]
+    yield "aegis_cache_entries", "gauge", "Cached entries.", [({"cache": n}, c["entries"]) for n, c in caches.items()]
+    templates = template_store.stats()
+    yield "aegis_template_lookups_total", "counter", "SQL template lookups by outcome.", [
+        ({"outcome": outcome}, templates[key]) for outcome, key in
+        (("hit", "hits"), ("miss", "misses"), ("low_confidence", "low_confidence"), ("fallback", "fallbacks"))]
+    if model_router is not None:
+        models = model_router.stats()["backends"]
+        yield "aegis_model_calls_total", "counter", "Model calls per backend and outcome.", [
+            ({"model": n, "outcome": o}, b["errors"] if o == "error" else b["calls"] - b["errors"])
+            for n, b in models.items() for o in ("ok", "error")]
+        yield "aegis_model_latency_p95_seconds", "gauge", "Recent p95 model latency per backend.", [
+            ({"model": n}, b["p95_s"]) for n, b in models.items() if b["p95_s"] is not None]
+        yield "aegis_model_hedges_total", "counter", "Calls that outlived their deadline and were hedged.", [
+            ({"model": n}, b["hedged"]) for n, b in models.items()]
+    yield "aegis_sessions", "gauge", "Live conversation sessions.", [({}, session_store.stats()["sessions"])]
+    yield "aegis_sql_statements_total", "counter", "SQL statements captured by the workload recorder.", [
+        ({}, workload.stats()["recorded"])]
+
+metrics.add_collector(runtime_metrics)
+run_limiter.on_admit = QUEUE_WAIT_SECONDS.observe
+
+def overload_error(e: LimiterRejected) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(int(e.retry_after))},
+    )
+
+async def answer_from_template(question: str):
+    """(answer, template id) from a confident SQL template, or None to fall back to the graph."""
+    match = template_store.match(question)
+    if match is None:
+        return None
+    loop = asyncio.get_running_loop()
+    with tracer.span("template", template=match.id) as span:
+        call = functools.partial(contextvars.copy_context().run, run_query, match.sql, "template")
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(tool_executor, call), timeout=TOOL_TIMEOUT)
+        except (sqlite3.Error, QueryRejected, asyncio.TimeoutError) as e:
+            template_store.record_fallback(match, failed=True)
+            span.set(fallback="error")
+            log.warning(f"Template {match.id} failed, falling back to the agent: {e!r}")
+            return None
+        if not result.rows:
+            # A wrong literal looks the same as a genuine "none": let the model answer it
+            template_store.record_fallback(match)
+            span.set(fallback="empty")
+            return None
+        template_store.record_hit(match)
+        span.set(rows=len(result))
+    return format_answer(result, TOOL_MAX_ROWS), match.id
+
+def learn_template(question: str, turn: List[BaseMessage]):
+    """Teach `template_store` the SQL behind a successful run, if it used exactly one query."""
+    sql = answer_sql(turn)
+    if sql is not None:
+        template_store.learn(question, sql)
+
+async def answer_without_model(question: str, cache_key: str, db_version) -> Optional[dict]:
+    """A first-turn answer from the answer cache or a confident SQL template, or None."""
+    cached = answer_cache.get(cache_key, db_version)
+    if cached is not None:
+        return {"response": cached, "cached": True}
+    # Known question shapes run their learned SQL directly (no LLM calls)
+    served = await answer_from_template(question)
+    if served is not None:
+        return {"response": served[0], "cached": False, "template": served[1]}
+    return None
+
+def finish_run(budget: RunBudget) -> dict:
+    """Record a finished run's step counts (metrics and the request span); returns them."""
+    stats = budget.stats()
+    RUN_STEPS.observe(budget.steps)
+    RUN_LLM_CALLS.observe(budget.llm_calls)
+    if budget.exhausted:
+        RUNS_CUT_SHORT.inc(reason=budget.exhausted)
+    tracer.annotate(**{f"run_{k}": v for k, v in stats.items()})
+    return stats
+
+async def run_graph(prefix: List[BaseMessage], question: str, cache_key: str, db_version, first_turn: bool):
+    """Run the graph (bounded by the run limiter); returns (answer, new turn messages, run step counts).
+
+    A first-turn answer teaches the template store and goes into the answer
+    cache. Concurrent identical first-turn questions share one run.
+    """
+    run = functools.partial(_run_graph, prefix, question, cache_key, db_version, first_turn)
+    if not (first_turn and COALESCE):
+        return await run()
+    (final_response, turn, steps), shared = await inflight.do((cache_key, db_version), run)
+    if shared:
+        # Every model turn of the leader's run is one call this request did not make
+        MODEL_CALLS_SAVED.inc(sum(1 for m in turn if isinstance(m, AIMessage)))
+        tracer.annotate(coalesced=True)
+    return final_response, turn, steps
+
+async def _run_graph(prefix: List[BaseMessage], question: str, cache_key: str, db_version, first_turn: bool):
+    config = new_run_config()
+    async with run_limiter.slot():
+        final_state = await app.ainvoke({"messages": prefix + [HumanMessage(content=question)]}, config=config)
+    steps = finish_run(config["configurable"]["budget"])
+    
+    # Get the content of the last message (which is the final answer)
+    final_response = final_state["messages"][-1].content
+    turn = final_state["messages"][len(prefix):]
+    # A run cut short by its budget has a best-effort answer: do not reuse it
+    if final_response and first_turn and not steps["exhausted"]:
+        learn_template(question, turn)
+        # Only cache if the database did not change while we were answering
+        if database_version(DB_FILE) == db_version:
+            answer_cache.put(cache_key, final_response, db_version)
+    return final_response, turn, steps
 
 @app_service.post("/chat")
-async def chat_endpoint(question: str):
-    """Chat endpoint that uses the LangGraph agent to answer questions."""
+async def chat_endpoint(question: str, session_id: Optional[str] = None):
+    """Chat endpoint that uses the LangGraph agent to answer questions.
+
+    Pass the returned `session_id` back to ask follow-up questions in the same
+    conversation; omit it to start a new one.
+    """
     if app is None:
         return {"response": "Error: Agent not initialized. Check server logs."}
     
-    # Use the same system instruction as before
-    sys_msg = SystemMessage(content="You are a helpful SQL assistant. You have access to a database. Use the tools to answer user questions.")
-    
-    # Run the graph with the new user input
-    initial_state = {"messages": [sys_msg, HumanMessage(content=question)]}
+    session = session_store.get_or_create(session_id)
+    async with session.lock:
+        # Serve repeat questions and known shapes without LLM calls. Only a
+        # session's first question is context-free enough to share answers.
+        cache_key = normalize_question(question)
+        db_version = database_version(DB_FILE)
+        first_turn = not session.messages
+        shortcut = await answer_without_model(question, cache_key, db_version) if first_turn else None
+        if shortcut is not None:
+            session_store.append_turn(session, [HumanMessage(content=question), AIMessage(content=shortcut["response"])])
+            return {**shortcut, "session_id": session.id}
+        
+        # System instruction with the schema digest, then the (compacted) history
+        prefix = [build_system_message()] + session.messages
+        
+        # Run the graph asynchronously, bounded by the run limiter
+        try:
+            final_response, turn, steps = await run_graph(prefix, question, cache_key, db_version, first_turn)
+            session_store.append_turn(session, turn)
+            return {"response": final_response, "cached": False, "session_id": session.id, "run": steps}
+
+        except LimiterRejected as e:
+            raise overload_error(e)
+        except Exception as e:
+            ERRORS.inc(where="graph")
+            log.error(f"Error executing graph: {e}")
+            return {"response": f"An error occurred: {str(e)}", "session_id": session.id}
+
+def sse_event(kind: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_chat_events(question: str, session, cache_key: str, db_version, held: AsyncExitStack):
+    """Run the graph and yield SSE frames: tool_start/tool_end, token, then done (or error)."""
+    turn = [HumanMessage(content=question)]
+    initial_state = {"messages": [build_system_message()] + session.messages + turn}
+    final_response = ""
+    config = new_run_config()
+    try:
+        # Tool progress and the text of each chosen model reply arrive as custom events
+        async for mode, chunk in app.astream(initial_state, config=config, stream_mode=["updates", "custom"]):
+            if mode == "custom":
+                yield sse_event(chunk["event"], {k: v for k, v in chunk.items() if k != "event"})
+            elif mode == "updates":
+                for node_update in chunk.values():
+                    turn.extend((node_update or {}).get("messages", []))
+                if "agent" in chunk:
+                    last = chunk["agent"]["messages"][-1]
+                    if not last.tool_calls:
+                        final_response = message_text(last.content)
+        
+        steps = finish_run(config["configurable"]["budget"])
+        first_turn = not session.messages
+        session_store.append_turn(session, turn)
+        if final_response and first_turn and not steps["exhausted"]:
+            learn_template(question, turn)
+            if database_version(DB_FILE) == db_version:
+                answer_cache.put(cache_key, final_response, db_version)
+        yield sse_event("done", {"response": final_response, "cached": False, "session_id": session.id,
+                                 "run": steps})
+    except asyncio.CancelledError:
+        raise  # client went away
+    except Exception as e:
+        ERRORS.inc(where="graph")
+        log.error(f"Error executing graph: {e}")
+        yield sse_event("error", {"error": str(e), "session_id": session.id})
+    finally:
+        await held.aclose()
+
+class HeldStreamingResponse(StreamingResponse):
+    """A StreamingResponse that releases `held` however the response ends.
+
+    The body generator's own `finally` never runs if the client disconnects
+    (or the request is cancelled) before its first `__anext__`, and a
+    BackgroundTask is skipped on disconnect, so release here as well;
+    closing an already-closed AsyncExitStack is a no-op.
+    """
+
+    def __init__(self, content, held: AsyncExitStack, **kwargs):
+        super().__init__(content, **kwargs)
+        self.held = held
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.held.aclose()
+
+@app_service.post("/chat/stream")
+async def chat_stream_endpoint(question: str, session_id: Optional[str] = None):
+    """Server-sent events version of /chat: tool progress as it happens, then the text of each model reply."""
+    if app is None:
+        raise HTTPException(status_code=503, detail="Agent not initialized. Check server logs.")
     
-    final_response = "Error: Could not process request."
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    session = session_store.get_or_create(session_id)
     
-    # Run the stream to execute the graph
+    # Hold the session lock and a run slot for the whole stream; take the slot
+    # before answering so overload is still a plain 429/503
+    held = AsyncExitStack()
+    await held.enter_async_context(session.lock)
     try:
-        # NOTE: Using a simple invoke() might be easier than stream() for a basic API endpoint
-        final_state = app.invoke(initial_state)
+        cache_key = normalize_question(question)
+        db_version = database_version(DB_FILE)
+        shortcut = await answer_without_model(question, cache_key, db_version) if not session.messages else None
+        if shortcut is not None:
+            session_store.append_turn(session, [HumanMessage(content=question), AIMessage(content=shortcut["response"])])
+            await held.aclose()
+            async def replay():
+                yield sse_event("token", {"text": shortcut["response"]})
+                yield sse_event("done", {**shortcut, "session_id": session.id})
+            return StreamingResponse(replay(), media_type="text/event-stream", headers=headers)
         
-        # Get the content of the last message (which is the final answer)
-        final_response = final_state["messages"][-1].content
-        
-        return {"response": final_response}
+        await held.enter_async_context(run_limiter.slot())
+    except LimiterRejected as e:
+        await held.aclose()
+        raise overload_error(e)
+    return HeldStreamingResponse(
+        stream_chat_events(question, session, cache_key, db_version, held),
+        held,
+        media_type="text/event-stream",
+        headers=headers,
+    )
 
-    except Exception as e:
-        print(f"Error executing graph: {e}")
-        return {"response": f"An error occurred: {str(e)}"}
+@app_service.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchRequest):
+    """Answer many independent questions; one NDJSON line per question as it completes, then a summary line.
+
+    Near-identical questions (same words apart from case, punctuation and
+    filler) are answered once and reported with `duplicate_of`. At most
+    `parallelism` questions run at a time (default `AEGIS_BATCH_PARALLELISM`,
+    capped at `AEGIS_MAX_IN_FLIGHT`), all sharing one system message.
+    """
+    if app is None:
+        raise HTTPException(status_code=503, detail="Agent not initialized. Check server logs.")
+    questions = request.questions
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+    parallelism = min(max(1, request.parallelism or BATCH_PARALLELISM), MAX_IN_FLIGHT)
+    groups = dedupe_questions(questions)
+    BATCH_QUESTIONS.inc(len(groups), kind="unique")
+    BATCH_QUESTIONS.inc(len(questions) - len(groups), kind="duplicate")
+    
+    # One schema-digest system message shared by every question in the batch
+    sys_msg = build_system_message()
+    
+    async def answer(group):
+        question = questions[group[0]]
+        cache_key = normalize_question(question)
+        db_version = database_version(DB_FILE)
+        shortcut = await answer_without_model(question, cache_key, db_version)
+        if shortcut is not None:
+            return shortcut
+        final_response, _, steps = await run_graph([sys_msg], question, cache_key, db_version, first_turn=True)
+        return {"response": final_response, "cached": False, "run": steps}
+    
+    async def results():
+        started = time.perf_counter()
+        errors = 0
+        async for (first, indexes), result, error, elapsed in run_concurrently(groups, answer, parallelism):
+            if error is not None:
+                errors += len(indexes)
+                result = {"error": str(error)}
+                if isinstance(error, LimiterRejected):
+                    result["status"] = error.status_code
+                else:
+                    ERRORS.inc(where="graph")
+                    log.error(f"Error executing graph: {error}")
+            for i in indexes:
+                line = {"index": i, "question": questions[i], **result, "elapsed_s": round(elapsed, 4)}
+                if i != first:
+                    line["duplicate_of"] = first
+                yield json.dumps(line, default=str) + "\n"
+        yield json.dumps({
+            "done": True,
+            "questions": len(questions),
+            "unique": len(groups),
+            "errors": errors,
+            "parallelism": parallelism,
+            "elapsed_s": round(time.perf_counter() - started, 4),
+        }) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @app_service.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "ok", "message": "AEGIS Agent API is running"}
+    return {
+        "status": "ok",
+        "message": "AEGIS Agent API is running",
+        "runs": run_limiter.stats(),
+        "coalescing": {**inflight.stats(), "model_calls_saved": MODEL_CALLS_SAVED.value()},
+        "answer_cache": answer_cache.stats(),
+        "query_cache": query_cache.stats(),
+        "sql_guard": query_guard.stats(),
+        "result_store": result_store.stats(),
+        "templates": template_store.stats(),
+        "sessions": session_store.stats(),
+        "db_pool": {**db_pool.stats(), "sqlalchemy": db._engine.pool.status()} if db is not None else None,
+        "models": model_router.stats() if model_router is not None else None,
+        "startup": startup_report,
+        "workload": workload.stats(),
+        "monitor": monitor.stats() if monitor is not None else None,
+    }
+
+@app_service.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics (text exposition format)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app_service.get("/traces")
+async def traces_endpoint(limit: int = 20):
+    """Span-time breakdown of the most recent requests (newest first)."""
+    return {"traces": tracer.recent(limit)}
+
+@app_service.get("/traces/{request_id}")
+async def trace_endpoint(request_id: str):
+    """All spans recorded for one request (IDs come from the X-Request-ID header)."""
+    spans = tracer.trace(request_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail=f"No trace for request '{request_id}'.")
+    return {"request_id": request_id, "spans": spans}
+
+@app_service.get("/templates")
+async def templates_endpoint(limit: int = 20):
+    """Learned question patterns with their SQL templates, support and usage."""
+    return {"templates": template_store.top(limit), "stats": template_store.stats()}
+
+@app_service.get("/monitor")
+async def monitor_endpoint(resolution: str = "1m", since_s: float = 3600, alerts: int = 20):
+    """Canary status, recent alerts and each canary's series (`raw`, `1m` or `1h`) over the last `since_s` seconds."""
+    if monitor is None:
+        raise HTTPException(status_code=404, detail="Monitoring is disabled (AEGIS_MONITOR_DB is empty).")
+    if resolution not in ("raw", "1m", "1h"):
+        raise HTTPException(status_code=400, detail=f"Unknown resolution '{resolution}'.")
+    since = time.time() - since_s
+    loop = asyncio.get_running_loop()
+    series = {c.name: await loop.run_in_executor(None, monitor.store.points, c.name, resolution, since)
+              for c in monitor.canaries}
+    return {
+        "stats": monitor.stats(),
+        "canaries": monitor.last,
+        "alerts": await loop.run_in_executor(None, monitor.store.alerts, alerts),
+        "series": series,
+    }
+
+@app_service.get("/workload")
+async def workload_endpoint(limit: int = 20, by: str = "total_time_s"):
+    """Most expensive captured query fingerprints (by total time, calls, rows, ...)."""
+    if by not in ("total_time_s", "mean_time_s", "max_time_s", "calls", "rows", "errors"):
+        raise HTTPException(status_code=400, detail=f"Unknown sort key '{by}'.")
+    return {"top": workload.top(limit, by=by), "stats": workload.stats()}
+
+@app_service.post("/workload/indexes")
+async def index_advice(limit: int = 20):
+    """Index recommendations for the top captured fingerprints (measured on a scratch copy; nothing is applied).
+
+    The report is reused until the captured query shapes or the database change.
+    """
+    queries = workload_from_recorder(workload.top(limit))
+    key = (tuple(q.sql for q in queries), database_version(DB_FILE))
+    report = index_advice_cache.get(key)
+    cached = report is not None
+    if not cached:
+        loop = asyncio.get_running_loop()
+        run = functools.partial(loop.run_in_executor, advisor_executor, IndexAdvisor(DB_FILE, guard=advisor_guard).analyze, queries)
+        report, cached = await advice_flight.do(key, run)
+        index_advice_cache.clear()
+        index_advice_cache[key] = report
+    return {"candidates": report["candidates"], "winners": report["winners"], "cached": cached}
+
+_IMPORT_DONE = time.perf_counter()
 
 if __name__ == "__main__":
     # Remove the old console loop and replace with uvicorn start command
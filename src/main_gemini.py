@@ -1,14 +1,20 @@
 import sqlite3
 import os
+import sys
 import operator
 from typing import Annotated, TypedDict, List
 
 # --- Imports for LangChain ---
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, ToolMessage
 
+# Run directly (`python src/main_gemini.py`): make the repository root importable for `src.*`
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from src.models import build_chat_model
+
 # --- Imports for LangGraph ---
 # Note: We are NOT importing ToolNode anymore to avoid your error
 from langgraph.graph import StateGraph, END, START
@@ -25,10 +31,7 @@ db = SQLDatabase.from_uri(f"sqlite:///{DB_FILE}")
 
 # --- 2. Define the Tools & LLM ---
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0,
-)
+llm = build_chat_model("gemini", "gemini-2.5-flash")
 
 toolkit = SQLDatabaseToolkit(db=db, llm=llm)
 tools = toolkit.get_tools()
@@ -1,11 +1,17 @@
 import sqlite3
 import os
+import sys
 from typing import TypedDict, List
 from langchain_community.utilities import SQLDatabase
 from langchain_openai import ChatOpenAI
 from langchain.agents import create_sql_agent, AgentExecutor
 from langgraph.graph import StateGraph, END
-from langchain_openai import AzureChatOpenAI
+
+# Run directly (`python src/main_openai.py`): make the repository root importable for `src.*`
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from src.models import build_chat_model
 
 # --- Environment Setup (IMPORTANT) ---
 # Make sure to set your OpenAI API key in your environment variables
@@ -29,7 +35,7 @@ db = SQLDatabase.from_uri(f"sqlite:///{DB_FILE}")
 # 2. LLM Setup
 api_version = "2024-02-01"
 model_name = "gpt-4"
-llm = AzureChatOpenAI(model=model_name, azure_deployment=model_name, api_version=api_version, max_tokens=2000, temperature=0.0)
+llm = build_chat_model("azure_openai", model_name, api_version=api_version, max_tokens=2000)
 
 # Create the pre-built LangChain SQL Agent
 # This agent already knows how to use tools to:
@@ -0,0 +1,307 @@
+"""Model backends and the latency-aware router behind `call_model`.
+
+Backends are configured once, with `AEGIS_MODELS`: a JSON list, or the path of
+a file holding one, of `{"name", "provider", "model", "tier", ...}`. Supported
+providers are `gemini`, `azure_openai` and `scripted` (a local stand-in that
+replays a scenario file). The router then decides, per model call:
+
+- **Tier.** Simple questions (`is_simple_question`) start on the cheapest
+  tier (tier 0); longer ones start on the top tier. A run escalates to
+  the top tier once one of its SQL tool calls failed, or the model produced
+  an invalid tool call (`escalation_reason`). So does a single call whose
+  answer fails validation (`answer_problem`: a final answer with no text).
+- **Backend within a tier.** The lowest recent median latency wins. Backends
+  whose recent error rate exceeds `max_error_rate` go last, and backends
+  without samples go first, so they get measured.
+- **Hedging.** If the chosen backend has not answered within its own recent
+  p95 latency (`hedge_quantile`, after `hedge_min_samples` calls), the same
+  request is sent to a backup, preferably from another provider. The first
+  success wins and the other request is cancelled. A backend that fails
+  outright fails over to the backup immediately.
+
+Per-backend latency windows, error rates, hedges and failovers are reported
+by `stats()`. The router is used from the event loop only, so it needs no lock.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+DEFAULT_MODELS = [{"name": "gemini-2.5-flash", "provider": "gemini", "model": "gemini-2.5-flash", "tier": 0}]
+
+
+def build_chat_model(provider: str, model: str, **options):
+    """A LangChain chat model for `provider` (the SDK is imported only when used)."""
+    if provider == "gemini":
+        if not os.environ.get("GOOGLE_API_KEY"):
+            raise RuntimeError(
+                "GOOGLE_API_KEY environment variable not set. "
+                "Please set it before starting the server: export GOOGLE_API_KEY=your_key"
+            )
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=model, temperature=options.pop("temperature", 0), **options)
+    if provider == "azure_openai":
+        try:
+            from langchain_openai import AzureChatOpenAI
+        except ImportError as e:
+            raise RuntimeError(
+                "The azure_openai provider needs the langchain-openai package: pip install langchain-openai"
+            ) from e
+        return AzureChatOpenAI(
+            model=model,
+            azure_deployment=options.pop("deployment", model),
+            api_version=options.pop("api_version", os.environ.get("OPENAI_API_VERSION", "2024-02-01")),
+            temperature=options.pop("temperature", 0.0),
+            **options,
+        )
+    if provider == "scripted":
+        from benchmarks.scripted_model import ScriptedChatModel, load_scenarios
+        return ScriptedChatModel(scenarios=load_scenarios(model), **options)
+    raise ValueError(f"Unknown model provider '{provider}'.")
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+def escalation_reason(messages: List[BaseMessage]) -> Optional[str]:
+    """Why the current run should use the strongest tier: a failed tool call or an invalid tool call."""
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+    for message in messages[last_human + 1:]:
+        if isinstance(message, ToolMessage) and _text(message.content).startswith("Error"):
+            return "sql_error"
+        if isinstance(message, AIMessage) and getattr(message, "invalid_tool_calls", None):
+            return "invalid_tool_call"
+    return None
+
+
+def answer_problem(message: AIMessage) -> Optional[str]:
+    """Why a model reply cannot be used as is, or None."""
+    if getattr(message, "invalid_tool_calls", None):
+        return "invalid_tool_call"
+    if not message.tool_calls and not _text(message.content).strip():
+        return "empty_answer"
+    return None
+
+
+def is_simple_question(question: str, max_words: int) -> bool:
+    """Questions of at most `max_words` words start on the cheap tier (`max_words <= 0`: all of them)."""
+    return max_words <= 0 or len(question.split()) <= max_words
+
+
+class ModelBackend:
+    """One configured model, with a sliding window of its recent latencies and outcomes."""
+
+    def __init__(self, name: str, model, provider: str = "custom", tier: int = 0, window: int = 200):
+        self.name = name
+        self.model = model
+        self.provider = provider
+        self.tier = tier
+        self.bound = model
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)  # True for an error
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.hedged = 0  # calls that outlived their deadline and got a backup request
+        self.backup_calls = 0
+        self.backup_wins = 0
+
+    def bind_tools(self, tools) -> None:
+        self.bound = self.model.bind_tools(tools)
+
+    def record(self, latency: float, error: bool) -> None:
+        self.calls += 1
+        self.errors += int(error)
+        self.outcomes.append(error)
+        if not error:
+            self.latencies.append(latency)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        if len(self.latencies) < max(1, min_samples):
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "provider": self.provider,
+            "tier": self.tier,
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 4),
+            "p50_s": self.quantile(0.5),
+            "p95_s": self.quantile(0.95),
+            "in_flight": self.in_flight,
+            "hedged": self.hedged,
+            "backup_calls": self.backup_calls,
+            "backup_wins": self.backup_wins,
+        }
+
+
+def load_backends(spec: Optional[str] = None, window: int = 200) -> List[ModelBackend]:
+    """Backends from `AEGIS_MODELS`-style JSON (inline or a file path); Gemini Flash if empty."""
+    if not spec:
+        items = DEFAULT_MODELS
+    elif os.path.exists(spec):
+        with open(spec) as f:
+            items = json.load(f)
+    else:
+        items = json.loads(spec)
+    backends = []
+    for item in items:
+        options = {k: v for k, v in item.items() if k not in ("name", "provider", "model", "tier")}
+        model = build_chat_model(item["provider"], item["model"], **options)
+        backends.append(ModelBackend(item.get("name", item["model"]), model, item["provider"],
+                                     int(item.get("tier", 0)), window))
+    return backends
+
+
+class RoutedResponse(NamedTuple):
+    message: AIMessage
+    backend: str
+    tier: int
+    hedged: bool
+    failed_over: bool
+
+
+class ModelRouter:
+    """Pick a backend per call by tier and recent latency; hedge slow calls, fail over on errors.
+
+    - `hedge`: send a backup request once a call outlives its deadline, which
+      is `hedge_factor` times the backend's `hedge_quantile` latency (at least
+      `hedge_floor_s`). There is no deadline until `hedge_min_samples` calls
+      have been measured.
+    - `max_error_rate`: backends above it are tried last.
+    """
+
+    def __init__(self, backends: List[ModelBackend], hedge: bool = True, hedge_quantile: float = 0.95,
+                 hedge_min_samples: int = 20, hedge_factor: float = 1.0, hedge_floor_s: float = 0.0,
+                 max_error_rate: float = 0.5):
+        if not backends:
+            raise ValueError("ModelRouter needs at least one backend")
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_factor = hedge_factor
+        self.hedge_floor_s = hedge_floor_s
+        self.max_error_rate = max_error_rate
+        self.tiers = sorted({b.tier for b in backends})
+        self.failovers = 0
+        self.hedges = 0
+
+    @property
+    def top_tier(self) -> int:
+        return self.tiers[-1]
+
+    def bind_tools(self, tools) -> None:
+        for backend in self.backends:
+            backend.bind_tools(tools)
+
+    def resolve_tier(self, tier: int) -> int:
+        """The lowest configured tier at or above `tier` (the top tier if none)."""
+        return next((t for t in self.tiers if t >= tier), self.top_tier)
+
+    def _rank_key(self, backend: ModelBackend):
+        p50 = backend.quantile(0.5)
+        return (backend.error_rate > self.max_error_rate, p50 if p50 is not None else 0.0, backend.name)
+
+    def ranked(self, tier: int) -> List[ModelBackend]:
+        return sorted((b for b in self.backends if b.tier == tier), key=self._rank_key)
+
+    def backup_for(self, primary: ModelBackend) -> Optional[ModelBackend]:
+        """Another backend of the same tier (another provider first), else the nearest tier, stronger first."""
+        others = [b for b in self.backends if b is not primary]
+        if not others:
+            return None
+        return min(others, key=lambda b: (abs(b.tier - primary.tier), b.tier < primary.tier,
+                                          b.provider == primary.provider, self._rank_key(b)))
+
+    def deadline(self, backend: ModelBackend) -> Optional[float]:
+        p = backend.quantile(self.hedge_quantile, self.hedge_min_samples)
+        return None if p is None else max(self.hedge_floor_s, p * self.hedge_factor)
+
+    async def _call(self, backend: ModelBackend, messages: List[BaseMessage], tools: bool = True) -> AIMessage:
+        started = time.perf_counter()
+        backend.in_flight += 1
+        try:
+            response = await (backend.bound if tools else backend.model).ainvoke(messages)
+        except asyncio.CancelledError:
+            # The loser of a hedge: its latency is at least this long
+            backend.latencies.append(time.perf_counter() - started)
+            raise
+        except Exception:
+            backend.record(time.perf_counter() - started, error=True)
+            raise
+        finally:
+            backend.in_flight -= 1
+        backend.record(time.perf_counter() - started, error=False)
+        return response
+
+    async def ainvoke(self, messages: List[BaseMessage], tier: int = 0, tools: bool = True) -> RoutedResponse:
+        """The first successful reply on `tier`; `tools=False` calls the models without tools bound."""
+        tier = self.resolve_tier(tier)
+        primary = self.ranked(tier)[0]
+        backup = self.backup_for(primary)
+        first = asyncio.ensure_future(self._call(primary, messages, tools))
+        deadline = self.deadline(primary) if self.hedge and backup is not None else None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=deadline)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            try:
+                return RoutedResponse(first.result(), primary.name, tier, False, False)
+            except Exception:
+                if backup is None:
+                    raise
+            self.failovers += 1
+            backup.backup_calls += 1
+            response = await self._call(backup, messages, tools)
+            backup.backup_wins += 1
+            return RoutedResponse(response, backup.name, backup.tier, False, True)
+
+        primary.hedged += 1
+        backup.backup_calls += 1
+        self.hedges += 1
+        second = asyncio.ensure_future(self._call(backup, messages, tools))
+        owners = {first: primary, second: backup}
+        pending = set(owners)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = owners[task]
+                        if winner is backup:
+                            backup.backup_wins += 1
+                        return RoutedResponse(task.result(), winner.name, winner.tier, True, False)
+                    error = error or task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        raise error
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "tiers": self.tiers,
+            "hedge": self.hedge,
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "backends": {b.name: {**b.stats(), "deadline_s": self.deadline(b)} for b in self.backends},
+        }
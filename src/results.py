@@ -0,0 +1,169 @@
+"""Paged, token-budgeted SQL results for the Interaction Agent.
+
+`str()` of a full row set can put tens of thousands of rows into the prompt.
+Instead, `sql_db_query` materializes the result once, keeps it server-side in
+a `ResultStore` under a short cursor handle and returns only the first page in
+a compact tabular encoding (header once, then one line per row). The model
+pages through the rest with the `fetch_more` tool.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+NULL = "NULL"
+
+
+class QueryResult:
+    """Materialized result of one statement."""
+
+    __slots__ = ("columns", "rows", "truncated", "nbytes")
+
+    def __init__(self, columns: Sequence[str], rows: List[Tuple[Any, ...]], truncated: bool = False):
+        self.columns = list(columns)
+        self.rows = rows
+        self.truncated = truncated  # more rows existed than the store keeps
+        self.nbytes = estimate_bytes(self.columns, rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def estimate_bytes(columns: Sequence[str], rows: List[Tuple[Any, ...]], sample: int = 200) -> int:
+    """Approximate text size of a row set, extrapolated from a sample of rows."""
+    header = sum(len(c) + 3 for c in columns)
+    if not rows:
+        return header
+    head = rows[:sample]
+    per_row = sum(len(format_value(v)) + 3 for row in head for v in row) / len(head)
+    return header + int(per_row * len(rows))
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return NULL
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    text = str(value)
+    return text.replace("\n", " ").replace("|", "/")
+
+
+def execute_query(conn: sqlite3.Connection, sql: str, max_rows: int) -> QueryResult:
+    """Run `sql` and keep at most `max_rows` rows (flagging truncation)."""
+    cur = conn.cursor()
+    try:
+        cur.execute(sql)
+        columns = [d[0] for d in cur.description] if cur.description else []
+        rows = cur.fetchmany(max_rows + 1) if columns else []
+    finally:
+        cur.close()
+    truncated = len(rows) > max_rows
+    return QueryResult(columns, rows[:max_rows], truncated=truncated)
+
+
+def format_page(
+    result: QueryResult,
+    cursor_id: Optional[str],
+    offset: int = 0,
+    max_rows: int = 50,
+    max_bytes: int = 8000,
+) -> str:
+    """Render rows[offset:] as a compact table, stopping at `max_rows` or `max_bytes`."""
+    if not result.columns:
+        return "Statement executed; it returned no result set."
+    total = len(result.rows)
+    if total == 0:
+        return f"columns: {' | '.join(result.columns)}\n(0 rows)"
+
+    offset = max(0, min(offset, total))
+    lines = [f"columns: {' | '.join(result.columns)}"]
+    used = len(lines[0])
+    end = offset
+    while end < total and end - offset < max_rows:
+        line = " | ".join(format_value(v) for v in result.rows[end])
+        if end > offset and used + len(line) + 1 > max_bytes:
+            break
+        if len(line) > max_bytes:
+            line = line[: max_bytes - 3] + "..."
+        lines.append(line)
+        used += len(line) + 1
+        end += 1
+
+    if offset == 0 and end == total and not result.truncated:
+        lines.append(f"({total} row{'s' if total != 1 else ''})")
+        return "\n".join(lines)
+
+    total_label = f"{total}+" if result.truncated else str(total)
+    footer = f"[rows {offset + 1}-{end} of {total_label}"
+    if end < total and cursor_id:
+        footer += f"; more: fetch_more(cursor_id=\"{cursor_id}\", offset={end})"
+    elif result.truncated:
+        footer += "; result was cut off server-side, add a LIMIT or aggregate"
+    lines.append(footer + "]")
+    return "\n".join(lines)
+
+
+def cursor_id_for(key: str) -> str:
+    """Stable short handle for a canonical SQL key (same query, same cursor)."""
+    return "c_" + hashlib.blake2b(key.encode("utf-8"), digest_size=5).hexdigest()
+
+
+class ResultStore:
+    """Server-side home of full results behind cursor handles.
+
+    Bounded by total estimated bytes (LRU eviction) and by idle time (`ttl`).
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 900.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[QueryResult, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.pages_served = 0
+
+    def put(self, cursor_id: str, result: QueryResult) -> Optional[str]:
+        """Keep `result` under `cursor_id`; returns None if it can never fit."""
+        if result.nbytes > self.max_bytes:
+            return None
+        with self._lock:
+            old = self._entries.pop(cursor_id, None)
+            if old is not None:
+                self._bytes -= old[0].nbytes
+            self._entries[cursor_id] = (result, time.monotonic())
+            self._bytes += result.nbytes
+            self._evict_locked()
+        return cursor_id
+
+    def get(self, cursor_id: str) -> Optional[QueryResult]:
+        with self._lock:
+            entry = self._entries.get(cursor_id)
+            if entry is None:
+                return None
+            result, _ = entry
+            self._entries[cursor_id] = (result, time.monotonic())
+            self._entries.move_to_end(cursor_id)
+            self.pages_served += 1
+            return result
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            cursor_id, (result, touched) = next(iter(self._entries.items()))
+            if self._bytes <= self.max_bytes and now - touched <= self.ttl:
+                break
+            del self._entries[cursor_id]
+            self._bytes -= result.nbytes
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "cursors": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "pages_served": self.pages_served,
+        }
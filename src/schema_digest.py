@@ -0,0 +1,160 @@
+"""Compact schema digest for the Interaction Agent's system prompt.
+
+Without schema context the model spends its first round trips calling
+`sql_db_list_tables` and `sql_db_schema`. `SchemaDigest` reads the SQLite
+catalog once (tables, columns, types, keys, indexes and row-count estimates),
+renders it as one short line per table and rebuilds it only when
+`PRAGMA schema_version` changes.
+"""
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.db import get_pool
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _estimate_rows(conn: sqlite3.Connection, table: str, stats: Dict[str, int]) -> Optional[int]:
+    """Row-count estimate: sqlite_stat1 if ANALYZE ran, else MAX(rowid) (an index seek)."""
+    if table in stats:
+        return stats[table]
+    try:
+        row = conn.execute(f"SELECT MAX(rowid) FROM {_quote(table)}").fetchone()
+        return int(row[0] or 0)
+    except sqlite3.Error:
+        # WITHOUT ROWID tables have no rowid; counting them is still cheap enough
+        # for the small lookup tables that usually use this layout.
+        try:
+            return int(conn.execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0])
+        except sqlite3.Error:
+            return None
+
+
+def _stat1_rows(conn: sqlite3.Connection) -> Dict[str, int]:
+    try:
+        rows = conn.execute("SELECT tbl, stat FROM sqlite_stat1").fetchall()
+    except sqlite3.Error:
+        return {}
+    out: Dict[str, int] = {}
+    for tbl, stat in rows:
+        try:
+            out[tbl] = max(out.get(tbl, 0), int(str(stat).split()[0]))
+        except (ValueError, IndexError):
+            continue
+    return out
+
+
+def _table_names(conn: sqlite3.Connection) -> List[str]:
+    return [
+        r[0]
+        for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+    ]
+
+
+def row_estimates(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Row-count estimate per table (see `_estimate_rows`); tables that can't be read are left out."""
+    stats = _stat1_rows(conn)
+    estimates = {table: _estimate_rows(conn, table, stats) for table in _table_names(conn)}
+    return {table: rows for table, rows in estimates.items() if rows is not None}
+
+
+def describe_table(conn: sqlite3.Connection, table: str, stats: Dict[str, int]) -> Tuple[str, str]:
+    """Return (column line, index line) for one table."""
+    columns = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+    fks = {
+        fk[3]: f"{fk[2]}.{fk[4] or '?'}"
+        for fk in conn.execute(f"PRAGMA foreign_key_list({_quote(table)})").fetchall()
+    }
+    pk_cols = [c[1] for c in sorted(columns, key=lambda c: c[5]) if c[5]]
+
+    parts = []
+    for _, name, col_type, notnull, _default, pk in columns:
+        piece = f"{name} {col_type or 'ANY'}".strip()
+        if pk and len(pk_cols) == 1:
+            piece += " PK"
+        elif notnull:
+            piece += " NN"
+        if name in fks:
+            piece += f"->{fks[name]}"
+        parts.append(piece)
+
+    rows = _estimate_rows(conn, table, stats)
+    size = f"~{rows} rows" if rows is not None else "rows ?"
+    line = f"{table}({size}): " + ", ".join(parts)
+    if len(pk_cols) > 1:
+        line += f"; PK({','.join(pk_cols)})"
+
+    indexes = []
+    for _, idx_name, unique, origin, _partial in conn.execute(f"PRAGMA index_list({_quote(table)})").fetchall():
+        if origin == "pk":
+            continue  # already shown as PK
+        cols = [c[2] for c in conn.execute(f"PRAGMA index_info({_quote(idx_name)})").fetchall()]
+        label = "UNIQUE " if unique else ""
+        indexes.append(f"{label}{idx_name}({','.join(c or 'expr' for c in cols)})")
+    index_line = f"  idx {table}: " + ", ".join(indexes) if indexes else ""
+    return line, index_line
+
+
+def build_digest(conn: sqlite3.Connection, max_chars: int = 6000) -> str:
+    """Render the whole schema, dropping index lines and then tables if over `max_chars`."""
+    stats = _stat1_rows(conn)
+    tables = _table_names(conn)
+    described: List[Tuple[str, str]] = [describe_table(conn, t, stats) for t in tables]
+
+    full = "\n".join(line + ("\n" + idx if idx else "") for line, idx in described)
+    if len(full) <= max_chars:
+        return full
+
+    # Over budget: indexes go first, then trailing tables.
+    lines = [line for line, _ in described]
+    compact = "\n".join(lines)
+    if len(compact) <= max_chars:
+        return compact
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        if used + len(line) + 1 > max_chars - 60:
+            break
+        kept.append(line)
+        used += len(line) + 1
+    omitted = len(lines) - len(kept)
+    kept.append(f"... {omitted} more tables omitted; use sql_db_schema for them.")
+    return "\n".join(kept)
+
+
+class SchemaDigest:
+    """Lazily built, version-checked schema digest for one SQLite file."""
+
+    def __init__(self, db_path: str, max_chars: int = 6000):
+        self.db_path = db_path
+        self.max_chars = max_chars
+        self._text = ""
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def refresh(self, force: bool = False) -> str:
+        """Rebuild if the schema version changed (or `force`), then return the digest."""
+        conn = get_pool(self.db_path).connection()
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if not force and version == self._version:
+            return self._text
+        with self._lock:
+            if force or version != self._version:
+                self._text = build_digest(conn, self.max_chars)
+                self._version = version
+                self.builds += 1
+        return self._text
+
+    def text(self) -> str:
+        """Current digest; falls back to the last good copy if the DB can't be read."""
+        try:
+            return self.refresh()
+        except sqlite3.Error as e:
+            print(f"Warning: schema digest refresh failed: {e}")
+            return self._text
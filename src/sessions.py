@@ -0,0 +1,213 @@
+"""Bounded multi-turn sessions for the Interaction Agent.
+
+`SessionStore` keeps the message history of each conversation so follow-up
+questions reuse earlier context (schema seen, SQL already written). Each
+session is held under a byte budget by `compact_history`:
+
+1. Tool results outside the latest turn are elided to a short stub.
+2. Older turns are collapsed into their question plus a short answer
+   summary (with the last SQL that was run), dropping tool-call traffic.
+3. If that is still too large, the oldest collapsed turns are dropped.
+
+Idle sessions are evicted after `idle_ttl` seconds and the number of sessions
+is capped, so per-worker memory stays flat. A session whose lock is held (a
+turn is running or streaming) is never evicted; the cap may be exceeded
+until it is released.
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+TOOL_STUB_CHARS = 200
+SUMMARY_ANSWER_CHARS = 400
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return str(content or "")
+
+
+def message_bytes(message: BaseMessage) -> int:
+    """Approximate prompt footprint of a message (text plus tool-call arguments)."""
+    size = len(_text(message.content).encode("utf-8"))
+    for call in getattr(message, "tool_calls", None) or []:
+        size += len(call.get("name", "")) + len(json.dumps(call.get("args", {}), default=str))
+    return size
+
+
+def history_bytes(messages: List[BaseMessage]) -> int:
+    return sum(message_bytes(m) for m in messages)
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group a history into turns, each starting at a HumanMessage."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def summarize_turn(turn: List[BaseMessage]) -> List[BaseMessage]:
+    """Collapse a turn to [question, short answer (+ last SQL)]."""
+    question = turn[0]
+    answer = ""
+    last_sql = ""
+    for message in turn[1:]:
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls or []:
+                if call.get("name") == "sql_db_query":
+                    last_sql = str(call.get("args", {}).get("query", ""))
+            if not message.tool_calls:
+                answer = _text(message.content)
+    if len(answer) > SUMMARY_ANSWER_CHARS:
+        answer = answer[:SUMMARY_ANSWER_CHARS] + "…"
+    summary = answer or "(no answer)"
+    if last_sql:
+        summary += f"\n[SQL used: {last_sql}]"
+    return [question, AIMessage(content=summary)]
+
+
+def _is_summarized(turn: List[BaseMessage]) -> bool:
+    return len(turn) == 2 and isinstance(turn[1], AIMessage) and not turn[1].tool_calls
+
+
+def compact_history(messages: List[BaseMessage], max_bytes: int) -> List[BaseMessage]:
+    """Shrink `messages` to fit `max_bytes` (see module docstring for the order of steps)."""
+    turns = split_turns(messages)
+    if not turns:
+        return []
+
+    # 1. Elide tool payloads everywhere but the latest turn.
+    for turn in turns[:-1]:
+        for i, message in enumerate(turn):
+            if isinstance(message, ToolMessage):
+                text = _text(message.content)
+                if len(text) > TOOL_STUB_CHARS:
+                    turn[i] = ToolMessage(
+                        tool_call_id=message.tool_call_id,
+                        name=message.name,
+                        content=text[:TOOL_STUB_CHARS] + f"… [elided {len(text) - TOOL_STUB_CHARS} chars]",
+                    )
+
+    def flat() -> List[BaseMessage]:
+        return [m for turn in turns for m in turn]
+
+    # 2. Collapse older turns, oldest first.
+    for i in range(len(turns) - 1):
+        if history_bytes(flat()) <= max_bytes:
+            return flat()
+        if not _is_summarized(turns[i]):
+            turns[i] = summarize_turn(turns[i])
+
+    # 3. Drop the oldest collapsed turns; the latest turn always survives.
+    while len(turns) > 1 and history_bytes(flat()) > max_bytes:
+        turns.pop(0)
+    return flat()
+
+
+class Session:
+    """History and bookkeeping for one conversation."""
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.messages: List[BaseMessage] = []
+        self.turns = 0
+        self.compactions = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()  # serializes turns of the same session
+
+    @property
+    def bytes(self) -> int:
+        return history_bytes(self.messages)
+
+
+class SessionStore:
+    """LRU of sessions with idle eviction and a per-session byte budget."""
+
+    def __init__(self, max_bytes_per_session: int = 64 * 1024, idle_ttl: float = 1800.0, max_sessions: int = 1000):
+        self.max_bytes_per_session = max_bytes_per_session
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """Existing session for `session_id`, or a new one (fresh id if none/invalid given)."""
+        if session_id and not _SESSION_ID_RE.match(session_id):
+            session_id = None
+        with self._lock:
+            self._evict_locked()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex)
+                self._sessions[session.id] = session
+                self.created += 1
+                self._evict_capacity_locked(keep=session)
+            self._sessions.move_to_end(session.id)
+            session.last_used = time.monotonic()
+            return session
+
+    def append_turn(self, session: Session, turn_messages: List[BaseMessage]) -> None:
+        """Add a completed turn and compact the session to its byte budget."""
+        messages = session.messages + list(turn_messages)
+        if history_bytes(messages) > self.max_bytes_per_session:
+            messages = compact_history(messages, self.max_bytes_per_session)
+            session.compactions += 1
+        session.messages = messages
+        session.turns += 1
+        session.last_used = time.monotonic()
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        idle = []
+        for session in self._sessions.values():
+            if now - session.last_used <= self.idle_ttl:
+                break
+            if not session.lock.locked():  # a running turn keeps its session
+                idle.append(session.id)
+        for session_id in idle:
+            del self._sessions[session_id]
+        self.evicted_idle += len(idle)
+
+    def _evict_capacity_locked(self, keep: Session) -> None:
+        """Drop least recently used sessions over `max_sessions`, skipping `keep` and locked ones."""
+        excess = len(self._sessions) - self.max_sessions
+        victims = []
+        for session in self._sessions.values():
+            if len(victims) >= excess:
+                break
+            if session is not keep and not session.lock.locked():
+                victims.append(session.id)
+        for session_id in victims:
+            del self._sessions[session_id]
+        self.evicted_capacity += len(victims)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "created": self.created,
+            "evicted_idle": self.evicted_idle,
+            "evicted_capacity": self.evicted_capacity,
+            "bytes": sum(s.bytes for s in sessions),
+            "max_bytes_per_session": self.max_bytes_per_session,
+            "compactions": sum(s.compactions for s in sessions),
+        }
@@ -0,0 +1,158 @@
+"""Lightweight SQL text helpers (no parser dependency).
+
+A small regex tokenizer is enough to canonicalize statements for cache keys:
+comments and layout are dropped, keywords and identifiers are case-folded and
+string literals are kept verbatim. `fingerprint_sql` goes one step further and
+replaces literals with `?`, so every execution of the same query shape maps to
+one fingerprint.
+"""
+import hashlib
+import re
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+  | (?P<line_comment>--[^\n]*)
+  | (?P<block_comment>/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<quoted_ident>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<param>[?:@$]\w*)
+  | (?P<word>\w+)
+  | (?P<op><>|!=|<=|>=|==|\|\||<<|>>|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_READ_ONLY_LEADS = {"select", "with", "explain", "values"}
+# `replace` is deliberately absent: it is far more common as a string function.
+_WRITE_WORDS = {"insert", "update", "delete", "create", "drop", "alter", "attach", "detach", "pragma", "vacuum"}
+
+
+def iter_tokens(sql: str) -> Iterator[Tuple[str, str]]:
+    """Yield (kind, text) for significant tokens; words are lower-cased."""
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "line_comment", "block_comment"):
+            continue
+        text = m.group(0)
+        if kind == "word":
+            text = text.lower()
+        yield kind, text
+
+
+def tokenize(sql: str) -> List[str]:
+    """Split SQL into significant tokens; whitespace and comments are discarded."""
+    return [text for _, text in iter_tokens(sql)]
+
+
+def canonicalize_sql(sql: str) -> str:
+    """Layout- and case-insensitive form of a statement, suitable as a cache key.
+
+    `SELECT  a,b FROM t;` and `select a , b from t` canonicalize identically.
+    Literal values are preserved, so queries with different constants differ.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def is_read_only_sql(sql: str) -> bool:
+    """True if the statement can only read (SELECT / WITH ... SELECT / EXPLAIN / VALUES).
+
+    Conservative: multiple statements, or a WITH that feeds an INSERT/UPDATE/
+    DELETE, count as writes.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    if not tokens or ";" in tokens:
+        return False
+    if tokens[0] not in _READ_ONLY_LEADS:
+        return False
+    return not any(t in _WRITE_WORDS for t in tokens)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint_sql(sql: str) -> str:
+    """Literal-free shape of a statement.
+
+    String and numeric literals and bound parameters become `?`, and lists of
+    them (`IN (1, 2, 3)`) collapse to a single `?`, so
+    `SELECT * FROM film WHERE film_id IN (1,2)` and `... IN (7)` share one
+    fingerprint. Cached, since the same statements repeat constantly.
+    """
+    out: List[str] = []
+    for kind, text in iter_tokens(sql):
+        if kind in ("string", "number", "param"):
+            text = "?"
+            # "-5" is a literal too: drop a unary minus directly before it.
+            if len(out) >= 2 and out[-1] == "-" and out[-2] in ("(", ",", "=", "<", ">", "<=", ">=", "<>", "!=", "in", "and", "or", "select", "where", "then", "else", "when"):
+                out.pop()
+        if text == "?" and len(out) >= 2 and out[-1] == "," and out[-2] == "?":
+            out.pop()  # "?, ?" -> "?"
+            continue
+        out.append(text)
+    while out and out[-1] == ";":
+        out.pop()
+    return " ".join(out)
+
+
+def fingerprint_id(fingerprint: str) -> str:
+    """Short stable id for a fingerprint (for logs, file names and metric labels)."""
+    return hashlib.blake2b(fingerprint.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def literal_spans(sql: str) -> Iterator[Tuple[str, int, int, str]]:
+    """Yield (kind, start, end, text) for each string or number literal in `sql`."""
+    for m in _TOKEN_RE.finditer(sql):
+        if m.lastgroup in ("string", "number"):
+            yield m.lastgroup, m.start(), m.end(), m.group(0)
+
+
+# Words that end a table reference rather than name its alias
+_NOT_ALIASES = {
+    "select", "from", "where", "on", "group", "order", "having", "limit", "join", "set", "values",
+    "inner", "left", "right", "cross", "natural", "outer", "full", "using", "union", "except",
+    "intersect", "as", "indexed", "not", "window",
+}
+
+
+def unquote_identifier(text: str) -> str:
+    """`"name"`, `` `name` `` or `[name]` without its quotes; other text unchanged."""
+    if len(text) >= 2 and text[0] in "\"`[" and text[-1] in "\"`]":
+        return text[1:-1]
+    return text
+
+
+def table_aliases(sql: str, schema: Dict[str, List[str]]) -> Dict[str, str]:
+    """Lower-cased table name or alias -> schema table, for tables after FROM/JOIN/','."""
+    by_lower = {t.lower(): t for t in schema}
+    tokens = [(kind, unquote_identifier(text) if kind == "quoted_ident" else text) for kind, text in iter_tokens(sql)]
+    aliases: Dict[str, str] = {}
+    expect_table = False
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        if text in ("from", "join"):
+            expect_table = True
+        elif expect_table and kind in ("word", "quoted_ident") and text.lower() in by_lower:
+            table = by_lower[text.lower()]
+            aliases[text.lower()] = table
+            j = i + 1
+            if j < len(tokens) and tokens[j][1] == "as":
+                j += 1
+            if j < len(tokens) and tokens[j][0] in ("word", "quoted_ident") and tokens[j][1] not in _NOT_ALIASES:
+                aliases[tokens[j][1].lower()] = table
+                i = j
+            # a comma keeps us in a FROM list (`FROM a, b`)
+            expect_table = i + 1 < len(tokens) and tokens[i + 1][1] == ","
+            i += 2 if expect_table else 1
+            continue
+        else:
+            expect_table = False
+        i += 1
+    return aliases
@@ -0,0 +1,440 @@
+"""Request tracing and Prometheus metrics (no external dependencies).
+
+Tracing
+    `Tracer.span(name, **attrs)` opens a span that nests under the current
+    one (tracked in a context variable, so it follows asyncio tasks and, via
+    `contextvars.copy_context()`, executor threads). Every span carries the
+    request ID set by the HTTP middleware. Finished spans are logged on the
+    `aegis.trace` logger (children at DEBUG, the request's root span at INFO
+    with a per-name time breakdown) and the spans of the last `max_traces`
+    requests are kept in memory for `GET /traces`.
+
+Metrics
+    `MetricsRegistry` holds counters, gauges and histograms with labels and
+    renders the Prometheus text format. Callback collectors expose values
+    that already live elsewhere (cache and limiter stats) without double
+    bookkeeping. Each update is one dict lookup and an add under a lock.
+"""
+import itertools
+import json
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("aegis_request_id", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("aegis_span", default=None)
+_span_ids = itertools.count(1)
+
+logger = logging.getLogger("aegis.trace")
+# A client-supplied request ID lands in logs, traces and response headers: only short, plain ones are kept
+_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9_.:-]{1,64}")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def accept_request_id(incoming: Optional[str]) -> str:
+    """`incoming` if it is a safe request ID (1-64 of `A-Za-z0-9_.:-`), else a new one."""
+    return incoming if incoming and _REQUEST_ID_RE.fullmatch(incoming) else new_request_id()
+
+
+# --- Logging ---
+
+class RequestIdFilter(logging.Filter):
+    """Adds `record.request_id` (or "-") so formats can include `%(request_id)s`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or "-"
+        return True
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Log `aegis.*` records to stderr with the request ID (idempotent)."""
+    root = logging.getLogger("aegis")
+    if any(getattr(h, "_aegis", False) for h in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler._aegis = True
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+
+
+# --- Tracing ---
+
+class Span:
+    """One timed operation within a request."""
+
+    __slots__ = ("name", "span_id", "parent_id", "request_id", "attrs", "start", "duration", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], request_id: Optional[str], attrs: Dict[str, object]):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.request_id = request_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, object]:
+        out = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "request_id": self.request_id,
+            "start": self.start,
+            "duration_ms": round(1000 * self.duration, 3) if self.duration is not None else None,
+        }
+        if self.error:
+            out["error"] = self.error
+        if self.attrs:
+            out["attrs"] = self.attrs
+        return out
+
+
+class Tracer:
+    """Creates spans and keeps the finished spans of recent requests."""
+
+    def __init__(self, max_traces: int = 200, max_spans_per_trace: int = 500):
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self._open: Dict[str, List[Span]] = {}
+        self._done: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = _current_span.get()
+        sp = Span(name, parent, request_id_var.get(), attrs)
+        token = _current_span.set(sp)
+        started = time.perf_counter()
+        try:
+            yield sp
+        except BaseException as e:
+            sp.error = type(e).__name__
+            raise
+        finally:
+            sp.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._finish(sp)
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    def annotate(self, **attrs) -> None:
+        """Set attributes on the current span, if any."""
+        sp = _current_span.get()
+        if sp is not None:
+            sp.attrs.update(attrs)
+
+    def _finish(self, sp: Span) -> None:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s", json.dumps(sp.to_dict(), default=str))
+        if sp.request_id is None:
+            return
+        with self._lock:
+            spans = self._open.get(sp.request_id)
+            if spans is None:
+                # Late child of a finished request (e.g. a tool that outlived its timeout).
+                spans = self._done.get(sp.request_id) if sp.parent_id is not None else None
+                if spans is None:
+                    spans = self._open[sp.request_id] = []
+                    while len(self._open) > 4 * self.max_traces:
+                        self._open.pop(next(iter(self._open)))
+            if len(spans) < self.max_spans_per_trace:
+                spans.append(sp)
+            if sp.parent_id is not None or sp.request_id not in self._open:
+                return
+            del self._open[sp.request_id]
+            self._done[sp.request_id] = spans
+            while len(self._done) > self.max_traces:
+                self._done.popitem(last=False)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s %.1fms %s", sp.name, 1000 * sp.duration, json.dumps(breakdown(spans)))
+
+    def trace(self, request_id: str) -> Optional[List[Dict[str, object]]]:
+        with self._lock:
+            spans = self._done.get(request_id) or self._open.get(request_id)
+            return [s.to_dict() for s in spans] if spans is not None else None
+
+    def recent(self, n: int = 20) -> List[Dict[str, object]]:
+        """Summaries of the last `n` finished requests, newest first."""
+        with self._lock:
+            items = list(self._done.items())[-n:]
+        out = []
+        for request_id, spans in reversed(items):
+            root = next((s for s in spans if s.parent_id is None), spans[-1])
+            out.append({
+                "request_id": request_id,
+                "name": root.name,
+                "start": root.start,
+                "duration_ms": round(1000 * (root.duration or 0.0), 3),
+                "error": root.error,
+                "breakdown_ms": breakdown(spans),
+            })
+        return out
+
+
+def breakdown(spans: Iterable[Span]) -> Dict[str, float]:
+    """Total milliseconds per span name (nested spans count towards both names)."""
+    totals: Dict[str, float] = {}
+    for sp in spans:
+        totals[sp.name] = totals.get(sp.name, 0.0) + 1000 * (sp.duration or 0.0)
+    return {name: round(ms, 3) for name, ms in totals.items()}
+
+
+# --- Metrics ---
+
+LabelKey = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}"
+                                for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Increment for the duration of the block (in-flight gauges)."""
+        self.inc(1, **labels)
+        try:
+            yield
+        finally:
+            self.dec(1, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> float:
+        row = self._values.get(self._key(labels))
+        return row[-1] if row else 0.0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = self.header()
+        for key, row in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(row[-1])}")
+        return lines
+
+
+# A collector returns (name, kind, help, [(labels dict, value), ...]) tuples.
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, object], float]]]]]
+
+
+class MetricsRegistry:
+    """Named metrics plus callback collectors, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: "OrderedDict[str, _Metric]" = OrderedDict()
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# --- HTTP ---
+
+class RequestTracingMiddleware:
+    """ASGI middleware: request ID, root span, latency histogram and in-flight gauge.
+
+    The request ID comes from the `X-Request-ID` header when it passes
+    `accept_request_id` (otherwise one is generated) and is echoed in the
+    response. Paths under `untraced` (scrapes, probes) are
+    timed but not kept as traces. Written as plain ASGI rather than a
+    `BaseHTTPMiddleware` so streamed responses are timed until their last
+    byte and no extra task is spawned per request.
+    """
+
+    def __init__(self, app, tracer: Tracer, latency: Histogram, in_flight: Gauge, errors: Counter,
+                 header: str = "x-request-id", untraced: Sequence[str] = ("/metrics", "/traces", "/health")):
+        self.app = app
+        self.untraced = tuple(untraced)
+        self.tracer = tracer
+        self.latency = latency
+        self.in_flight = in_flight
+        self.errors = errors
+        self.header = header.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope.get("headers") or []).get(self.header, b"").decode("latin-1")
+        request_id = accept_request_id(incoming)
+        token = request_id_var.set(request_id)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [(self.header, request_id.encode())])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            with self.in_flight.track():
+                if scope["path"].startswith(self.untraced):
+                    await self.app(scope, receive, send_with_id)
+                    return
+                with self.tracer.span("http", method=scope["method"], path=scope["path"]) as span:
+                    try:
+                        await self.app(scope, receive, send_with_id)
+                    except Exception:
+                        self.errors.inc(where="http")
+                        raise
+                    finally:
+                        span.set(status=status)
+                        if status >= 500:
+                            self.errors.inc(where="http_5xx")
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.latency.observe(time.perf_counter() - start, method=scope["method"], route=route, status=status)
+            request_id_var.reset(token)
@@ -0,0 +1,336 @@
+"""Parameterized SQL templates learned from successful agent runs.
+
+Much of the traffic is a few question shapes with different literals ("top 5
+actors by film count", "top 10 actors by film count"). When a run answers with
+exactly one successful `sql_db_query`, `TemplateStore.learn` lines the
+question's literals up with the SQL's: every SQL literal whose value appears
+exactly once in the normalized question becomes a slot, in the question
+pattern and in the SQL alike. Literals that do not line up stay fixed.
+
+A pattern is served only once it is confident: `min_support` runs with
+*different* literals produced the same SQL template (which shows the slots
+really are parameters), and that template holds at least `min_share` of
+everything learned for the pattern. `match` then renders the SQL for a new
+question so it can be executed and answered without calling the model.
+Anything else falls back to the full agent.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.cache import normalize_question
+from src.results import QueryResult, format_value
+from src.sqltext import is_read_only_sql, literal_spans
+
+_NUMERIC_RE = re.compile(r"^\d+(?:\.\d+)?$")
+
+
+class Slot(NamedTuple):
+    kind: str  # "number" or "string"
+    case: str = ""  # strings: "upper", "lower" or "title", re-applied to the casefolded question words
+
+
+class Template(NamedTuple):
+    pattern: Tuple  # question words; slot positions hold the slot index instead
+    slots: Tuple[Slot, ...]
+    parts: Tuple  # SQL text pieces and slot indexes
+    binding: Tuple[str, ...]  # slot values of the question the template was learned from
+
+
+class TemplateMatch(NamedTuple):
+    id: str
+    sql: str
+    key: Hashable
+    parts: Tuple
+
+
+def _case_style(value: str) -> Optional[str]:
+    if value.isupper():
+        return "upper"
+    if value.islower() or not any(c.isalpha() for c in value):
+        return "lower"
+    if value.istitle():
+        return "title"
+    return None
+
+
+def _render_literal(slot: Slot, value: str) -> str:
+    if slot.kind == "number":
+        return value
+    if slot.case == "upper":
+        value = value.upper()
+    elif slot.case == "title":
+        value = value.title()
+    return "'" + value.replace("'", "''") + "'"
+
+
+def render_sql(parts: Iterable, slots: Tuple[Slot, ...], binding: Tuple[str, ...]) -> str:
+    return "".join(p if isinstance(p, str) else _render_literal(slots[p], binding[p]) for p in parts)
+
+
+def extract_template(question: str, sql: str) -> Optional[Template]:
+    """Line up the literals of `question` and `sql`; None if no slot lines up unambiguously."""
+    words = normalize_question(question).split()
+    spans: Dict[Tuple[int, int], int] = {}  # (first word, word count) -> slot index
+    slots: List[Slot] = []
+    parts: List = []
+    pos = 0
+    for kind, start, end, text in literal_spans(sql):
+        if kind == "number":
+            slot = Slot("number")
+            needle = normalize_question(text).split()
+        else:
+            if len(text) < 2 or not text.endswith("'"):
+                continue
+            value = text[1:-1].replace("''", "'")
+            case = _case_style(value)
+            if case is None:
+                continue
+            slot = Slot("string", case)
+            needle = normalize_question(value).split()
+        # Only literals that survive the round trip through the question can be slots
+        if not needle or _render_literal(slot, " ".join(needle)) != text:
+            continue
+        hits = [i for i in range(len(words) - len(needle) + 1) if words[i:i + len(needle)] == needle]
+        if len(hits) > 1:
+            return None  # the question repeats the value: no telling which one this is
+        if not hits:
+            continue
+        span = (hits[0], len(needle))
+        index = spans.get(span)
+        if index is None:
+            if any(s < span[0] + span[1] and span[0] < s + n for s, n in spans):
+                return None
+            index = spans[span] = len(slots)
+            slots.append(slot)
+        elif slots[index] != slot:
+            return None
+        parts.extend((sql[pos:start], index))
+        pos = end
+    parts.append(sql[pos:])
+    if not slots:
+        return None
+
+    pattern: List = list(words)
+    binding = [""] * len(slots)
+    for (first, count), index in spans.items():
+        pattern[first:first + count] = [index] * count
+        binding[index] = " ".join(words[first:first + count])
+    return Template(tuple(pattern), tuple(slots), tuple(p for p in parts if p != ""), tuple(binding))
+
+
+def bind(pattern: Tuple, slots: Tuple[Slot, ...], words: List[str]) -> Optional[Tuple[str, ...]]:
+    """Slot values if `words` fits `pattern`, else None."""
+    if len(pattern) != len(words):
+        return None
+    values: List[List[str]] = [[] for _ in slots]
+    for token, word in zip(pattern, words):
+        if isinstance(token, int):
+            if slots[token].kind == "number" and not _NUMERIC_RE.match(word):
+                return None
+            values[token].append(word)
+        elif token != word:
+            return None
+    return tuple(" ".join(v) for v in values)
+
+
+def answer_sql(messages) -> Optional[str]:
+    """The SQL behind a finished run: its only successful `sql_db_query` call.
+
+    None when the run made no successful query or several, or paged with
+    `fetch_more`; one template cannot reproduce those answers.
+    """
+    outputs = {m.tool_call_id: str(m.content) for m in messages if getattr(m, "type", "") == "tool"}
+    queries = []
+    for message in messages:
+        for call in getattr(message, "tool_calls", None) or []:
+            if call["name"] == "fetch_more":
+                return None
+            if call["name"] == "sql_db_query" and not outputs.get(call["id"], "Error").startswith("Error"):
+                queries.append(call["args"].get("query", ""))
+    return queries[0] if len(queries) == 1 else None
+
+
+def format_answer(result: QueryResult, max_rows: int = 50) -> str:
+    """Plain answer for a template result: a single value, or a markdown table."""
+    if not result.columns:
+        return "Done."
+    if not result.rows:
+        return "No matching rows."
+    if len(result.columns) == 1 and len(result.rows) == 1:
+        return f"{result.columns[0]}: {format_value(result.rows[0][0])}"
+    lines = ["| " + " | ".join(result.columns) + " |", "|" + "---|" * len(result.columns)]
+    for row in result.rows[:max_rows]:
+        lines.append("| " + " | ".join(format_value(v) for v in row) + " |")
+    more = len(result.rows) - max_rows
+    if more > 0 or result.truncated:
+        lines.append(f"\n... and {max(more, 0)}{'+' if result.truncated else ''} more rows")
+    return "\n".join(lines)
+
+
+class _Candidate:
+    """One SQL template seen for a pattern, with the distinct bindings that produced it."""
+
+    __slots__ = ("bindings", "served", "failures")
+
+    def __init__(self):
+        self.bindings = set()
+        self.served = 0
+        self.failures = 0
+
+
+class TemplateStore:
+    """LRU of question patterns, each with the SQL templates learned for it.
+
+    `max_patterns <= 0` disables the store. Callers report what happened to a
+    served match with `record_hit` or `record_fallback`; a template whose SQL
+    fails is not served again until `min_support` new runs re-confirm it.
+    """
+
+    def __init__(self, min_support: int = 2, min_share: float = 0.8, max_patterns: int = 512,
+                 max_bindings: int = 16):
+        self.min_support = min_support
+        self.min_share = min_share
+        self.max_patterns = max_patterns
+        self.max_bindings = max_bindings
+        self._patterns: "OrderedDict[Hashable, Dict[Tuple, _Candidate]]" = OrderedDict()
+        self._by_length: Dict[int, Dict[Hashable, None]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.low_confidence = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.learned = 0
+        self.conflicts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_patterns > 0
+
+    @staticmethod
+    def template_id(key: Hashable) -> str:
+        return "t_" + hashlib.blake2b(repr(key).encode("utf-8"), digest_size=5).hexdigest()
+
+    def learn(self, question: str, sql: str) -> bool:
+        """Record that `sql` answered `question`; False if no template could be extracted."""
+        if not self.enabled or not is_read_only_sql(sql):
+            return False
+        template = extract_template(question, sql)
+        if template is None:
+            return False
+        key = (template.pattern, template.slots)
+        with self._lock:
+            candidates = self._patterns.get(key)
+            if candidates is None:
+                candidates = self._patterns[key] = {}
+                self._by_length.setdefault(len(template.pattern), {})[key] = None
+                while len(self._patterns) > self.max_patterns:
+                    old, _ = self._patterns.popitem(last=False)
+                    del self._by_length[len(old[0])][old]
+            self._patterns.move_to_end(key)
+            candidate = candidates.get(template.parts)
+            if candidate is None:
+                if candidates:
+                    self.conflicts += 1
+                candidate = candidates[template.parts] = _Candidate()
+            if len(candidate.bindings) < self.max_bindings:
+                candidate.bindings.add(template.binding)
+            self.learned += 1
+        return True
+
+    def _best(self, candidates: Dict[Tuple, _Candidate]) -> Tuple[Tuple, _Candidate, bool]:
+        parts, best = max(candidates.items(), key=lambda kv: len(kv[1].bindings))
+        total = sum(len(c.bindings) for c in candidates.values())
+        support = len(best.bindings)
+        return parts, best, support >= self.min_support and support >= self.min_share * total
+
+    def match(self, question: str) -> Optional[TemplateMatch]:
+        """The rendered SQL of the best confident pattern for `question`, or None."""
+        if not self.enabled:
+            return None
+        words = normalize_question(question).split()
+        with self._lock:
+            self.lookups += 1
+            found = None
+            for key in self._by_length.get(len(words), ()):
+                pattern, slots = key
+                binding = bind(pattern, slots, words)
+                if binding is None:
+                    continue
+                parts, _, confident = self._best(self._patterns[key])
+                # Prefer confident patterns, then the most specific one
+                rank = (confident, sum(1 for t in pattern if isinstance(t, str)))
+                if found is None or rank > found[0]:
+                    found = (rank, key, parts, binding)
+            if found is None:
+                self.misses += 1
+                return None
+            (confident, _), key, parts, binding = found
+            if not confident:
+                self.low_confidence += 1
+                return None
+            self._patterns.move_to_end(key)
+        return TemplateMatch(self.template_id(key), render_sql(parts, key[1], binding), key, parts)
+
+    def _candidate(self, match: TemplateMatch) -> Optional[_Candidate]:
+        return self._patterns.get(match.key, {}).get(match.parts)
+
+    def record_hit(self, match: TemplateMatch) -> None:
+        with self._lock:
+            self.hits += 1
+            candidate = self._candidate(match)
+            if candidate is not None:
+                candidate.served += 1
+
+    def record_fallback(self, match: TemplateMatch, failed: bool = False) -> None:
+        """A served match was handed to the agent; `failed` if its SQL errored."""
+        with self._lock:
+            self.fallbacks += 1
+            candidate = self._candidate(match)
+            if failed:
+                self.failures += 1
+                if candidate is not None:
+                    candidate.failures += 1
+                    candidate.bindings.clear()
+
+    def top(self, n: int = 20) -> List[Dict[str, object]]:
+        """Learned patterns, most recently used first."""
+        with self._lock:
+            rows = []
+            for key in reversed(self._patterns):
+                pattern, slots = key
+                parts, best, confident = self._best(self._patterns[key])
+                shown = [t if isinstance(t, str) else "{%d}" % t for i, t in enumerate(pattern)
+                         if isinstance(t, str) or i == 0 or pattern[i - 1] != t]
+                rows.append({
+                    "id": self.template_id(key),
+                    "pattern": " ".join(shown),
+                    "sql": "".join(p if isinstance(p, str) else "{%d}" % p for p in parts),
+                    "support": len(best.bindings),
+                    "variants": len(self._patterns[key]),
+                    "confident": confident,
+                    "served": best.served,
+                    "failures": best.failures,
+                })
+                if len(rows) >= n:
+                    break
+            return rows
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "patterns": len(self._patterns),
+            "max_patterns": self.max_patterns,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "low_confidence": self.low_confidence,
+            "fallbacks": self.fallbacks,
+            "failures": self.failures,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "learned": self.learned,
+            "conflicts": self.conflicts,
+        }
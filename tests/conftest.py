@@ -0,0 +1,78 @@
+import os
+import sys
+
+# Make `src.*` importable regardless of where pytest is launched from.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import json
+import random
+import sqlite3
+import subprocess
+
+import pytest
+
+MINI_SAKILA_SCHEMA = """
+CREATE TABLE actor (actor_id INTEGER PRIMARY KEY, first_name TEXT NOT NULL, last_name TEXT NOT NULL, last_update TIMESTAMP);
+CREATE TABLE film (film_id INTEGER PRIMARY KEY, title TEXT NOT NULL, rental_rate DECIMAL(4,2), length SMALLINT, last_update TIMESTAMP);
+CREATE TABLE film_actor (actor_id INT NOT NULL REFERENCES actor(actor_id), film_id INT NOT NULL REFERENCES film(film_id), last_update TIMESTAMP, PRIMARY KEY (actor_id, film_id));
+CREATE TABLE customer (customer_id INTEGER PRIMARY KEY, store_id INT, first_name TEXT, last_name TEXT, email TEXT, address_id INT, active CHAR(1), create_date TIMESTAMP, last_update TIMESTAMP);
+CREATE TABLE rental (rental_id INTEGER PRIMARY KEY, rental_date TIMESTAMP NOT NULL, inventory_id INT NOT NULL, customer_id INT NOT NULL REFERENCES customer(customer_id), return_date TIMESTAMP, staff_id INT, last_update TIMESTAMP);
+CREATE INDEX idx_fk_film_id ON film_actor(film_id);
+"""
+
+
+@pytest.fixture
+def sakila_db(tmp_path):
+    """A small Sakila-shaped SQLite file (a handful of tables, a few thousand rows)."""
+    path = str(tmp_path / "sakila.db")
+    rnd = random.Random(7)
+    conn = sqlite3.connect(path)
+    conn.executescript(MINI_SAKILA_SCHEMA)
+    conn.executemany("INSERT INTO actor VALUES (?,?,?,?)",
+                     [(i, f"FIRST{i}", f"LAST{i % 40}", "2006-02-15") for i in range(1, 101)])
+    conn.executemany("INSERT INTO film VALUES (?,?,?,?,?)",
+                     [(i, f"FILM {i}", 0.99 + (i % 3) * 2, 60 + i % 120, "2006-02-15") for i in range(1, 301)])
+    conn.executemany("INSERT OR IGNORE INTO film_actor VALUES (?,?,?)",
+                     [(rnd.randint(1, 100), rnd.randint(1, 300), "2006-02-15") for _ in range(1500)])
+    conn.executemany("INSERT INTO customer VALUES (?,?,?,?,?,?,?,?,?)",
+                     [(i, 1 + i % 2, f"C{i}", f"L{i}", f"c{i}@example.org", i, "1", "2006-02-14", "2006-02-15")
+                      for i in range(1, 201)])
+    conn.executemany("INSERT INTO rental VALUES (?,?,?,?,?,?,?)",
+                     [(i, f"2005-0{1 + i % 9}-01 10:00:00", rnd.randint(1, 900), rnd.randint(1, 200), None, 1, "2006-02-15")
+                      for i in range(1, 3001)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+APP_PRELUDE = """
+import json
+from fastapi.testclient import TestClient
+import src.main as m
+from benchmarks.scripted_model import ScriptedChatModel
+from src.models import ModelBackend, ModelRouter
+
+def emit(**values):
+    print(json.dumps(values, default=str))
+"""
+
+
+@pytest.fixture
+def run_app(sakila_db):
+    """Run a script against a fresh `src.main` in its own interpreter; returns what it passed to `emit(...)`.
+
+    `src.main` reads its configuration at import, so every script gets a new
+    process. The script starts after `APP_PRELUDE` and runs on `sakila_db`,
+    with the workload log, the monitor and warm-up off; keyword arguments
+    override (or add) environment variables.
+    """
+    def run(script: str, **env) -> dict:
+        env = dict(os.environ, **{"AEGIS_DB_FILE": sakila_db, "AEGIS_WORKLOAD_LOG": "", "AEGIS_MONITOR_DB": "",
+                                  "AEGIS_WARMUP": "0", **env})
+        out = subprocess.run([sys.executable, "-c", APP_PRELUDE + script], cwd=ROOT, env=env, capture_output=True,
+                             text=True, timeout=120)
+        assert out.returncode == 0, out.stderr
+        return json.loads(out.stdout.strip().splitlines()[-1])
+    return run
@@ -0,0 +1,74 @@
+import random
+import statistics
+
+import pytest
+
+from src.agents.analyst import detect_anomaly, sample_and_check
+from src.agents.baseline import BaselineStore, DecayingMean, P2Quantile, RunningStats
+from src.sqltext import fingerprint_sql
+
+
+def test_fingerprint_strips_literals_and_collapses_in_lists():
+    a = fingerprint_sql("SELECT * FROM film WHERE film_id IN (1, 2, 3) AND title = 'A';")
+    b = fingerprint_sql("select *  from FILM where film_id in (7) and title='B'")
+    assert a == b == "select * from film where film_id in ( ? ) and title = ?"
+
+
+def test_running_stats_and_quantiles_match_exact_values():
+    rnd = random.Random(3)
+    xs = [rnd.lognormvariate(0, 0.5) for _ in range(20000)]
+    stats = RunningStats()
+    p95 = P2Quantile(0.95)
+    for x in xs:
+        stats.add(x)
+        p95.add(x)
+    assert abs(stats.mean - statistics.fmean(xs)) < 1e-9
+    assert abs(stats.stddev - statistics.stdev(xs)) < 1e-6
+    exact = sorted(xs)[int(0.95 * len(xs))]
+    assert abs(p95.value() - exact) / exact < 0.02
+
+
+def test_decaying_mean_tracks_recent_samples():
+    window = DecayingMean(half_life=60)
+    for t in range(0, 600, 10):
+        window.add(1.0, ts=t)
+    for t in range(600, 660, 10):
+        window.add(5.0, ts=t)
+    assert window.value() > 2.5
+
+
+def test_store_persists_and_flags_tail_latency(tmp_path):
+    path = str(tmp_path / "baselines.json")
+    store = BaselineStore(path)
+    for i in range(500):
+        store.record(f"SELECT * FROM rental WHERE customer_id = {i % 50}", 0.010 + (i % 10) * 0.001)
+    store.save()
+
+    reloaded = BaselineStore(path)
+    summary = reloaded.baseline("SELECT * FROM rental WHERE customer_id = 999")
+    assert summary["count"] == 500
+    assert 0.017 <= summary["p99"] <= 0.0195
+    assert detect_anomaly(0.05, summary, threshold=2.0, stat="p99")[0]
+    assert not detect_anomaly(0.02, summary, threshold=2.0, stat="p99")[0]
+
+
+@pytest.mark.parametrize("content", ['{"version": 1, "baselines": {"ab', '[1, 2]', '{"baselines": {"k": 3}}'])
+def test_store_starts_empty_from_a_corrupt_file(tmp_path, caplog, content):
+    path = tmp_path / "baselines.json"
+    path.write_text(content)
+    store = BaselineStore(str(path))
+    assert len(store) == 0 and "unreadable baselines file" in caplog.text
+    store.record("SELECT 1", 0.01)
+    store.save()
+    assert len(BaselineStore(str(path))) == 1
+
+
+def test_sample_and_check_records_per_fingerprint(sakila_db):
+    store = BaselineStore()
+    for customer in range(40):
+        latency, _, reason = sample_and_check(store, sakila_db, f"SELECT * FROM rental WHERE customer_id = {customer}")
+        assert latency > 0
+        if customer < 30:
+            assert reason == "baseline not established"
+    assert len(store) == 1
+    assert store.baseline("SELECT * FROM rental WHERE customer_id = 1")["count"] == 40
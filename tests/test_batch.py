@@ -0,0 +1,94 @@
+import asyncio
+
+from src.batch import dedupe_questions, question_key, run_concurrently
+
+
+def test_near_identical_questions_share_a_key():
+    assert question_key("Could you show me the top 5 actors?") == question_key("top five actors, please")
+    assert question_key("top 5 actors") != question_key("top 6 actors")
+    assert question_key("rentals from store 1 to store 2") != question_key("rentals from store 2 to store 1")
+    assert question_key("please show me") == ("please", "show", "me")  # all filler: keep all
+
+
+def test_distinct_questions_are_not_merged():
+    assert question_key("Which customers are active?") != question_key("Are customers active?")
+    assert question_key("What is the longest film?") != question_key("list the longest film")
+    assert question_key("films that show me nothing") == ("films", "that", "show", "me", "nothing")
+    groups = dedupe_questions(["Which customers are active?", "Are customers active?"])
+    assert groups == [(0, [0]), (1, [1])]
+
+    groups = dedupe_questions(["How many films?", "top 5 actors", "how many films", "Top 5 actors!", "x"])
+    assert groups == [(0, [0, 2]), (1, [1, 3]), (4, [4])]
+
+
+def test_run_concurrently_bounds_parallelism_and_yields_in_completion_order():
+    running, peak = 0, 0
+
+    async def worker(delay):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(delay)
+        running -= 1
+        if delay == 0.02:
+            raise ValueError("boom")
+        return delay * 2
+
+    async def collect():
+        return [item async for item in run_concurrently([0.05, 0.01, 0.02, 0.03], worker, parallelism=2)]
+
+    results = asyncio.run(collect())
+    assert peak == 2
+    assert [job for job, *_ in results] == [0.01, 0.02, 0.05, 0.03]
+    assert isinstance(results[1][2], ValueError) and results[0][1] == 0.02
+
+
+def test_closing_early_cancels_pending_jobs():
+    finished = []
+
+    async def worker(delay):
+        await asyncio.sleep(delay)
+        finished.append(delay)
+
+    async def first_only():
+        stream = run_concurrently([0.01, 0.5, 0.5], worker, parallelism=3)
+        async for _ in stream:
+            break
+        await stream.aclose()
+        await asyncio.sleep(0.6)
+
+    asyncio.run(first_only())
+    assert finished == [0.01]
+
+
+BATCH = """
+import time
+
+m.llm = ScriptedChatModel(latency_s=0.1, scenarios=[
+    {"question": f"how many films longer than {n} minutes",
+     "turns": [{"tool_calls": [{"name": "sql_db_query",
+                                "args": {"query": f"SELECT COUNT(*) FROM film WHERE length > {n}"}}]},
+               {"content": f"answer {n}"}]}
+    for n in (60, 90, 120, 150)])
+questions = ["How many films longer than 60 minutes?", "how many films longer than 90 minutes",
+             "how many films longer than 120 minutes", "Please tell me: how many films longer than 150 minutes?",
+             "how many films longer than 60 minutes please"]
+with TestClient(m.app_service) as client:
+    started = time.perf_counter()
+    with client.stream("POST", "/chat/batch", json={"questions": questions, "parallelism": 4}) as response:
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+    elapsed = time.perf_counter() - started
+emit(lines=lines, elapsed=elapsed, calls=m.llm.calls, content_type=response.headers["content-type"])
+"""
+
+
+def test_batch_endpoint_dedupes_and_streams_ndjson(run_app):
+    result = run_app(BATCH)
+    assert result["content_type"].startswith("application/x-ndjson")
+    *items, summary = result["lines"]
+    assert summary == {**summary, "done": True, "questions": 5, "unique": 4, "errors": 0}
+    by_index = {item["index"]: item for item in items}
+    assert sorted(by_index) == [0, 1, 2, 3, 4]
+    assert by_index[4]["duplicate_of"] == 0 and by_index[4]["response"] == by_index[0]["response"] == "answer 60"
+    assert result["calls"] == 8  # 4 unique questions x 2 model turns
+    assert result["elapsed"] < 4 * 0.2  # the four runs overlapped
@@ -0,0 +1,53 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from benchmarks.bench_agent import percentile, summarize
+from benchmarks.scripted_model import ScriptedChatModel
+
+SCENARIOS = [
+    {"question": "How many films?",
+     "turns": [{"tool_calls": [{"name": "sql_db_query", "args": {"query": "SELECT COUNT(*) FROM film"}}]},
+               {"content": "300 films."}]},
+]
+
+
+def test_scripted_model_replays_turns_from_conversation_state():
+    model = ScriptedChatModel(scenarios=SCENARIOS)
+    history = [SystemMessage(content="sys"), HumanMessage(content="how many  FILMS?")]
+    first = asyncio.run(model.ainvoke(history))
+    assert first.tool_calls[0]["args"] == {"query": "SELECT COUNT(*) FROM film"}
+    assert first.usage_metadata["input_tokens"] > 0
+
+    history += [first, ToolMessage(tool_call_id=first.tool_calls[0]["id"], content="300")]
+    second = model.invoke(history)
+    assert second.content == "300 films." and not second.tool_calls
+    # Past the end of the script the model answers instead of looping.
+    assert not model.invoke(history + [AIMessage(content="x", tool_calls=first.tool_calls)]).tool_calls
+
+
+def test_summary_percentiles():
+    assert percentile([], 50) == 0.0
+    values = [i / 1000 for i in range(1, 101)]
+    summary = summarize(values, wall_s=2.0, errors=1)
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (50.0, 95.0, 100.0 - 1.0)
+    assert summary["requests"] == 101 and summary["throughput_rps"] == 50.0
+
+
+BENCHMARK = """
+import asyncio
+from benchmarks.bench_agent import run_benchmark
+
+results = asyncio.run(run_benchmark(requests=10, concurrency=10, latency_s=0.01))  # each question twice, at once
+emit(**{mode: {"errors": results[mode]["errors"], "agent_calls": results[mode]["nodes"]["agent"]["calls"],
+               "model_calls": results[mode]["model_calls"]} for mode in ("graph", "http")})
+"""
+
+
+def test_benchmark_drives_graph_and_http(run_app):
+    results = run_app(BENCHMARK)
+    for mode in ("graph", "http"):
+        assert results[mode]["errors"] == 0
+        assert results[mode]["agent_calls"] >= 10
+    # No answer cache, templates or coalescing: HTTP requests cost the model as much as graph runs
+    assert results["http"]["model_calls"] == results["graph"]["model_calls"]
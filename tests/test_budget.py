@@ -0,0 +1,105 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.budget import RunBudget, best_effort_answer, memo_key
+
+
+def test_budget_reserves_room_for_a_final_answer():
+    budget = RunBudget(max_steps=6, max_llm_calls=3, max_seconds=0)
+    assert budget.limit_ahead() is None and budget.can_continue()
+    budget.llm_calls, budget.steps = 2, 1
+    assert budget.limit_ahead() == "llm_calls" and not budget.can_continue() and budget.allows_llm_call()
+    budget.llm_calls, budget.steps = 1, 5
+    assert budget.limit_ahead() == "steps"
+    assert RunBudget(max_seconds=1e-9).limit_ahead() == "time"
+    assert RunBudget(0, 0, 0).can_continue() and RunBudget(0, 0, 0).recursion_limit > 25
+    assert memo_key("sql_db_schema", {"a": 1, "b": 2}) == memo_key("sql_db_schema", {"b": 2, "a": 1})
+
+
+def test_best_effort_answer_reports_the_last_good_result():
+    call = AIMessage(content="", tool_calls=[{"name": "sql_db_query", "args": {}, "id": "1"}])
+    turn = [HumanMessage(content="q"), call, ToolMessage(content="[(200,)]", tool_call_id="1"),
+            call, ToolMessage(content="Error: no such table", tool_call_id="1")]
+    assert best_effort_answer(turn, "steps").endswith("[(200,)]")
+    assert "could not answer" in best_effort_answer(turn[:2], "time")
+
+
+def test_identical_calls_share_one_execution():
+    budget = RunBudget()
+    runs = []
+
+    async def execute(result):
+        runs.append(result)
+        await asyncio.sleep(0.01)
+        return result
+
+    async def scenario():
+        # A duplicate issued while the first call is running waits for it
+        first = await asyncio.gather(*(budget.memoized("k", lambda: execute("rows")) for _ in range(3)))
+        later = await budget.memoized("k", lambda: execute("again"))
+        # Results that must not be reused (timeouts) run every time
+        slow = [await budget.memoized("t", lambda: execute("timed out"), keep=lambda r: False) for _ in range(2)]
+        return first, later, slow
+
+    first, later, slow = asyncio.run(scenario())
+    assert first == [("rows", False), ("rows", True), ("rows", True)]
+    assert later == ("rows", True)
+    assert slow == [("timed out", False), ("timed out", False)]
+    assert runs == ["rows", "timed out", "timed out"]
+    assert (budget.tool_calls, budget.memo_hits) == (6, 3)
+
+
+LOOPING_CHAT = """
+query = {"name": "sql_db_query", "args": {"query": "SELECT COUNT(*) FROM actor"}}
+script = [{"question": "how many actors", "turns": [{"tool_calls": [query]}] * 6 + [{"content": "never"}]}]
+model = ScriptedChatModel(scenarios=script)
+m.model_router = ModelRouter([ModelBackend("scripted", model, provider="scripted")])
+with TestClient(m.app_service) as client:
+    response = client.post("/chat", params={"question": "How many actors?"})
+    body = response.json()
+    metrics = client.get("/metrics").text
+    spans = client.get(f"/traces/{response.headers['x-request-id']}").json()["spans"]
+llm = [span["attrs"] for span in spans if span["name"] == "llm"]
+emit(answer=body["response"], run=body["run"], model_calls=model.calls,
+     llm=[(attrs["budget_exhausted"], attrs.get("budget_limit"), attrs["tool_calls"]) for attrs in llm],
+     memo_metric='aegis_tool_memo_hits_total{tool="sql_db_query"} 1' in metrics,
+     cut_metric='aegis_runs_budget_exhausted_total{reason="llm_calls"} 1' in metrics)
+"""
+
+
+def test_looping_run_stops_at_its_budget_with_a_best_effort_answer(run_app):
+    result = run_app(LOOPING_CHAT, AEGIS_RUN_MAX_LLM_CALLS="3")
+    assert result["answer"].startswith("I stopped before finishing (llm_calls budget reached)")
+    assert result["answer"].endswith("COUNT(*)\n100\n(1 row)")
+    run = result["run"]
+    assert (run["steps"], run["llm_calls"], run["tool_calls"], run["memo_hits"]) == (5, 3, 2, 1)
+    assert run["exhausted"] == "llm_calls"
+    assert result["model_calls"] == 3
+    # Only the last call is made without tools, and its span names the limit
+    assert result["llm"] == [[False, None, 1], [False, None, 1], [True, "llm_calls", 0]]
+    assert result["memo_metric"] and result["cut_metric"]
+
+
+CUT_SHORT_TWICE = """
+script = [{"question": "how many actors", "turns": [
+    {"tool_calls": [{"name": "sql_db_query", "args": {"query": "SELECT COUNT(*) FROM actor"}}]}, {"content": "100"}]}]
+model = ScriptedChatModel(scenarios=script)
+m.model_router = ModelRouter([ModelBackend("scripted", model, provider="scripted")])
+with TestClient(m.app_service) as client:
+    with client.stream("POST", "/chat/stream", params={"question": "How many actors?"}) as response:
+        streamed = "".join(response.iter_text())
+    bodies = [client.post("/chat", params={"question": "How many actors?"}).json() for _ in range(2)]
+emit(streamed=streamed, bodies=bodies, model_calls=model.calls, cache=m.answer_cache.stats(),
+     templates=m.template_store.stats())
+"""
+
+
+def test_answers_cut_short_by_the_budget_are_not_reused(run_app):
+    result = run_app(CUT_SHORT_TWICE, AEGIS_RUN_MAX_LLM_CALLS="1")
+    assert '"exhausted": "llm_calls"' in result["streamed"]
+    for body in result["bodies"]:
+        assert body["cached"] is False and body["run"]["exhausted"] == "llm_calls"
+        assert body["response"].startswith("I could not answer")
+    assert result["model_calls"] == 3  # one per request: nothing came from the answer cache
+    assert result["cache"]["entries"] == 0 and result["templates"]["patterns"] == 0
@@ -0,0 +1,74 @@
+import sqlite3
+
+from src.cache import AnswerCache, QueryResultCache, database_version, normalize_question
+from src.sqltext import canonicalize_sql, is_read_only_sql
+
+
+def test_normalize_question_folds_case_punctuation_and_numbers():
+    assert normalize_question("Top 10 actors?") == "top 10 actors"
+    assert normalize_question("  top TEN   actors! ") == "top 10 actors"
+    assert normalize_question("films longer than 1,000.50 minutes") == "films longer than 1000.5 minutes"
+    assert normalize_question("top 5 actors") != normalize_question("top 6 actors")
+
+
+def test_answer_cache_lru_and_ttl(monkeypatch):
+    cache = AnswerCache(max_entries=2, ttl=10)
+    cache.put("a", "A", version=1)
+    cache.put("b", "B", version=1)
+    assert cache.get("a", version=1) == "A"
+    cache.put("c", "C", version=1)  # evicts "b", the least recently used
+    assert cache.get("b", version=1) is None
+    assert cache.stats()["evictions"] == 1
+
+    clock = [1000.0]
+    monkeypatch.setattr("src.cache.time.monotonic", lambda: clock[0])
+    cache.put("d", "D", version=1)
+    clock[0] += 11
+    assert cache.get("d", version=1) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_answer_cache_invalidates_on_database_write(sakila_db):
+    cache = AnswerCache()
+    before = database_version(sakila_db)
+    cache.put("how many actors", "100", before)
+    assert cache.get("how many actors", before) == "100"
+
+    conn = sqlite3.connect(sakila_db)
+    conn.execute("INSERT INTO actor VALUES (1000, 'NEW', 'ACTOR', '2024-01-01')")
+    conn.commit()
+    conn.close()
+
+    after = database_version(sakila_db)
+    assert after != before
+    assert cache.get("how many actors", after) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_query_cache_is_bounded_by_bytes():
+    cache = QueryResultCache(max_bytes=100, max_entry_bytes=60)
+    cache.put("q1", "x" * 40, version=1)
+    cache.put("q2", "y" * 40, version=1)
+    assert cache.get("q1", version=1) == "x" * 40  # q1 now most recently used
+    cache.put("q3", "z" * 40, version=1)  # 120 bytes > 100: evict q2
+    assert cache.get("q2", version=1) is None
+    assert cache.bytes_used == 80
+    assert cache.put("huge", "h" * 61, version=1) is False
+    assert cache.stats()["skipped_too_large"] == 1
+
+
+def test_query_cache_keys_on_canonical_sql_and_invalidates():
+    cache = QueryResultCache(max_bytes=1000)
+    cache.put(canonicalize_sql("SELECT  count(*) FROM rental;"), "[(16044,)]", version=1)
+    assert cache.get(canonicalize_sql("select count(*)\nfrom RENTAL"), version=1) == "[(16044,)]"
+    assert cache.get(canonicalize_sql("select count(*) from rental"), version=2) is None
+    cache.put("k", "v", version=2)
+    cache.invalidate()
+    assert cache.get("k", version=2) is None
+
+
+def test_is_read_only_sql():
+    assert is_read_only_sql("WITH t AS (SELECT 1) SELECT * FROM t")
+    assert is_read_only_sql("select replace(title, 'A', 'B') from film")
+    assert not is_read_only_sql("UPDATE film SET title = 'x'")
+    assert not is_read_only_sql("select 1; delete from film")
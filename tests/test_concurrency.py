@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from src.concurrency import QueueFull, QueueTimeout, RunLimiter, SingleFlight
+
+
+def test_limiter_caps_in_flight_runs():
+    async def scenario():
+        limiter = RunLimiter(max_in_flight=2, max_queue=10, queue_timeout=5)
+        peak = 0
+
+        async def run():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(run() for _ in range(8)))
+        return peak, limiter.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    assert stats["admitted"] == 8
+    assert stats["in_flight"] == 0
+
+
+def test_limiter_rejects_when_queue_full():
+    async def scenario():
+        limiter = RunLimiter(max_in_flight=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFull):
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, queued)
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected_queue_full"] == 1
+    assert stats["admitted"] == 2
+
+
+def test_limiter_times_out_queued_callers():
+    async def scenario():
+        limiter = RunLimiter(max_in_flight=1, max_queue=4, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueTimeout):
+            async with limiter.slot():
+                pass
+        release.set()
+        await holder
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_shares_one_run_between_concurrent_callers():
+    async def scenario():
+        flight = SingleFlight()
+        runs = 0
+
+        async def work():
+            nonlocal runs
+            runs += 1
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("q", work) for _ in range(5)), flight.do("other", work))
+        again = await flight.do("q", work)  # nothing in flight any more: runs again
+        return runs, results, again, flight.stats()
+
+    runs, results, again, stats = asyncio.run(scenario())
+    assert runs == 3
+    assert [shared for _, shared in results] == [False, True, True, True, True, False]
+    assert again == ("answer", False)
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (3, 4, 0)
+
+
+def test_single_flight_leader_error_reaches_followers():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("bad question")
+
+        return await asyncio.gather(*(flight.do("q", fail) for _ in range(3)), return_exceptions=True), flight.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert stats["leader_errors"] == 1 and stats["leaders"] == 1
+
+
+def test_single_flight_promotes_a_follower_when_the_leader_is_cancelled():
+    async def scenario():
+        flight = SingleFlight()
+        runs = 0
+
+        async def work():
+            nonlocal runs
+            runs += 1
+            await asyncio.sleep(0.05)
+            return runs
+
+        leader = asyncio.ensure_future(flight.do("q", work))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.ensure_future(flight.do("q", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return runs, results, leader.cancelled(), flight.stats()
+
+    runs, results, leader_cancelled, stats = asyncio.run(scenario())
+    assert leader_cancelled and runs == 2
+    assert sorted(results) == [(2, False), (2, True), (2, True)]
+    assert (stats["leader_cancellations"], stats["coalesced"], stats["in_flight"]) == (1, 2, 0)
+
+
+COALESCED_CHAT = """
+from concurrent.futures import ThreadPoolExecutor
+
+m.llm = ScriptedChatModel(latency_s=0.2, scenarios=[
+    {"question": "how many films", "turns": [
+        {"tool_calls": [{"name": "sql_db_query", "args": {"query": "SELECT COUNT(*) FROM film"}}]},
+        {"content": "300 films."}]}])
+with TestClient(m.app_service) as client:
+    with ThreadPoolExecutor(6) as pool:
+        answers = list(pool.map(lambda q: client.post("/chat", params={"question": q}).json()["response"],
+                                ["How many films?"] * 3 + ["how many FILMS"] * 3))
+    health = client.get("/health").json()
+emit(answers=answers, calls=m.llm.calls, coalescing=health["coalescing"])
+"""
+
+
+def test_identical_concurrent_chats_share_one_graph_run(run_app):
+    result = run_app(COALESCED_CHAT)
+    assert result["answers"] == ["300 films."] * 6
+    assert result["calls"] == 2  # one run: a tool call turn and the answer
+    assert result["coalescing"]["coalesced"] == 5
+    assert result["coalescing"]["model_calls_saved"] == 10
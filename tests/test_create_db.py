@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from utility.create_db import (SOURCES, BundleError, build_database, download_sources, setup_database, sha256_file,
+                               verify_bundle)
+
+SCHEMA_SQL = """
+CREATE TABLE actor (actor_id INTEGER PRIMARY KEY, last_name TEXT, last_update TIMESTAMP);
+CREATE INDEX idx_actor_last_name ON actor(last_name);
+CREATE TRIGGER actor_trigger_au AFTER UPDATE ON actor FOR EACH ROW BEGIN
+  UPDATE actor SET last_update = 'now' WHERE rowid = new.rowid;
+END;
+CREATE TABLE film (film_id INTEGER PRIMARY KEY, title TEXT);
+CREATE VIEW actor_names AS SELECT last_name FROM actor;
+"""
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    schema_name, data_name = list(SOURCES)
+    (tmp_path / schema_name).write_text(SCHEMA_SQL)
+    lines = ["BEGIN TRANSACTION;"]
+    lines += [f"INSERT INTO actor VALUES ({i}, 'LAST{i % 7}', NULL);" for i in range(1, 201)]
+    lines += [f"INSERT INTO film (film_id, title)\n VALUES ({i}, 'A; title');" for i in range(1, 51)]
+    lines += ["COMMIT;"]
+    (tmp_path / data_name).write_text("\n".join(lines))
+    return tmp_path
+
+
+def pins(bundle):
+    return {name: sha256_file(str(bundle / name)) for name in SOURCES}
+
+
+def test_build_defers_indexes_and_reports_rows(bundle, tmp_path):
+    paths = verify_bundle(str(bundle), pins(bundle))
+    db_file = str(tmp_path / "out" / "sakila.db")
+    report = build_database(*paths.values(), db_file=db_file)
+
+    assert report["actor"][0] == 200 and report["film"][0] == 50
+    conn = sqlite3.connect(db_file)
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+    assert {"idx_actor_last_name", "actor_trigger_au", "actor_names", "sqlite_stat1"} <= names
+    assert conn.execute("SELECT COUNT(*) FROM actor_names").fetchone()[0] == 200
+    conn.close()
+
+
+def test_verify_bundle_rejects_modified_file(bundle):
+    expected = pins(bundle)
+    data_name = list(SOURCES)[1]
+    with open(bundle / data_name, "a") as f:
+        f.write("\nINSERT INTO film VALUES (999, 'x');")
+    with pytest.raises(BundleError, match="checksum mismatch"):
+        verify_bundle(str(bundle), expected)
+    with pytest.raises(BundleError, match="no pinned SHA-256"):
+        verify_bundle(str(bundle), dict(expected, **{data_name: ""}))
+
+
+def test_download_is_checked_against_the_pin_before_it_is_saved(tmp_path, monkeypatch):
+    import requests
+
+    class Response:
+        content = b"CREATE TABLE tampered (x);"
+
+        def raise_for_status(self):
+            pass
+
+    monkeypatch.setattr(requests, "get", lambda url, timeout: Response())
+    schema_name = list(SOURCES)[0]
+    with pytest.raises(BundleError, match="checksum mismatch"):
+        download_sources(str(tmp_path), {schema_name: "0" * 64})
+    assert not (tmp_path / schema_name).exists()
+
+
+def test_setup_database_builds_offline_from_a_bundle_pinned_on_the_command_line(bundle, tmp_path, monkeypatch):
+    monkeypatch.delenv("AEGIS_SAKILA_SHA256", raising=False)
+    db_file = str(tmp_path / "built" / "sakila.db")
+    assert not setup_database(db_file, str(bundle), offline=True)  # the committed pins do not match this bundle
+    assert not os.path.exists(db_file)
+
+    assert setup_database(db_file, str(bundle), offline=True, sha256=pins(bundle))
+    conn = sqlite3.connect(db_file)
+    assert conn.execute("SELECT COUNT(*) FROM actor").fetchone()[0] == 200
+    conn.close()
+
+    monkeypatch.setenv("AEGIS_SAKILA_SHA256", ",".join(f"{name}={digest}" for name, digest in pins(bundle).items()))
+    assert setup_database(db_file, str(bundle), offline=True, force=True)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    args = [a for name, digest in pins(bundle).items() for a in ("--sha256", f"{name}={digest}")]
+    cli = subprocess.run([sys.executable, "utility/create_db.py", "--db", str(tmp_path / "cli.db"), "--bundle",
+                          str(bundle), "--offline", *args], cwd=root, capture_output=True, text=True, timeout=60,
+                         env=dict(os.environ, AEGIS_SAKILA_SHA256=""))
+    assert cli.returncode == 0, cli.stdout + cli.stderr
+    assert "Database setup complete." in cli.stdout and os.path.exists(tmp_path / "cli.db")
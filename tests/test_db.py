@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src.agents.analyst import sample_query_latency
+from src.db import ConnectionPool, get_pool
+
+
+def test_pool_reuses_one_read_only_wal_connection_per_thread(sakila_db):
+    pool = ConnectionPool(sakila_db)
+    assert pool.journal_mode == "wal"
+    assert pool.connection() is pool.connection()
+
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(id(pool.connection()))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(seen)) == 3
+    assert pool.stats()["opened"] == 4
+
+    with pytest.raises(sqlite3.OperationalError):
+        pool.connection().execute("DELETE FROM actor")
+    pool.close_all()
+
+
+def test_pool_tracks_only_per_thread_connections_and_counts_every_checkout(sakila_db):
+    pool = ConnectionPool(sakila_db)
+    for _ in range(5):
+        pool.connect(check_same_thread=False).close()  # SQLAlchemy's creator: the caller owns these
+
+    def checkout():
+        for _ in range(1000):
+            pool.connection()
+
+    threads = [threading.Thread(target=checkout) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = pool.stats()
+    assert (stats["opened"], stats["open_connections"], stats["checkouts"]) == (9, 4, 4000)
+    pool.close_all()
+    assert pool.stats()["open_connections"] == 0
+
+
+def test_pool_connections_are_tuned(sakila_db):
+    pool = ConnectionPool(sakila_db, mmap_bytes=1 << 20, cache_kib=2048)
+    conn = pool.connection()
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == -2048
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+    pool.close_all()
+
+
+def test_latency_samples_reuse_pooled_connection(sakila_db):
+    for _ in range(5):
+        assert sample_query_latency(sakila_db, "SELECT COUNT(*) FROM rental") >= 0
+    assert get_pool(sakila_db, read_only=False, wal=False).stats()["opened"] == 1
+
+
+def test_latency_samples_can_write_and_leave_the_journal_mode_alone(sakila_db):
+    assert sample_query_latency(sakila_db, "UPDATE actor SET last_name = 'SAMPLED' WHERE actor_id = 1") >= 0
+    conn = sqlite3.connect(sakila_db)
+    try:
+        assert conn.execute("SELECT last_name FROM actor WHERE actor_id = 1").fetchone() == ("SAMPLED",)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal"
+    finally:
+        conn.close()
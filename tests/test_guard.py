@@ -0,0 +1,64 @@
+import json
+import sqlite3
+
+import pytest
+
+from src.guard import QueryGuard, QueryRejected, add_limit
+from src.results import execute_query
+
+INFINITE = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+
+
+def test_add_limit_only_touches_unbounded_selects():
+    assert add_limit("SELECT * FROM film;", 11) == "SELECT * FROM film\nLIMIT 11"
+    assert add_limit("select * from film -- all", 11).endswith("-- all\nLIMIT 11")
+    assert add_limit("SELECT * FROM film LIMIT 5", 11) == "SELECT * FROM film LIMIT 5"
+    # A LIMIT inside a subquery does not bound the outer statement
+    assert add_limit("SELECT * FROM (SELECT * FROM film LIMIT 5) JOIN actor", 11).endswith("LIMIT 11")
+    assert add_limit("PRAGMA table_info(film)", 11) == "PRAGMA table_info(film)"
+
+
+def test_explain_statements_are_neither_costed_nor_limited(sakila_db):
+    conn = sqlite3.connect(sakila_db)
+    guard = QueryGuard(max_plan_rows=1_000, max_rows=100)
+    for sql in ("EXPLAIN QUERY PLAN SELECT * FROM rental r, film f, actor a",
+                "  explain SELECT * FROM rental r, film f, actor a"):
+        assert guard.prepare(conn, sql) is sql
+        assert conn.execute(sql).fetchall()
+    assert guard.stats()["rejected_plan"] == guard.stats()["rewritten"] == 0
+    conn.close()
+
+
+def test_cartesian_plan_is_rejected_before_running(sakila_db):
+    conn = sqlite3.connect(sakila_db)
+    guard = QueryGuard(max_plan_rows=1_000_000, max_rows=100)
+    with pytest.raises(QueryRejected) as rejected:
+        guard.prepare(conn, "SELECT * FROM rental r, film f, actor a")  # 3000 x 300 x 100
+    error = json.loads(rejected.value.tool_error()[len("Error: "):])
+    assert error["reason"] == "plan_too_expensive" and "scan rental" in error["detail"]
+    assert error["hint"]
+
+    # Joined on keys the same tables are cheap (index lookups), and get a LIMIT
+    sql = "SELECT a.first_name, f.title FROM actor a JOIN film_actor fa ON fa.actor_id = a.actor_id " \
+          "JOIN film f ON f.film_id = fa.film_id"
+    assert guard.prepare(conn, sql) == sql + "\nLIMIT 101"
+    # A correlated subquery multiplies with the query it runs in
+    with pytest.raises(QueryRejected):
+        guard.prepare(conn, "SELECT (SELECT COUNT(*) FROM rental x, film y WHERE x.rental_id > c.customer_id) "
+                            "FROM customer c")
+    assert guard.stats()["rejected_plan"] == 2 and guard.stats()["rewritten"] == 1
+
+
+@pytest.mark.parametrize("budget, reason", [({"max_seconds": 0.2, "max_steps": 0}, "time_budget"),
+                                            ({"max_seconds": 0, "max_steps": 100_000}, "step_budget")])
+def test_runaway_statement_is_interrupted(sakila_db, budget, reason):
+    conn = sqlite3.connect(sakila_db)
+    guard = QueryGuard(max_plan_rows=0, **budget)
+    with pytest.raises(QueryRejected) as rejected:
+        with guard.budget(conn):
+            execute_query(conn, INFINITE, 10)
+    assert rejected.value.reason == reason
+    # The handler is removed afterwards: the connection runs normal statements again
+    assert execute_query(conn, "SELECT COUNT(*) FROM rental", 10).rows == [(3000,)]
+    with guard.budget(conn):
+        assert execute_query(conn, "SELECT COUNT(*) FROM film", 10).rows == [(300,)]
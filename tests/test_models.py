@@ -0,0 +1,170 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from benchmarks.scripted_model import ScriptedChatModel
+from src.models import (ModelBackend, ModelRouter, answer_problem, build_chat_model, escalation_reason,
+                        is_simple_question)
+
+ANSWER = [{"question": "q", "turns": [{"content": "answer"}]}]
+
+
+class FailingChatModel(ScriptedChatModel):
+    """A stand-in provider that is down."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        raise ConnectionError("provider unavailable")
+
+
+def backend(name, tier=0, latency_s=0.0, provider=None, model=None):
+    model = model or ScriptedChatModel(scenarios=ANSWER, latency_s=latency_s)
+    return ModelBackend(name, model, provider=provider or name, tier=tier)
+
+
+def test_escalation_and_validation_rules():
+    question = [HumanMessage(content="q")]
+    call = AIMessage(content="", tool_calls=[{"name": "sql_db_query", "args": {"query": "x"}, "id": "1"}])
+    assert escalation_reason(question + [call, ToolMessage(content="[(1,)]", tool_call_id="1")]) is None
+    assert escalation_reason(question + [call, ToolMessage(content="Error: no such table", tool_call_id="1")]) == (
+        "sql_error")
+    # Only the current question's turn counts
+    earlier = [HumanMessage(content="old"), call, ToolMessage(content="Error: x", tool_call_id="1")]
+    assert escalation_reason(earlier + question) is None
+    assert answer_problem(AIMessage(content="  ")) == "empty_answer"
+    assert answer_problem(AIMessage(content=[{"type": "text", "text": "42"}])) is None
+    assert answer_problem(call) is None
+    assert is_simple_question("top 5 actors", 40) and not is_simple_question("word " * 41, 40)
+
+
+def test_router_uses_cheap_tier_first_and_clamps_tiers():
+    cheap, strong = backend("flash", tier=0), backend("pro", tier=1)
+    router = ModelRouter([strong, cheap])
+
+    async def scenario():
+        return [await router.ainvoke([HumanMessage(content="q")], tier) for tier in (0, 1, 5)]
+
+    routed = asyncio.run(scenario())
+    assert [(r.backend, r.tier) for r in routed] == [("flash", 0), ("pro", 1), ("pro", 1)]
+    assert routed[0].message.content == "answer" and not routed[0].hedged
+    assert (cheap.calls, strong.calls) == (1, 2)
+
+
+def test_slow_call_is_hedged_to_another_provider():
+    slow = backend("gemini", latency_s=0.5)
+    slow.latencies.extend([0.01] * 20)  # its usual p95 is 10ms
+    same_provider = backend("gemini-b", latency_s=0.0, provider="gemini")
+    other = backend("azure", latency_s=0.02)
+    for b in (same_provider, other):
+        b.latencies.append(0.05)  # usually slower than "gemini", so "gemini" is picked first
+    router = ModelRouter([same_provider, other, slow], hedge_min_samples=20)
+    assert router.ranked(0)[0] is slow
+    assert router.backup_for(slow) is other
+    assert router.deadline(slow) == pytest.approx(0.01)
+
+    async def scenario():
+        started = time.perf_counter()
+        routed = await router.ainvoke([HumanMessage(content="q")])
+        return routed, time.perf_counter() - started
+
+    routed, elapsed = asyncio.run(scenario())
+    assert (routed.backend, routed.hedged) == ("azure", True)
+    assert elapsed < 0.3  # did not wait for the slow provider
+    assert (slow.hedged, other.backup_wins, router.hedges) == (1, 1, 1)
+    assert slow.in_flight == 0 and slow.latencies[-1] < 0.5  # the cancelled call left a lower-bound sample
+
+
+def test_failing_provider_fails_over_and_is_ranked_last():
+    down = backend("down", model=FailingChatModel(scenarios=ANSWER))
+    up = backend("up", latency_s=0.01)
+    up.latencies.append(0.01)  # measured, so the unmeasured backend is tried first
+    router = ModelRouter([down, up])
+
+    async def scenario():
+        return [await router.ainvoke([HumanMessage(content="q")]) for _ in range(3)]
+
+    routed = asyncio.run(scenario())
+    assert routed[0].failed_over and routed[0].backend == "up"
+    assert [r.failed_over for r in routed[1:]] == [False, False]  # "down" is now above max_error_rate
+    assert down.stats()["errors"] == 1 and down.error_rate == 1.0
+    assert router.stats()["failovers"] == 1
+
+
+ESCALATED_CHAT = """
+script = [{"question": "how many films", "turns": [
+    {"tool_calls": [{"name": "sql_db_query", "args": {"query": "SELECT COUNT(*) FROM films"}}]},
+    {"content": "answer from the strong tier"}]}]
+cheap = ModelBackend("flash", ScriptedChatModel(scenarios=script), provider="scripted", tier=0)
+strong = ModelBackend("pro", ScriptedChatModel(scenarios=script), provider="scripted", tier=1)
+m.model_router = ModelRouter([cheap, strong])
+with TestClient(m.app_service) as client:
+    answer = client.post("/chat", params={"question": "How many films?"}).json()["response"]
+    models = client.get("/health").json()["models"]["backends"]
+    escalations = m.MODEL_ESCALATIONS.value(reason="sql_error")
+emit(answer=answer, calls={n: b["calls"] for n, b in models.items()}, escalations=escalations)
+"""
+
+
+def test_failed_sql_escalates_the_run_to_the_strong_tier(run_app):
+    result = run_app(ESCALATED_CHAT)
+    assert result["answer"] == "answer from the strong tier"
+    assert result["calls"] == {"flash": 1, "pro": 1}
+    assert result["escalations"] == 1
+
+
+ESCALATED_STREAM = """
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+class DraftModel(ScriptedChatModel):
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        bad_call = {"name": "sql_db_query", "args": "{not json", "id": "c1", "error": "bad args",
+                    "type": "invalid_tool_call"}
+        message = AIMessage(content="CHEAP-TIER-DRAFT", invalid_tool_calls=[bad_call])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+script = [{"question": "how many films", "turns": [{"content": "STRONG-ANSWER"}]}]
+cheap = ModelBackend("flash", DraftModel(scenarios=script), provider="scripted", tier=0)
+strong = ModelBackend("pro", ScriptedChatModel(scenarios=script), provider="scripted", tier=1)
+m.model_router = ModelRouter([cheap, strong])
+with TestClient(m.app_service) as client:
+    with client.stream("POST", "/chat/stream", params={"question": "How many films?"}) as response:
+        body = "".join(response.iter_text())
+emit(body=body, calls=[cheap.calls, strong.calls])
+"""
+
+
+def test_stream_sends_only_the_reply_the_router_kept(run_app):
+    result = run_app(ESCALATED_STREAM)
+    assert result["calls"] == [1, 1]
+    assert "CHEAP-TIER-DRAFT" not in result["body"]
+    assert result["body"].count('event: token\ndata: {"text": "STRONG-ANSWER"}') == 1
+    assert '"response": "STRONG-ANSWER"' in result["body"]
+
+
+def test_gemini_script_runs_directly_from_any_directory(sakila_db, tmp_path):
+    (tmp_path / "data").mkdir()
+    shutil.copy(sakila_db, tmp_path / "data" / "sakila.db")
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "main_gemini.py")
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "PYTHONPATH")}
+    out = subprocess.run([sys.executable, script], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+    # It gets as far as building the model, which needs a key
+    assert "No module named 'src'" not in out.stderr
+    assert "GOOGLE_API_KEY environment variable not set" in out.stderr
+
+
+def test_azure_provider_without_its_sdk_says_what_to_install():
+    try:
+        import langchain_openai  # noqa: F401
+    except ImportError:
+        with pytest.raises(RuntimeError, match="pip install langchain-openai"):
+            build_chat_model("azure_openai", "gpt-4")
+    else:
+        pytest.skip("langchain-openai is installed")
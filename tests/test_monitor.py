@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+
+import src.agents.monitor as monitor_module
+from src.agents.baseline import BaselineStore
+from src.agents.monitor import Canary, Monitor, TimeSeriesStore, load_canaries
+
+
+def test_store_rolls_up_and_prunes(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "monitor.db"), raw_retention=600, minute_retention=7200)
+    start = 1_000_000_020.0  # 20s into a minute, 20s into an hour
+    for i, value in enumerate([0.01, 0.03, None, 0.02]):
+        store.record("ping", start + i * 20, value)  # three samples in the first minute, one in the next
+    store.add_alert(start + 40, "ping", None, "canary failed")
+
+    minutes = store.points("ping", "1m")
+    assert [(p["count"], p["errors"]) for p in minutes] == [(2, 1), (1, 0)]
+    assert abs(minutes[0]["mean"] - 0.02) < 1e-9
+    assert (minutes[0]["min"], minutes[0]["max"]) == (0.01, 0.03)
+    assert [p["count"] for p in store.points("ping", "1h")] == [3]
+    assert len(store.points("ping", "raw", since=start + 30)) == 2
+    assert store.alerts()[0]["reason"] == "canary failed"
+
+    # An hour later: raw samples expire, minute and hour buckets remain
+    assert store.prune(now=start + 3600) == 4
+    assert store.points("ping", "raw") == [] and len(store.points("ping", "1m")) == 2
+    store.prune(now=start + 3 * 3600)
+    assert store.points("ping", "1m") == [] and len(store.points("ping", "1h")) == 1
+    assert store.stats()["raw"] == 0
+    store.close()
+
+
+def test_store_counts_rows_without_querying(tmp_path):
+    path = str(tmp_path / "monitor.db")
+    store = TimeSeriesStore(path)
+    start = 1_000_000_020.0
+    for i, value in enumerate([0.01, 0.03, 0.02]):
+        store.record("ping", start + i * 30, value)  # two minute buckets, one hour bucket
+    store.record("ping", start, 0.05)  # the same sample again replaces it
+    store.add_alert(start, "ping", 0.05, "slow")
+    expected = {"raw": 3, "rollup": 3, "alert": 1}
+    assert {table: store.stats()[table] for table in expected} == expected
+
+    store._conn.close()  # stats() must not touch the connection
+    assert store.stats()["raw"] == 3 and store.stats()["bytes"] > 0
+    reopened = TimeSeriesStore(path)
+    assert {table: reopened.stats()[table] for table in expected} == expected
+    reopened.prune(now=start + 2 * 86400)
+    assert reopened.stats()["raw"] == 0
+    reopened.close()
+
+
+def test_load_canaries_accepts_inline_json_or_a_file(tmp_path):
+    assert [c.name for c in load_canaries("")] == ["ping", "catalog"]
+    spec = [{"name": "rentals", "sql": "SELECT COUNT(*) FROM rental", "interval_s": 5}]
+    assert load_canaries(json.dumps(spec)) == [Canary("rentals", "SELECT COUNT(*) FROM rental", 5.0)]
+    path = tmp_path / "canaries.json"
+    path.write_text(json.dumps(spec))
+    assert load_canaries(str(path))[0].interval_s == 5.0
+
+
+def test_monitor_samples_canaries_and_alerts(sakila_db, tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "monitor.db"))
+    baselines = BaselineStore(str(tmp_path / "baselines.json"))
+    alerts = []
+    canaries = [Canary("ping", "SELECT 1", 0.01), Canary("broken", "SELECT * FROM missing_table", 0.01)]
+    monitor = Monitor(sakila_db, store, canaries, baselines, jitter=0.5, on_alert=alerts.append)
+
+    async def scenario():
+        await monitor.start()
+        await asyncio.sleep(0.3)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    assert monitor.samples >= 4 and monitor.failures >= 2
+    assert {a["series"] for a in alerts} == {"broken"}  # the ping has no baseline yet, so it never alerts
+    assert "canary failed" in alerts[0]["reason"]
+    assert monitor.last["ping"]["latency_s"] is not None
+    assert len(BaselineStore(str(tmp_path / "baselines.json"))) == 1  # saved on stop
+
+    reopened = TimeSeriesStore(str(tmp_path / "monitor.db"))
+    assert sum(p["count"] for p in reopened.points("ping", "1m")) >= 2
+    assert sum(p["errors"] for p in reopened.points("broken", "1m")) == len(alerts)
+    assert len(reopened.alerts(limit=100)) == len(alerts)
+    reopened.close()
+
+
+def test_monitor_flags_a_latency_anomaly(sakila_db, tmp_path):
+    baselines = BaselineStore()
+    for _ in range(50):
+        baselines.record("SELECT 1", 1e-9)  # an impossibly fast history
+    monitor = Monitor(sakila_db, TimeSeriesStore(str(tmp_path / "monitor.db")), [], baselines, min_samples=30)
+
+    async def scenario():
+        result = await monitor.check(Canary("ping", "SELECT 1"))
+        await monitor.stop()
+        return result
+
+    assert asyncio.run(scenario())["status"] == "alert"
+    assert monitor.recent_alerts[0]["reason"].startswith("latency")
+
+
+def test_a_stuck_sample_skips_its_canary_without_blocking_writes(sakila_db, tmp_path, monkeypatch):
+    release = threading.Event()
+
+    def sample(baselines, db_path, sql, *args):
+        if "stuck" in sql:
+            release.wait(5)
+        return 0.001, False, "ok"
+
+    monkeypatch.setattr(monitor_module, "sample_and_check", sample)
+    store = TimeSeriesStore(str(tmp_path / "monitor.db"))
+    monitor = Monitor(sakila_db, store, [], BaselineStore(), timeout=0.05, workers=2)
+    stuck, ping = Canary("stuck", "SELECT 'stuck'"), Canary("ping", "SELECT 1")
+
+    async def scenario():
+        first = await monitor.check(stuck)  # times out; its thread stays busy
+        again = await monitor.check(stuck)
+        other = await monitor.check(ping)  # still sampled and stored
+        release.set()
+        await asyncio.sleep(0.05)
+        after = await monitor.check(stuck)
+        await monitor.stop()
+        return first, again, other, after
+
+    first, again, other, after = asyncio.run(scenario())
+    assert first["status"] == "alert" and monitor.failures == 1
+    assert again["status"] == "skipped" and monitor.skipped == 1
+    assert other["status"] == "ok" and after["status"] == "ok"
+    assert monitor.samples == 3
+    reopened = TimeSeriesStore(str(tmp_path / "monitor.db"))
+    assert sum(p["count"] for p in reopened.points("ping", "1m")) == 1
+    stuck_points = reopened.points("stuck", "1m")
+    assert (sum(p["count"] for p in stuck_points), sum(p["errors"] for p in stuck_points)) == (1, 1)
+    reopened.close()
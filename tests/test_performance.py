@@ -0,0 +1,109 @@
+import sqlite3
+
+from src.agents.performance import (
+    IndexAdvisor,
+    WorkloadQuery,
+    column_usage,
+    plan_problems,
+    table_aliases,
+    workload_from_recorder,
+)
+from src.agents.workload import WorkloadRecorder
+from src.guard import QueryGuard, QueryRejected
+
+SCHEMA = {
+    "rental": ["rental_id", "rental_date", "inventory_id", "customer_id"],
+    "customer": ["customer_id", "first_name"],
+}
+
+
+def test_plan_problems_flags_scans_and_temp_btrees():
+    plan = ["SCAN r", "SEARCH c USING INTEGER PRIMARY KEY (rowid=?)", "USE TEMP B-TREE FOR ORDER BY",
+            "SCAN film USING COVERING INDEX idx_title"]
+    assert plan_problems(plan) == [("full_scan", "r"), ("temp_btree", None)]
+
+
+def test_column_usage_resolves_aliases_and_clauses():
+    sql = ("SELECT c.first_name FROM customer AS c JOIN rental r ON r.customer_id = c.customer_id "
+           "WHERE r.rental_date >= '2005-06-01' AND inventory_id = 7 ORDER BY r.rental_date")
+    assert table_aliases(sql, SCHEMA) == {"customer": "customer", "c": "customer", "rental": "rental", "r": "rental"}
+    usage = column_usage(sql, SCHEMA)
+    assert usage["rental"] == {"eq": ["customer_id", "inventory_id"], "range": ["rental_date"], "order": ["rental_date"]}
+    assert usage["customer"]["eq"] == ["customer_id"]
+
+
+def test_advisor_measures_on_scratch_copy_and_applies_only_on_request(sakila_db):
+    workload = [
+        WorkloadQuery("SELECT * FROM rental WHERE customer_id = 5 ORDER BY rental_date", calls=50),
+        WorkloadQuery("SELECT * FROM rental WHERE customer_id = 9 ORDER BY rental_date", calls=50),
+        WorkloadQuery("SELECT * FROM actor WHERE actor_id = 3"),
+    ]
+    advisor = IndexAdvisor(sakila_db, repeat=3, min_speedup=1.0)
+    report = advisor.advise(workload)
+
+    assert len(report["queries"]) == 2  # same fingerprint merged
+    assert report["queries"][1]["problems"] == []
+    by_cols = {tuple(c["columns"]): c for c in report["candidates"]}
+    best = by_cols[("customer_id", "rental_date")]
+    assert best["used_by_planner"] and best["size_bytes"] > 0
+    assert best["before_ms"] > 0 and best["after_ms"] > 0
+    assert ("customer_id",) not in {tuple(w["columns"]) for w in report["winners"]}  # prefix of a winner
+
+    def live_indexes():
+        conn = sqlite3.connect(sakila_db)
+        try:
+            return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        finally:
+            conn.close()
+
+    assert not any(name.startswith("aegis_idx_") for name in live_indexes())
+    applied = advisor.apply(report["winners"])
+    assert applied and "aegis_idx_rental_customer_id_rental_date" in live_indexes()
+
+
+
+def test_advisor_replays_only_what_the_guard_allows(sakila_db):
+    recorder = WorkloadRecorder()
+    recorder.record("SELECT * FROM rental WHERE customer_id = 5 ORDER BY rental_date", 0.01)
+    recorder.record("SELECT COUNT(*) FROM rental a, rental b, rental c", 10.0, error=QueryRejected.__name__)
+    assert [q.sql for q in workload_from_recorder(recorder.top())] == [
+        "SELECT * FROM rental WHERE customer_id = 5 ORDER BY rental_date"]
+
+    cartesian = WorkloadQuery("SELECT * FROM rental a, rental b, customer c")
+    slow = WorkloadQuery("SELECT * FROM rental WHERE customer_id = 5 ORDER BY rental_date")
+    report = IndexAdvisor(sakila_db, repeat=3, guard=QueryGuard(max_plan_rows=100_000, max_steps=1)).analyze(
+        [cartesian, slow])
+
+    rejected = {f["sql"]: f["rejected"] for f in report["queries"]}
+    assert rejected == {cartesian.sql: "plan_too_expensive", slow.sql: "step_budget"}
+    assert report["candidates"] == [] and report["winners"] == []
+
+
+INDEX_ADVICE = """
+import threading
+runs = []
+analyze = m.IndexAdvisor.analyze
+
+def counted(self, queries):
+    runs.append(threading.current_thread().name)
+    return analyze(self, queries)
+
+m.IndexAdvisor.analyze = counted
+m.model_router = ModelRouter([ModelBackend("scripted", ScriptedChatModel(scenarios=[]), provider="scripted")])
+with TestClient(m.app_service) as client:
+    m.workload.record("SELECT * FROM rental WHERE customer_id = 5 ORDER BY rental_date", 0.01)
+    get = client.get("/workload/indexes").status_code
+    first, again = (client.post("/workload/indexes").json() for _ in range(2))
+    m.workload.record("SELECT * FROM actor WHERE last_name = 'GUINESS'", 0.01)
+    changed = client.post("/workload/indexes").json()
+emit(get=get, cached=[first["cached"], again["cached"], changed["cached"]], same=first == dict(again, cached=False),
+     runs=runs)
+"""
+
+
+def test_index_advice_is_post_only_cached_and_off_the_tool_pool(run_app):
+    result = run_app(INDEX_ADVICE)
+    assert result["get"] == 405
+    assert result["cached"] == [False, True, False] and result["same"]
+    assert len(result["runs"]) == 2  # once per distinct workload
+    assert all(name.startswith("aegis-advisor") for name in result["runs"])
@@ -0,0 +1,87 @@
+import random
+import sqlite3
+import string
+
+import pytest
+
+from src.agents.quality import QualityDetector, minhash, normalize_text, shingles, similarity
+
+
+@pytest.fixture
+def dirty_db(tmp_path):
+    """2,000 customers with random names, plus one exact copy, one near copy and two orphans."""
+    path = str(tmp_path / "dirty.db")
+    rnd = random.Random(3)
+
+    def word():
+        return "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(6, 9))).title()
+
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE store (store_id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE customer (customer_id INTEGER PRIMARY KEY, store_id INT REFERENCES store(store_id),
+                               first_name TEXT, last_name TEXT, email TEXT, last_update TIMESTAMP);
+    """)
+    conn.executemany("INSERT INTO store VALUES (?, ?)", [(1, "Lethbridge"), (2, "Woodridge")])
+    rows = []
+    for i in range(1, 2001):
+        first, last = word(), word()
+        rows.append((i, 1 + i % 2, first, last, f"{first}.{last}@example.org".lower(), "2006-02-15"))
+    conn.executemany("INSERT INTO customer VALUES (?,?,?,?,?,?)", rows)
+    _, store, first, last, email, _ = rows[9]
+    conn.execute("INSERT INTO customer VALUES (2001, ?, ?, ?, ?, '2020-01-01')", (store, first, last, email))
+    _, store, first, last, email, _ = rows[19]
+    conn.execute("INSERT INTO customer VALUES (2002, ?, ?, ?, ?, '2006-02-15')",
+                 (store, first.upper(), last[:-1] + "x", email))
+    conn.execute("INSERT INTO customer VALUES (2003, 99, 'Ann', 'Orphan', 'ann@example.org', NULL)")
+    conn.execute("INSERT INTO customer VALUES (2004, 99, 'Bob', 'Orphan', 'bob@example.org', NULL)")
+    conn.execute("INSERT INTO customer VALUES (2005, NULL, 'Cy', 'Walkin', 'cy@example.org', NULL)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_minhash_estimates_jaccard_similarity():
+    assert normalize_text("  Crème-Brûlée, INC. ") == "creme brulee inc"
+    a = minhash(shingles("jonathan livingston jonathan livingston example org"))
+    b = minhash(shingles("jonathan livingstone jonathan livingston example org"))
+    c = minhash(shingles("mary smith mary smith example net"))
+    assert similarity(a, a) == 1.0
+    assert similarity(a, b) >= 0.7 > similarity(a, c)
+    assert minhash(set()) is None
+    with pytest.raises(ValueError):
+        minhash({1, 2}, num_hashes=24)
+
+
+def test_detector_finds_duplicates_and_dangling_keys(dirty_db):
+    report = QualityDetector(dirty_db).analyze(["customer"])
+    customer = report["tables"][0]
+    assert customer["rows"] == 2005 and customer["partitions"] == 1
+    assert "last_update" not in customer["exact"]["columns"]
+    assert customer["exact"]["groups"] == 1 and customer["exact"]["duplicate_rows"] == 1
+    assert customer["exact"]["examples"][0]["ids"] == [10, 2001]
+    assert customer["near"]["pairs"] == 1
+    assert customer["near"]["examples"][0]["ids"] == [20, 2002]
+
+    (fk,) = report["foreign_keys"]
+    assert (fk["table"], fk["columns"], fk["parent"], fk["parent_columns"]) == (
+        "customer", ["store_id"], "store", ["store_id"])
+    assert fk["dangling"] == 2  # the NULL store_id is not dangling
+    assert [e["id"] for e in fk["examples"]] == [2003, 2004]
+    assert report["rows_read"] == 2005 and report["rows_per_s"] > 0
+
+
+@pytest.mark.parametrize("block_by", [{"customer": "store_id"}, None])
+def test_partitioned_and_parallel_runs_agree(dirty_db, block_by):
+    single = QualityDetector(dirty_db).analyze(["customer"], block_by)["tables"][0]
+    sharded = QualityDetector(dirty_db, memory_rows=300, workers=2, chunk_rows=128).analyze(
+        ["customer"], block_by)["tables"][0]
+    assert single["partitions"] == 1 and sharded["partitions"] > 1
+    assert sharded["rows_read"] == single["rows_read"] == 2005  # one scan, however many partitions
+    # Near records are routed by LSH bucket, so the cap holds even without a blocking column
+    assert single["max_partition_rows"] > 300 >= sharded["max_partition_rows"]
+    assert sharded["exact"]["groups"] == single["exact"]["groups"] == 1
+    assert sharded["exact"]["examples"] == single["exact"]["examples"]
+    assert sharded["near"]["pairs"] == single["near"]["pairs"] == 1
+    assert sharded["near"]["examples"] == single["near"]["examples"]
+    assert sharded["near"]["block_by"] == (block_by or {}).get("customer")
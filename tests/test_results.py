@@ -0,0 +1,49 @@
+import sqlite3
+
+from src.results import ResultStore, cursor_id_for, execute_query, format_page
+
+
+def _rental_result(sakila_db, max_rows=100000):
+    conn = sqlite3.connect(sakila_db)
+    try:
+        return execute_query(conn, "SELECT rental_id, customer_id FROM rental ORDER BY rental_id", max_rows)
+    finally:
+        conn.close()
+
+
+def test_first_page_is_capped_and_points_at_fetch_more(sakila_db):
+    result = _rental_result(sakila_db)
+    page = format_page(result, "c_test", max_rows=20, max_bytes=10000)
+    lines = page.splitlines()
+    assert lines[0] == "columns: rental_id | customer_id"
+    assert len(lines) == 22  # header + 20 rows + footer
+    assert lines[-1] == '[rows 1-20 of 3000; more: fetch_more(cursor_id="c_test", offset=20)]'
+
+
+def test_byte_cap_and_paging(sakila_db):
+    result = _rental_result(sakila_db)
+    page = format_page(result, "c_test", offset=2990, max_rows=50, max_bytes=10000)
+    assert page.splitlines()[1].startswith("2991 | ")
+    assert page.endswith("[rows 2991-3000 of 3000]")
+    small = format_page(result, "c_test", max_rows=1000, max_bytes=200)
+    assert len(small) < 320
+
+
+def test_small_results_and_server_side_truncation(sakila_db):
+    conn = sqlite3.connect(sakila_db)
+    one = execute_query(conn, "SELECT COUNT(*) AS n FROM actor", 10)
+    assert format_page(one, "c") == "columns: n\n100\n(1 row)"
+    cut = execute_query(conn, "SELECT actor_id FROM actor", 10)
+    conn.close()
+    assert cut.truncated
+    assert "of 10+" in format_page(cut, "c", max_rows=5)
+
+
+def test_result_store_is_bounded_by_bytes(sakila_db):
+    result = _rental_result(sakila_db)
+    store = ResultStore(max_bytes=result.nbytes * 2)
+    for i in range(3):
+        store.put(cursor_id_for(f"q{i}"), result)
+    assert store.get(cursor_id_for("q0")) is None
+    assert store.get(cursor_id_for("q2")) is result
+    assert store.stats()["evictions"] == 1
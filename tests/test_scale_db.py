@@ -0,0 +1,41 @@
+import hashlib
+import sqlite3
+
+from utility.scale_db import ScaleUp
+
+
+def table_digest(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        digest = hashlib.sha256()
+        for row in conn.execute(f"SELECT * FROM {table} ORDER BY rowid"):
+            digest.update(repr(row).encode())
+        return digest.hexdigest()
+    finally:
+        conn.close()
+
+
+def test_scale_up_keeps_integrity_and_is_deterministic(sakila_db, tmp_path):
+    out_a, out_b = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    report = ScaleUp(sakila_db, out_a, factor=4, seed=7, chunk_rows=500).run()
+    ScaleUp(sakila_db, out_b, factor=4, seed=7, chunk_rows=97).run()
+
+    assert report["rental"][0] == 3 * 3000
+    conn = sqlite3.connect(out_a)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    assert conn.execute("SELECT COUNT(*) FROM customer").fetchone()[0] == 4 * 200
+    assert conn.execute("SELECT COUNT(*) FROM film_actor").fetchone()[0] == 4 * conn.execute(
+        "SELECT COUNT(*) FROM film_actor WHERE film_id <= 300").fetchone()[0]
+    assert {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")} >= {"idx_fk_film_id"}
+
+    # Skewed customers: the busiest 5% of customers hold a large share of new rentals.
+    counts = [r[0] for r in conn.execute(
+        "SELECT COUNT(*) FROM rental WHERE rental_id > 3000 GROUP BY customer_id ORDER BY 1 DESC")]
+    assert sum(counts[:40]) > 0.3 * 9000
+    # Seasonality: July outweighs February.
+    by_month = dict(conn.execute(
+        "SELECT substr(rental_date, 6, 2), COUNT(*) FROM rental WHERE rental_id > 3000 GROUP BY 1"))
+    assert by_month["07"] > 1.5 * by_month["02"]
+    conn.close()
+
+    assert table_digest(out_a, "rental") == table_digest(out_b, "rental")
@@ -0,0 +1,32 @@
+import sqlite3
+
+from src.schema_digest import SchemaDigest
+
+
+def test_digest_lists_keys_indexes_and_row_estimates(sakila_db):
+    text = SchemaDigest(sakila_db).text()
+    assert "actor(~100 rows): actor_id INTEGER PK" in text
+    assert "customer_id INT NN->customer.customer_id" in text
+    assert "PK(actor_id,film_id)" in text
+    assert "idx_fk_film_id(film_id)" in text
+
+
+def test_digest_rebuilds_only_when_schema_version_changes(sakila_db):
+    digest = SchemaDigest(sakila_db)
+    digest.text()
+    digest.text()
+    assert digest.builds == 1
+
+    conn = sqlite3.connect(sakila_db)
+    conn.execute("CREATE TABLE store (store_id INTEGER PRIMARY KEY)")
+    conn.commit()
+    conn.close()
+
+    assert "store(" in digest.text()
+    assert digest.builds == 2
+
+
+def test_digest_respects_char_budget(sakila_db):
+    text = SchemaDigest(sakila_db, max_chars=250).text()
+    assert len(text) <= 250
+    assert "more tables omitted" in text
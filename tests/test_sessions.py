@@ -0,0 +1,75 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.sessions import SessionStore, compact_history, history_bytes, split_turns
+
+
+def _turn(i, rows=200):
+    return [
+        HumanMessage(content=f"question {i}"),
+        AIMessage(content="", tool_calls=[{"name": "sql_db_query", "args": {"query": f"SELECT {i}"}, "id": f"t{i}"}]),
+        ToolMessage(tool_call_id=f"t{i}", name="sql_db_query", content="row\n" * rows),
+        AIMessage(content=f"answer {i}"),
+    ]
+
+
+def test_compaction_elides_tools_then_summarizes_then_drops():
+    history = [m for i in range(6) for m in _turn(i)]
+    compacted = compact_history(list(history), max_bytes=1200)
+    turns = split_turns(compacted)
+
+    assert history_bytes(compacted) <= 1200
+    # The latest turn is kept verbatim, tool payload included.
+    assert turns[-1] == _turn(5)
+    # Older turns are collapsed to question + answer summary with the SQL used.
+    assert all(len(t) == 2 for t in turns[:-1])
+    assert "[SQL used: SELECT 4]" in turns[-2][1].content
+
+
+def test_compaction_drops_oldest_turns_when_summaries_do_not_fit():
+    history = [m for i in range(50) for m in _turn(i, rows=10)]
+    compacted = compact_history(list(history), max_bytes=400)
+    assert compacted[0].content != "question 0"
+    assert split_turns(compacted)[-1][0].content == "question 49"
+
+
+def test_store_keeps_sessions_bounded(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("src.sessions.time.monotonic", lambda: clock[0])
+    store = SessionStore(max_bytes_per_session=1500, idle_ttl=60, max_sessions=2)
+
+    session = store.get_or_create()
+    for i in range(10):
+        store.append_turn(session, _turn(i))
+    assert session.bytes <= 1500
+    assert store.get_or_create(session.id) is session
+
+    store.get_or_create("b")
+    store.get_or_create("c")  # over capacity: least recently used goes
+    assert store.stats()["evicted_capacity"] == 1
+
+    clock[0] += 61
+    store.get_or_create("d")
+    assert store.stats()["evicted_idle"] == 2
+    assert store.stats()["sessions"] == 1
+
+
+def test_store_never_evicts_a_session_with_a_running_turn(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("src.sessions.time.monotonic", lambda: clock[0])
+    store = SessionStore(idle_ttl=60, max_sessions=2)
+
+    async def run():
+        busy = store.get_or_create("busy")
+        async with busy.lock:
+            store.get_or_create("b")
+            store.get_or_create("c")  # over capacity: "b" goes, not the older but busy session
+            assert store.get_or_create("busy") is busy
+            clock[0] += 61
+            store.get_or_create("d")  # "busy" is idle by the clock, but still running
+            assert store.get_or_create("busy") is busy
+        return store.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["evicted_capacity"], stats["evicted_idle"]) == (1, 1)
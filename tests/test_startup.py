@@ -0,0 +1,29 @@
+IMPORT_ONLY = """
+import sys
+heavy = [name for name in ("langchain_google_genai", "langgraph.graph", "langchain_community.agent_toolkits.sql.toolkit")
+         if name in sys.modules]
+emit(heavy=heavy, db_unopened=m.db is None)
+"""
+
+LIFESPAN = """
+m.llm = ScriptedChatModel(scenarios=[{"question": "q", "turns": [{"content": "OK"}]}])
+m.WARMUP_MODEL = True
+with TestClient(m.app_service) as client:
+    health = client.get("/health").json()
+    answer = client.post("/chat", params={"question": "q"}).json()["response"]
+emit(startup=health["startup"], opened=health["db_pool"]["opened"], answer=answer, model_calls=m.llm.calls)
+"""
+
+
+def test_import_is_light_and_does_not_need_the_database(run_app, tmp_path):
+    result = run_app(IMPORT_ONLY, AEGIS_DB_FILE=str(tmp_path / "missing.db"))
+    assert result["heavy"] == [] and result["db_unopened"]
+
+
+def test_lifespan_warms_up_and_reports_startup_timings(run_app):
+    result = run_app(LIFESPAN, AEGIS_WARMUP="1", AEGIS_TOOL_WORKERS="3")
+    assert {"import", "database", "llm", "graph", "schema_digest", "warmup_pool", "warmup_model", "ready"} <= set(
+        result["startup"])
+    assert result["opened"] >= 3  # one pooled connection per tool thread
+    assert result["answer"] == "OK"
+    assert result["model_calls"] == 2  # warm-up + the request
@@ -0,0 +1,79 @@
+STREAMED_CHAT = """
+query = {"name": "sql_db_query", "args": {"query": "SELECT COUNT(*) FROM actor"}}
+model = ScriptedChatModel(scenarios=[{"question": "How many actors?",
+                                      "turns": [{"tool_calls": [query]}, {"content": "There are 100 actors."}]}])
+
+
+class BrokenModel(ScriptedChatModel):
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise RuntimeError("model backend down")
+
+
+def events(client, question):
+    with client.stream("POST", "/chat/stream", params={"question": question}) as response:
+        frames = "".join(response.iter_text()).strip().split("\\n\\n")
+    return [(kind[len("event: "):], json.loads(data[len("data: "):]))
+            for kind, data in (frame.split("\\n", 1) for frame in frames)]
+
+
+m.model_router = ModelRouter([ModelBackend("scripted", model, provider="scripted")])
+with TestClient(m.app_service) as client:
+    answered = events(client, "How many actors?")
+    m.model_router = ModelRouter([ModelBackend("broken", BrokenModel(scenarios=[]), provider="scripted")])
+    failed = events(client, "How many films?")
+emit(answered=answered, failed=failed)
+"""
+
+
+def test_stream_sends_tool_progress_tokens_then_done_or_error(run_app):
+    result = run_app(STREAMED_CHAT)
+    answered = result["answered"]
+    assert [kind for kind, _ in answered] == ["tool_start", "tool_end", "token", "done"]
+    start, end, token, done = (data for _, data in answered)
+    assert start["name"] == end["name"] == "sql_db_query" and start["id"] == end["id"]
+    assert start["args"] == {"query": "SELECT COUNT(*) FROM actor"}
+    assert "100" in end["preview"]
+    assert token["text"] == done["response"] == "There are 100 actors."
+    assert done["cached"] is False and done["run"]["tool_calls"] == 1
+
+    (kind, error), = result["failed"]
+    assert kind == "error" and "model backend down" in error["error"]
+    assert error["session_id"]
+
+
+DISCONNECT_BEFORE_FIRST_BYTE = """
+import asyncio
+model = ScriptedChatModel(scenarios=[{"question": "How many actors?", "turns": [{"content": "100 actors."}]}])
+m.model_router = ModelRouter([ModelBackend("scripted", model, provider="scripted")])
+
+
+async def disconnected_stream():
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": "/chat/stream", "raw_path": b"/chat/stream",
+             "query_string": b"question=How+many+actors%3F&session_id=s1", "root_path": "",
+             "headers": [], "client": ("test", 1), "server": ("test", 80)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.disconnect"}  # the client is already gone
+
+    async def send(message):
+        await asyncio.sleep(0.1)  # a slow socket: the disconnect lands before the body starts
+        sent.append(message["type"])
+
+    await m.app_service(scope, receive, send)
+    return sent
+
+
+with TestClient(m.app_service) as client:
+    sent = client.portal.call(disconnected_stream)
+    in_flight = m.run_limiter.in_flight
+    locked = m.session_store.get_or_create("s1").lock.locked()
+emit(sent=sent, in_flight=in_flight, locked=locked)
+"""
+
+
+def test_a_client_gone_before_the_first_byte_releases_its_slot_and_session(run_app):
+    result = run_app(DISCONNECT_BEFORE_FIRST_BYTE)
+    assert "http.response.body" not in result["sent"]
+    assert result["in_flight"] == 0 and result["locked"] is False
@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from src.concurrency import RunLimiter
+from src.telemetry import MetricsRegistry, RequestTracingMiddleware, Tracer, request_id_var
+
+
+def test_spans_nest_across_tasks_and_threads():
+    tracer = Tracer(max_traces=2)
+    pool = ThreadPoolExecutor(max_workers=2)
+
+    def sql():
+        with tracer.span("sql", rows=3):
+            pass
+
+    async def tool(i):
+        with tracer.span("tool", i=i):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(pool, contextvars.copy_context().run, sql)
+
+    async def request(rid):
+        request_id_var.set(rid)
+        with tracer.span("http"):
+            await asyncio.gather(tool(1), tool(2))
+
+    async def main():
+        await asyncio.gather(request("a"), request("b"))
+        await request("c")
+
+    asyncio.run(main())
+    spans = {s["span_id"]: s for s in tracer.trace("c")}
+    assert sorted(s["name"] for s in spans.values()) == ["http", "sql", "sql", "tool", "tool"]
+    for s in spans.values():
+        if s["name"] == "sql":
+            assert spans[s["parent_id"]]["name"] == "tool"
+    assert tracer.trace("a") is None  # only the last `max_traces` requests are kept
+    assert [t["request_id"] for t in tracer.recent()] == ["c", "b"]
+    assert set(tracer.recent()[0]["breakdown_ms"]) == {"http", "tool", "sql"}
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    hist = registry.histogram("aegis_test_seconds", "Test latency.", ["route"], buckets=(0.1, 1.0))
+    hist.observe(0.05, route="/chat")
+    hist.observe(0.5, route="/chat")
+    registry.counter("aegis_test_total", "Things.", ["kind"]).inc(2, kind='a"b')
+    registry.add_collector(lambda: [("aegis_test_ratio", "gauge", "Ratio.", [({"cache": "query"}, 0.25)])])
+
+    text = registry.render()
+    assert '# TYPE aegis_test_seconds histogram' in text
+    assert 'aegis_test_seconds_bucket{route="/chat",le="0.1"} 1' in text
+    assert 'aegis_test_seconds_bucket{route="/chat",le="1"} 2' in text
+    assert 'aegis_test_seconds_bucket{route="/chat",le="+Inf"} 2' in text
+    assert 'aegis_test_seconds_count{route="/chat"} 2' in text
+    assert 'aegis_test_total{kind="a\\"b"} 2' in text
+    assert 'aegis_test_ratio{cache="query"} 0.25' in text
+
+
+def test_request_id_header_is_kept_only_when_short_and_plain():
+    registry = MetricsRegistry()
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": request_id_var.get().encode()})
+
+    middleware = RequestTracingMiddleware(
+        app, Tracer(), registry.histogram("aegis_t_seconds", "T.", ["method", "route", "status"]),
+        registry.gauge("aegis_t_in_flight", "T."), registry.counter("aegis_t_errors_total", "T.", ["where"]))
+
+    def request_id(header):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [(b"x-request-id", header)] if header is not None else []
+        scope = {"type": "http", "method": "GET", "path": "/chat", "headers": headers}
+        asyncio.run(middleware(scope, None, send))
+        echoed = dict(sent[0]["headers"])[b"x-request-id"].decode()
+        assert echoed == sent[1]["body"].decode()
+        return echoed
+
+    assert request_id(b"req-42.retry:1") == "req-42.retry:1"
+    for bad in (b"x" * 65, b"a b", b"id\r\nSet-Cookie: x=1", "caf\u00e9".encode("latin-1"), b"", None):
+        generated = request_id(bad)
+        assert len(generated) == 16 and generated.isalnum()
+
+
+def test_run_limiter_reports_queue_wait():
+    waits = []
+
+    async def main():
+        limiter = RunLimiter(max_in_flight=1, max_queue=2, on_admit=waits.append)
+
+        async def run():
+            async with limiter.slot():
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(run(), run())
+
+    asyncio.run(main())
+    assert waits[0] == 0.0 and waits[1] >= 0.015
@@ -0,0 +1,103 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.results import QueryResult
+from src.templates import TemplateStore, answer_sql, extract_template, format_answer
+
+TOP_ACTORS = ("SELECT a.first_name, COUNT(*) AS films FROM actor a JOIN film_actor fa ON fa.actor_id = a.actor_id "
+              "GROUP BY a.actor_id ORDER BY films DESC LIMIT {n}")
+BY_NAME = "SELECT COUNT(*) FROM rental r JOIN customer c USING (customer_id) WHERE c.first_name = '{first}'"
+
+
+def test_extract_template_slots_literals_found_in_the_question():
+    template = extract_template("Top ten actors by film count?", TOP_ACTORS.format(n=10))
+    assert template.pattern == ("top", 0, "actors", "by", "film", "count")
+    assert template.binding == ("10",)
+
+    template = extract_template("How many rentals did customer MARY make in 2005-05?",
+                                BY_NAME.format(first="MARY") + " AND strftime('%Y-%m', r.rental_date) = '2005-05'")
+    assert template.slots[0].kind == "string" and template.slots[0].case == "upper"
+    assert "2005" in template.pattern  # '2005-05' does not round-trip, so it stays fixed
+    # A value that appears twice in the question is ambiguous: nothing is learned
+    assert extract_template("top 5 films with 5 actors", "SELECT 1 LIMIT 5") is None
+    assert extract_template("how many films", "SELECT COUNT(*) FROM film") is None
+
+
+def test_pattern_is_served_only_after_confirmation_with_different_literals():
+    store = TemplateStore(min_support=2)
+    assert store.learn("top 3 actors by film count", TOP_ACTORS.format(n=3))
+    assert store.learn("Top 3 actors by film count!", TOP_ACTORS.format(n=3))
+    assert store.match("top 7 actors by film count") is None  # same literals twice prove nothing
+    store.learn("top 4 actors by film count", TOP_ACTORS.format(n=4))
+    match = store.match("Top seven actors by film count")
+    assert match.sql == TOP_ACTORS.format(n=7)
+    assert store.match("top many actors by film count") is None  # a number slot needs a number
+    assert store.match("bottom 7 actors by film count") is None
+
+    store.learn("customers named MARY", BY_NAME.format(first="MARY"))
+    store.learn("customers named LINDA", BY_NAME.format(first="LINDA"))
+    assert store.match("Customers named barbara").sql == BY_NAME.format(first="BARBARA")
+
+    stats = store.stats()
+    assert (stats["lookups"], stats["misses"], stats["low_confidence"]) == (5, 2, 1)
+
+
+def test_conflicting_templates_and_failures_stop_serving():
+    store = TemplateStore(min_support=2, min_share=0.8)
+    store.learn("top 3 actors by film count", TOP_ACTORS.format(n=3))
+    store.learn("top 4 actors by film count", TOP_ACTORS.format(n=4))
+    store.learn("top 5 actors by film count", TOP_ACTORS.format(n=5).replace("DESC", "ASC"))
+    assert store.match("top 6 actors by film count") is None  # 2 of 3 runs agree: below min_share
+    assert store.stats()["conflicts"] == 1
+
+    store = TemplateStore(min_support=2)
+    store.learn("top 3 actors by film count", TOP_ACTORS.format(n=3))
+    store.learn("top 4 actors by film count", TOP_ACTORS.format(n=4))
+    match = store.match("top 6 actors by film count")
+    store.record_fallback(match, failed=True)
+    assert store.match("top 6 actors by film count") is None
+    assert store.stats()["failures"] == 1 and store.top()[0]["failures"] == 1
+
+
+def test_answer_sql_needs_exactly_one_successful_query():
+    def run(*results):
+        messages = [HumanMessage(content="q")]
+        for i, (sql, output) in enumerate(results):
+            call = {"name": "sql_db_query", "args": {"query": sql}, "id": f"c{i}", "type": "tool_call"}
+            messages += [AIMessage(content="", tool_calls=[call]), ToolMessage(tool_call_id=f"c{i}", content=output)]
+        return messages + [AIMessage(content="answer")]
+
+    assert answer_sql(run(("SELECT 1", "columns: 1\n1\n(1 row)"))) == "SELECT 1"
+    assert answer_sql(run(("SELEC 1", "Error: syntax error"), ("SELECT 2", "columns: 2\n2"))) == "SELECT 2"
+    assert answer_sql(run(("SELECT 1", "ok"), ("SELECT 2", "ok"))) is None
+
+
+def test_format_answer():
+    assert format_answer(QueryResult(["n"], [(42,)])) == "n: 42"
+    table = format_answer(QueryResult(["a", "b"], [(1, "x"), (2, None), (3, "z")]), max_rows=2)
+    assert table.splitlines()[:4] == ["| a | b |", "|---|---|", "| 1 | x |", "| 2 | NULL |"]
+    assert table.endswith("and 1 more rows")
+
+
+CHAT = """
+SQL = %r
+m.llm = ScriptedChatModel(scenarios=[
+    {"question": f"top {n} actors by film count",
+     "turns": [{"tool_calls": [{"name": "sql_db_query", "args": {"query": SQL.format(n=n)}}]}, {"content": "..."}]}
+    for n in (3, 4)])
+with TestClient(m.app_service) as client:
+    for n in (3, 4):
+        client.post("/chat", params={"question": f"Top {n} actors by film count"})
+    calls = m.llm.calls
+    served = client.post("/chat", params={"question": "top 6 actors by film count"}).json()
+    listed = client.get("/templates").json()
+emit(served=served, extra_calls=m.llm.calls - calls, listed=listed)
+""" % TOP_ACTORS
+
+
+def test_chat_answers_learned_shapes_without_the_model(run_app):
+    result = run_app(CHAT)
+    assert result["extra_calls"] == 0
+    assert result["served"]["template"].startswith("t_")
+    assert len(result["served"]["response"].splitlines()) == 2 + 6
+    assert result["listed"]["stats"]["hits"] == 1
+    assert result["listed"]["templates"][0]["pattern"] == "top {0} actors by film count"
@@ -0,0 +1,42 @@
+TOOL_ROUND = """
+import asyncio, threading, time
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+
+started = {}
+
+def tool(name, seconds):
+    def run(arg: str) -> str:
+        started[name] = time.perf_counter()
+        time.sleep(seconds)
+        return f"{name} {arg}"
+    return StructuredTool.from_function(func=run, name=name, description=name)
+
+m.tools_by_name = {t.name: t for t in (tool("slow", 0.5), tool("stuck", 3.0), tool("fast", 0.0))}
+calls = [{"name": name, "args": {"arg": str(i)}, "id": f"call_{i}", "type": "tool_call"}
+         for i, name in enumerate(["slow", "stuck", "fast", "missing", "slow"])]
+calls.append({"name": "x" * 40, "args": {}, "id": "call_5", "type": "tool_call"})
+began = time.perf_counter()
+update = asyncio.run(m.tool_node({"messages": [AIMessage(content="", tool_calls=calls)]}))
+elapsed = time.perf_counter() - began
+labels = sorted(line.split('"')[1] for line in m.metrics.render().splitlines()
+                if line.startswith("aegis_tool_call_seconds_count{"))
+emit(elapsed=elapsed, spread=max(started.values()) - min(started.values()), labels=labels,
+     messages=[[msg.tool_call_id, msg.name, msg.content] for msg in update["messages"]])
+"""
+
+
+def test_tool_calls_of_one_turn_run_concurrently_in_call_order(run_app):
+    result = run_app(TOOL_ROUND, AEGIS_TOOL_TIMEOUT="1", AEGIS_TOOL_WORKERS="4")
+    # Sequentially this would take 0.5 + 1 (timeout) + 0.5 seconds
+    assert result["elapsed"] < 1.5 and result["spread"] < 0.4
+    assert result["messages"] == [
+        ["call_0", "slow", "slow 0"],
+        ["call_1", "stuck", "Error executing tool: 'stuck' timed out after 1s."],
+        ["call_2", "fast", "fast 2"],
+        ["call_3", "missing", "Error: Tool 'missing' not found."],
+        ["call_4", "slow", "slow 4"],
+        ["call_5", "x" * 40, f"Error: Tool '{'x' * 40}' not found."],
+    ]
+    # Model-supplied names outside the registered tools share one metric label
+    assert result["labels"] == ["fast", "slow", "stuck", "unknown"]
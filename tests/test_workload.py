@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from src.agents.analyst import sample_query_latency
+from src.agents.workload import WorkloadRecorder
+
+
+def test_recorder_aggregates_by_fingerprint():
+    recorder = WorkloadRecorder(ring_size=3)
+    for customer in range(5):
+        recorder.record(f"SELECT * FROM rental WHERE customer_id = {customer}", 0.002, rows=10)
+    recorder.record("SELECT COUNT(*) FROM film", 0.05, rows=1)
+
+    top = recorder.top()
+    assert [row["calls"] for row in top] == [1, 5]
+    assert top[0]["fingerprint"] == "select count ( * ) from film"
+    assert top[1]["rows"] == 50
+    assert abs(top[1]["total_time_s"] - 0.010) < 1e-9
+    assert len(recorder.recent()) == 3  # ring is bounded
+
+
+def test_recorder_evicts_cheapest_fingerprint_when_full():
+    recorder = WorkloadRecorder(max_fingerprints=2)
+    recorder.record("SELECT 1 FROM actor", 0.5)
+    recorder.record("SELECT 1 FROM film", 0.1)
+    recorder.record("SELECT 1 FROM rental", 0.3)
+    assert {row["fingerprint"].split()[-1] for row in recorder.top()} == {"actor", "rental"}
+    assert recorder.stats()["dropped_fingerprints"] == 1
+
+
+
+def test_full_recorder_evicts_the_cheapest_tenth_at_once():
+    recorder = WorkloadRecorder(max_fingerprints=20)
+    for actor in range(20):
+        recorder.record(f"SELECT c{actor} FROM actor", 0.1 * (actor + 1))
+    recorder.record("SELECT 1 FROM film", 5.0)
+    assert recorder.stats()["dropped_fingerprints"] == 2
+    recorder.record("SELECT 1 FROM rental", 5.0)  # room left: nothing more dropped
+    kept = {row["fingerprint"] for row in recorder.top(n=100)}
+    assert len(kept) == 20 and not kept & {"select c0 from actor", "select c1 from actor"}
+
+def test_flush_appends_json_lines(tmp_path, sakila_db):
+    log = tmp_path / "workload.jsonl"
+    recorder = WorkloadRecorder(log_path=str(log))
+    sample_query_latency(sakila_db, "SELECT * FROM actor WHERE actor_id = 3", recorder=recorder)
+    try:
+        with recorder.timed("SELECT * FROM missing_table"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert recorder.flush() == 2
+    lines = [json.loads(line) for line in log.read_text().splitlines()]
+    assert lines[0]["source"] == "analyst" and lines[0]["rows"] == 1
+    assert lines[1]["error"] == "RuntimeError"
+    assert recorder.flush() == 0
+
+
+def test_pending_log_entries_are_capped_without_a_flusher(tmp_path):
+    log = tmp_path / "workload.jsonl"
+    recorder = WorkloadRecorder(log_path=str(log), ring_size=100, max_pending=3)
+    for actor in range(5):
+        recorder.record(f"SELECT * FROM actor WHERE actor_id = {actor}", 0.001)
+    stats = recorder.stats()
+    assert (stats["pending_flush"], stats["dropped_pending"], stats["ring"]) == (3, 2, 5)
+    assert recorder.flush() == 3  # the newest three
+
+
+def test_failed_flush_keeps_its_entries_under_the_cap(tmp_path):
+    log = tmp_path / "workload.jsonl"
+    log.mkdir()  # opening a directory for append fails
+    recorder = WorkloadRecorder(log_path=str(log), ring_size=100, max_pending=4)
+    for actor in range(3):
+        recorder.record(f"SELECT * FROM actor WHERE actor_id = {actor}", 0.001)
+    with pytest.raises(OSError):
+        recorder.flush()
+    for film in range(2):
+        recorder.record(f"SELECT * FROM film WHERE film_id = {film}", 0.001)
+    stats = recorder.stats()
+    assert (stats["pending_flush"], stats["dropped_pending"]) == (4, 1)
+
+    log.rmdir()
+    assert recorder.flush() == 4
+    sources = [json.loads(line)["fingerprint"].split()[3] for line in log.read_text().splitlines()]
+    assert sources == ["actor", "actor", "film", "film"]
@@ -1,93 +1,313 @@
-import sqlite3
-import requests
+"""Build data/sakila.db from the Sakila SQL scripts.
+
+The two source scripts are cached in a local bundle directory (`data/source`),
+so rebuilds need no network. Each script's SHA-256 is pinned next to its URL
+in `SOURCES`: a download is checked before it is saved, and the bundle is
+checked again before every build, so a corrupted or tampered file is never
+loaded. A file whose upstream changed must be re-pinned by hand. Until a pin
+is committed, or to build from another trusted bundle, supply the digests
+with `--sha256 NAME=DIGEST` (repeatable) or `AEGIS_SAKILA_SHA256`
+(`NAME=DIGEST,NAME=DIGEST`).
+
+The load itself is tuned for a one-shot bulk build:
+- the database is written to a temporary file with `journal_mode=OFF` and
+  `synchronous=OFF`, then renamed into place, so a crash never leaves a
+  half-built `sakila.db` behind;
+- tables are created first, INSERTs run per table in large transactions
+  (`batch_statements` at a time), and secondary indexes, triggers and views
+  are created after the data is in;
+- `ANALYZE` runs at the end and rows/sec is reported per table.
+
+Usage:
+    python utility/create_db.py [--db data/sakila.db] [--bundle data/source] [--offline] [--force] \
+        [--sha256 sqlite-sakila-schema.sql=<digest> --sha256 sqlite-sakila-insert-data.sql=<digest>]
+"""
+import argparse
+import hashlib
 import os
-import time 
+import re
+import sqlite3
+import time
 
 # Source URLs for Sakila database schema and datas
 DB_FILE = "data/sakila.db"
+BUNDLE_DIR = "data/source"
 SCHEMA_URL = "https://raw.githubusercontent.com/ivanceras/sakila/master/sqlite-sakila-db/sqlite-sakila-schema.sql"
-# Note: In your original code, this URL pointed to a local file which might cause errors if setup runs. 
-# I have reverted it to the web URL just in case you ever do need to re-download it.
 DATA_URL = "https://raw.githubusercontent.com/ivanceras/sakila/master/sqlite-sakila-db/sqlite-sakila-insert-data.sql"
+# Expected SHA-256 of each script, from a download you have checked
+# (`sha256sum`). An empty pin must be supplied with --sha256 or
+# AEGIS_SAKILA_SHA256; a source with no digest at all is refused.
+SCHEMA_SHA256 = ""
+DATA_SHA256 = ""
+SOURCES = {
+    "sqlite-sakila-schema.sql": (SCHEMA_URL, SCHEMA_SHA256),
+    "sqlite-sakila-insert-data.sql": (DATA_URL, DATA_SHA256),
+}
+
+_INSERT_RE = re.compile(r'^\s*insert\s+(?:or\s+\w+\s+)?into\s+[`"\[]?(\w+)', re.IGNORECASE)
+_DEFERRED_RE = re.compile(r"^\s*create\s+(?:unique\s+)?(index|trigger|view)\b", re.IGNORECASE)
+_TRANSACTION_RE = re.compile(r"^\s*(begin|commit|end|rollback)\b", re.IGNORECASE)
+
+
+class BundleError(Exception):
+    """Source bundle is missing, incomplete or fails its checksum."""
+
+
+# --- Source bundle ---
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_sha256(items) -> dict:
+    """`NAME=DIGEST` strings (from --sha256 or AEGIS_SAKILA_SHA256) as a dict."""
+    digests = {}
+    for item in items:
+        name, sep, digest = item.strip().partition("=")
+        if not sep or name not in SOURCES or not re.fullmatch(r"[0-9a-fA-F]{64}", digest):
+            raise BundleError(f"bad SHA-256 override {item!r}: expected <source file>=<64 hex digits>")
+        digests[name] = digest.lower()
+    return digests
+
+
+def pinned_sha256(overrides: dict = None) -> dict:
+    """The expected SHA-256 of every source file: the pins in `SOURCES`, then
+    `AEGIS_SAKILA_SHA256`, then `overrides`."""
+    expected = {name: checksum for name, (_, checksum) in SOURCES.items()}
+    env = os.environ.get("AEGIS_SAKILA_SHA256", "")
+    expected.update(parse_sha256(item for item in env.split(",") if item.strip()))
+    expected.update(overrides or {})
+    return expected
+
+
+def check_sha256(name: str, actual: str, expected: dict) -> None:
+    if not expected.get(name):
+        raise BundleError(f"{name} has no pinned SHA-256 (pin it in SOURCES or pass --sha256 {name}=<digest>)")
+    if actual != expected[name]:
+        raise BundleError(f"{name}: checksum mismatch (expected {expected[name]}, got {actual})")
+
+
+def download_sources(bundle_dir: str, expected: dict = None) -> None:
+    """Fetch missing source files into `bundle_dir`; a file that fails its pin is not saved."""
+    import requests  # only needed when the bundle is incomplete
+
+    expected = pinned_sha256() if expected is None else expected
+    os.makedirs(bundle_dir, exist_ok=True)
+    for name, (url, _) in SOURCES.items():
+        path = os.path.join(bundle_dir, name)
+        if os.path.exists(path):
+            continue
+        print(f"Downloading {name} from {url}...")
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+        check_sha256(name, hashlib.sha256(response.content).hexdigest(), expected)
+        with open(path + ".part", "wb") as f:
+            f.write(response.content)
+        os.replace(path + ".part", path)
+
+
+def verify_bundle(bundle_dir: str, expected: dict = None) -> dict:
+    """Paths of the verified source files; raises BundleError otherwise.
+
+    `expected` maps file names to SHA-256 digests (default: the pins in `SOURCES`).
+    """
+    expected = pinned_sha256() if expected is None else expected
+    paths = {}
+    for name in SOURCES:
+        path = os.path.join(bundle_dir, name)
+        if not os.path.exists(path):
+            raise BundleError(f"{path} is missing")
+        check_sha256(name, sha256_file(path), expected)
+        paths[name] = path
+    return paths
+
+
+# --- Loading ---
 
-def setup_database():
+def iter_statements(path: str):
+    """Yield complete SQL statements from a script file, one at a time."""
+    buf = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            buf.append(line)
+            if line.rstrip().endswith(";") and sqlite3.complete_statement("".join(buf)):
+                statement = "".join(buf).strip()
+                buf = []
+                if statement:
+                    yield statement
+    tail = "".join(buf).strip()
+    if tail:
+        yield tail
+
+
+def split_schema(statements):
+    """(immediate, deferred): tables first; indexes, triggers and views after the data."""
+    immediate, deferred = [], []
+    for statement in statements:
+        if _TRANSACTION_RE.match(statement):
+            continue
+        (deferred if _DEFERRED_RE.match(statement) else immediate).append(statement)
+    return immediate, deferred
+
+
+def load_data(conn: sqlite3.Connection, statements, batch_statements: int = 5000) -> dict:
+    """Run INSERTs grouped per table, `batch_statements` per transaction. Returns seconds per table."""
+    timings = {}
+    batch, table, started = [], None, None
+
+    def flush():
+        if batch:
+            conn.executescript("BEGIN;\n" + "\n".join(batch) + "\nCOMMIT;")
+            batch.clear()
+
+    for statement in statements:
+        if _TRANSACTION_RE.match(statement):
+            continue
+        match = _INSERT_RE.match(statement)
+        current = match.group(1).lower() if match else None
+        if current != table:
+            flush()
+            if table is not None:
+                timings[table] = timings.get(table, 0.0) + time.perf_counter() - started
+            table, started = current, time.perf_counter()
+        batch.append(statement if statement.endswith(";") else statement + ";")
+        if len(batch) >= batch_statements:
+            flush()
+    flush()
+    if table is not None:
+        timings[table] = timings.get(table, 0.0) + time.perf_counter() - started
+    timings.pop(None, None)
+    return timings
+
+
+def build_database(schema_path: str, data_path: str, db_file: str = DB_FILE) -> dict:
+    """Build `db_file` from the two scripts; returns {table: (rows, seconds)}."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+    tmp_file = db_file + ".building"
+    if os.path.exists(tmp_file):
+        os.unlink(tmp_file)
+
+    conn = sqlite3.connect(tmp_file, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("PRAGMA cache_size=-65536")
+
+        immediate, deferred = split_schema(iter_statements(schema_path))
+        conn.executescript("BEGIN;\n" + "\n".join(immediate) + "\nCOMMIT;")
+        timings = load_data(conn, iter_statements(data_path))
+
+        start = time.perf_counter()
+        conn.executescript("BEGIN;\n" + "\n".join(deferred) + "\nCOMMIT;")
+        conn.execute("ANALYZE")
+        timings["(indexes, triggers, analyze)"] = time.perf_counter() - start
+
+        report = {}
+        for table, seconds in timings.items():
+            rows = 0
+            if not table.startswith("("):
+                rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            report[table] = (rows, seconds)
+        conn.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        conn.close()
+    os.replace(tmp_file, db_file)
+    return report
+
+
+def print_report(report: dict, elapsed: float) -> None:
+    total_rows = 0
+    for table, (rows, seconds) in report.items():
+        total_rows += rows
+        rate = f"{rows / seconds:,.0f} rows/s" if rows and seconds > 0 else ""
+        print(f"  {table:<30} {rows:>8,} rows  {seconds:7.3f}s  {rate}")
+    print(f"Loaded {total_rows:,} rows in {elapsed:.2f}s.")
+
+
+def setup_database(db_file: str = DB_FILE, bundle_dir: str = BUNDLE_DIR, offline: bool = False, force: bool = False,
+                   sha256: dict = None) -> bool:
     """
-    Checks if database exists. If not, downloads and creates it.
+    Checks if database exists. If not, builds it from the local source bundle
+    (downloading the bundle first unless `offline`). `sha256` overrides the
+    pinned digests. Returns whether `db_file` is ready.
     """
-    
-    # --- CHANGE 1: Check if file exists and SKIP if it does ---
-    if os.path.exists(DB_FILE):
-        print(f"Database '{DB_FILE}' already exists. Skipping download and setup.")
-        return
-    # ----------------------------------------------------------
+    if os.path.exists(db_file) and not force:
+        print(f"Database '{db_file}' already exists. Skipping setup (use --force to rebuild).")
+        return True
 
-    print(f"Creating new database: {DB_FILE}")
-    
+    print(f"Creating new database: {db_file}")
     try:
-        # 2. Download the SQL files
-        print(f"Downloading schema from {SCHEMA_URL}...")
-        schema_sql = requests.get(SCHEMA_URL).text
-        print("Schema download complete.")
-        
-        print(f"Downloading data from {DATA_URL}...")
-        data_sql = requests.get(DATA_URL).text
-        print("Data download complete.")
-
-        # 3. Create database and load the SQL
-        print("Connecting to database and executing SQL...")
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            
-            print("Creating tables (executing schema)...")
-            cursor.executescript(schema_sql)
-            print("Schema created.")
-            
-            print("Inserting data (executing data load)...")
-            cursor.executescript(data_sql)
-            print("Data inserted.")
-            
-        print("Database setup complete and connection closed.")
-
-    except requests.RequestException as e:
-        print(f"Error downloading SQL files: {e}")
+        expected = pinned_sha256(sha256)
+        if not offline:
+            download_sources(bundle_dir, expected)
+        paths = verify_bundle(bundle_dir, expected)
+        start = time.perf_counter()
+        report = build_database(paths["sqlite-sakila-schema.sql"], paths["sqlite-sakila-insert-data.sql"], db_file)
+        print_report(report, time.perf_counter() - start)
+        print("Database setup complete.")
+        return True
+    except BundleError as e:
+        print(f"Error with source bundle: {e}")
     except sqlite3.Error as e:
         print(f"Error loading SQL into database: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+    return False
+
 
-def test_database():
+def test_database(db_file: str = DB_FILE):
     """
     Runs a simple query to verify the database was created correctly.
     """
-    if not os.path.exists(DB_FILE):
-        print(f"Database file '{DB_FILE}' not found. Run setup_database() first.")
+    if not os.path.exists(db_file):
+        print(f"Database file '{db_file}' not found. Run setup_database() first.")
         return
 
     print("\n--- Running Test Query ---")
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with sqlite3.connect(db_file) as conn:
             cursor = conn.cursor()
-            
+
             # We'll query the 'actor' table
             query = "SELECT first_name, last_name FROM actor LIMIT 5;"
-            
+
             print(f"Executing: {query}")
-            startTime = time.time()
+            start_time = time.time()
             cursor.execute(query)
-            endTine = time.time()
-            print(f"Query executed in {endTine - startTime:.4f} seconds.")
+            end_time = time.time()
+            print(f"Query executed in {end_time - start_time:.4f} seconds.")
             results = cursor.fetchall()
-            
+
             if results:
                 print("Test query successful. First results:")
                 for i, row in enumerate(results):
                     print(f"  {i+1}: {row}")
             else:
                 print("Test query ran but returned no results.")
-                
+
     except sqlite3.Error as e:
         print(f"Error querying database: {e}")
 
+
 if __name__ == "__main__":
-    setup_database()
-    test_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the Sakila SQLite database.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--bundle", default=BUNDLE_DIR, help="directory holding the source scripts")
+    parser.add_argument("--offline", action="store_true", help="never download; use the bundle as-is")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the database exists")
+    parser.add_argument("--sha256", action="append", default=[], metavar="NAME=DIGEST",
+                        help="expected SHA-256 of a source file (overrides its pin; repeatable)")
+    args = parser.parse_args()
+    try:
+        overrides = parse_sha256(args.sha256)
+    except BundleError as e:
+        parser.error(str(e))
+    if setup_database(args.db, args.bundle, offline=args.offline, force=args.force, sha256=overrides):
+        test_database(args.db)
+    else:
+        raise SystemExit(1)
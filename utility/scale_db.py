@@ -0,0 +1,312 @@
+"""Grow an existing Sakila database by a factor for scaling tests.
+
+`create_db.py` builds the stock dataset (a thousand films, ~16k rentals).
+This script copies it and appends `factor - 1` synthetic replicas of every
+growable table:
+
+- Replica `k` of a row gets its integer primary key shifted by `k * offset`
+  (offset = the table's largest key), and every foreign key into a grown
+  table is shifted the same way, so referential integrity holds. Reference
+  tables (countries, cities, languages, categories, stores, staff) are kept
+  as-is and shared by all replicas.
+- Customers are skewed: `rental.customer_id` (and the matching
+  `payment.customer_id`) is drawn from a Zipf distribution over the whole
+  grown customer set, so a small set of customers accounts for most rentals.
+- Rental dates follow a seasonal profile (summer and December peaks, busy
+  evenings and weekends) spread over `years` years. Return dates keep the
+  template row's rental duration; payment dates follow their rental.
+- Everything is derived from a hash of `(seed, key)`, so output is
+  deterministic by seed and independent of chunk size.
+
+Rows are streamed in chunks (`fetchmany` from the source, `executemany` into
+the target), so memory stays flat however large the factor. Secondary
+indexes and triggers are dropped during the load and recreated after it.
+
+Usage:
+    python utility/scale_db.py --factor 100 [--source data/sakila.db] [--out data/sakila_x100.db] [--seed 42]
+"""
+import argparse
+import bisect
+import datetime
+import os
+import sqlite3
+import time
+
+SOURCE_DB = "data/sakila.db"
+FIXED_TABLES = {"country", "city", "language", "category", "store", "staff"}
+# (table, column) -> column whose (new) value keys the skewed/seasonal draw
+SKEWED_FKS = {("rental", "customer_id"): "rental_id", ("payment", "customer_id"): "rental_id"}
+SEASONAL_DATES = {("rental", "rental_date"): "rental_id", ("payment", "payment_date"): "rental_id"}
+# (table, column) -> start column; the template row's duration is kept
+FOLLOWS_DATE = {("rental", "return_date"): "rental_date"}
+
+MONTH_WEIGHTS = [0.7, 0.7, 0.8, 0.9, 1.1, 1.4, 1.5, 1.4, 1.0, 0.9, 1.0, 1.3]
+WEEKDAY_WEIGHTS = [0.8, 0.8, 0.9, 1.0, 1.3, 1.5, 1.2]  # Monday..Sunday
+HOUR_WEIGHTS = [0.2] * 7 + [0.4, 0.6, 0.8, 1.0, 1.1, 1.2, 1.1, 1.0, 1.1, 1.3, 1.6, 1.9, 2.0, 1.8, 1.3, 0.8, 0.4]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(x: int) -> int:
+    """splitmix64 finalizer: a fast, well-distributed 64-bit hash."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def uniforms(seed: int, salt: int, key: int, n: int):
+    """`n` deterministic uniforms in [0, 1) for (seed, salt, key)."""
+    x = _mix(seed ^ _mix(salt ^ _mix(key)))
+    out = []
+    for _ in range(n):
+        x = _mix(x)
+        out.append((x >> 11) / float(1 << 53))
+    return out
+
+
+def _cdf(weights):
+    total, acc, out = sum(weights), 0.0, []
+    for w in weights:
+        acc += w / total
+        out.append(acc)
+    out[-1] = 1.0
+    return out
+
+
+class ZipfPicker:
+    """Maps a uniform to a rank in [0, n) with P(rank) ~ 1 / (rank + 1) ** s (s != 1)."""
+
+    def __init__(self, n: int, s: float = 1.1):
+        self.n = n
+        self.s = s
+        self._top = (n + 1) ** (1 - s)
+
+    def rank(self, u: float) -> int:
+        x = ((self._top - 1) * u + 1) ** (1 / (1 - self.s))
+        return min(self.n - 1, max(0, int(x) - 1))
+
+
+class SeasonalClock:
+    """Deterministic timestamps with month, weekday and hour-of-day seasonality."""
+
+    def __init__(self, start_year: int = 2005, years: int = 3):
+        self.start = datetime.datetime(start_year, 1, 1)
+        self.days = (datetime.datetime(start_year + years, 1, 1) - self.start).days
+        weights = []
+        for d in range(self.days):
+            day = self.start + datetime.timedelta(days=d)
+            weights.append(MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()])
+        self.day_cdf = _cdf(weights)
+        self.hour_cdf = _cdf(HOUR_WEIGHTS)
+
+    def at(self, u_day: float, u_hour: float, u_second: float) -> datetime.datetime:
+        day = min(self.days - 1, bisect.bisect_left(self.day_cdf, u_day))
+        hour = min(23, bisect.bisect_left(self.hour_cdf, u_hour))
+        return self.start + datetime.timedelta(days=day, hours=hour, seconds=int(u_second * 3600))
+
+
+# --- Planning ---
+
+class TablePlan:
+    """How to produce replica `k` of every row of one table."""
+
+    def __init__(self, name, columns, pk, offset):
+        self.name = name
+        self.columns = columns
+        self.pk = pk
+        self.offset = offset
+        self.shifts = {}  # column index -> offset of the referenced table
+        self.skewed = {}  # column index -> (anchor index, parent table)
+        self.seasonal = {}  # column index -> anchor index
+        self.follows = {}  # column index -> start column index
+
+
+def _integer_pk(conn, table):
+    info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    pks = [r for r in info if r[5]]
+    if len(pks) == 1 and "INT" in str(pks[0][2]).upper():
+        return pks[0][1]
+    return None
+
+
+def plan_tables(conn: sqlite3.Connection):
+    """Table plans for every grown table, in source order."""
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid")]
+    fks = {t: conn.execute(f'PRAGMA foreign_key_list("{t}")').fetchall() for t in tables}
+    pks = {t: _integer_pk(conn, t) for t in tables}
+
+    grown = {t for t in tables if t not in FIXED_TABLES and pks[t]}
+    changed = True
+    while changed:  # link tables (composite keys) grow with the tables they reference
+        changed = False
+        for t in tables:
+            if t not in grown and t not in FIXED_TABLES and any(fk[2] in grown for fk in fks[t]):
+                grown.add(t)
+                changed = True
+
+    offsets = {}
+    for t in grown:
+        if pks[t]:
+            offsets[t] = conn.execute(f'SELECT COALESCE(MAX("{pks[t]}"), 0) FROM "{t}"').fetchone()[0]
+
+    plans = []
+    for t in tables:
+        if t not in grown:
+            continue
+        columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{t}")')]
+        index = {c: i for i, c in enumerate(columns)}
+        plan = TablePlan(t, columns, pks[t], offsets.get(t, 0))
+        if plan.pk:
+            plan.shifts[index[plan.pk]] = plan.offset
+        for fk in fks[t]:
+            parent, col = fk[2], fk[3]
+            if parent in offsets and col in index:
+                anchor = SKEWED_FKS.get((t, col))
+                if anchor in index:
+                    plan.skewed[index[col]] = (index[anchor], parent)
+                else:
+                    plan.shifts[index[col]] = offsets[parent]
+        for (table, col), anchor in SEASONAL_DATES.items():
+            if table == t and col in index and anchor in index:
+                plan.seasonal[index[col]] = index[anchor]
+        for (table, col), start in FOLLOWS_DATE.items():
+            if table == t and col in index and start in index:
+                plan.follows[index[col]] = index[start]
+        plans.append(plan)
+    return plans
+
+
+# --- Generation ---
+
+class ScaleUp:
+    """Streams `factor - 1` replicas of every grown table from `source` into `out`."""
+
+    def __init__(self, source: str, out: str, factor: int, seed: int = 42, skew: float = 1.1,
+                 years: int = 3, chunk_rows: int = 10000):
+        if factor < 1:
+            raise ValueError("factor must be >= 1")
+        self.source = source
+        self.out = out
+        self.factor = factor
+        self.seed = seed
+        self.skew = skew
+        self.chunk_rows = chunk_rows
+        self.clock = SeasonalClock(years=years)
+        self._parents = {}  # table -> (sorted base keys, offset, ZipfPicker)
+
+    def _parent(self, src, plans_by_name, table):
+        if table not in self._parents:
+            plan = plans_by_name[table]
+            keys = [r[0] for r in src.execute(f'SELECT "{plan.pk}" FROM "{table}" ORDER BY 1')]
+            self._parents[table] = (keys, plan.offset, ZipfPicker(len(keys) * self.factor, self.skew))
+        return self._parents[table]
+
+    def _pick(self, parent, anchor_value):
+        keys, offset, zipf = parent
+        u, = uniforms(self.seed, 1, anchor_value, 1)
+        # Scatter ranks over the key space so heavy customers are not all replica 0.
+        idx = (zipf.rank(u) * 2654435761) % zipf.n
+        return keys[idx % len(keys)] + (idx // len(keys)) * offset
+
+    def _date(self, anchor_value):
+        return self.clock.at(*uniforms(self.seed, 2, anchor_value, 3)).strftime(DATE_FORMAT)
+
+    def transform(self, plan, parents, row, k):
+        new = list(row)
+        for i, offset in plan.shifts.items():
+            if new[i] is not None:
+                new[i] += k * offset
+        for i, (anchor, _) in plan.skewed.items():
+            if new[anchor] is not None:
+                new[i] = self._pick(parents[i], new[anchor])
+        for i, anchor in plan.seasonal.items():
+            if new[anchor] is not None:
+                new[i] = self._date(new[anchor])
+        for i, start in plan.follows.items():
+            if row[i] is not None and row[start] is not None and new[start] is not None:
+                try:
+                    duration = datetime.datetime.fromisoformat(str(row[i])) - datetime.datetime.fromisoformat(str(row[start]))
+                    new[i] = (datetime.datetime.fromisoformat(str(new[start])) + duration).strftime(DATE_FORMAT)
+                except ValueError:
+                    pass
+        return new
+
+    def run(self) -> dict:
+        """Build `out`; returns {table: (rows added, seconds)}."""
+        tmp = self.out + ".building"
+        for path in (tmp, tmp + "-journal"):
+            if os.path.exists(path):
+                os.unlink(path)
+        src = sqlite3.connect(f"file:{os.path.abspath(self.source)}?mode=ro", uri=True)
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+            plans = plan_tables(src)
+            plans_by_name = {p.name: p for p in plans}
+            grown = set(plans_by_name)
+
+            placeholders = ",".join("?" * len(grown))
+            deferred = dst.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                f"AND sql IS NOT NULL AND tbl_name IN ({placeholders})", sorted(grown)).fetchall()
+            for kind, name, _ in deferred:
+                dst.execute(f'DROP {kind.upper()} "{name}"')
+            dst.commit()
+            dst.execute("PRAGMA journal_mode=OFF")
+            dst.execute("PRAGMA synchronous=OFF")
+            dst.execute("PRAGMA foreign_keys=OFF")
+
+            report = {}
+            for plan in plans:
+                parents = {i: self._parent(src, plans_by_name, parent) for i, (_, parent) in plan.skewed.items()}
+                cols = ", ".join(f'"{c}"' for c in plan.columns)
+                insert = f'INSERT INTO "{plan.name}" ({cols}) VALUES ({", ".join("?" * len(plan.columns))})'
+                start, added = time.perf_counter(), 0
+                for k in range(1, self.factor):
+                    cur = src.execute(f'SELECT {cols} FROM "{plan.name}"')
+                    while True:
+                        rows = cur.fetchmany(self.chunk_rows)
+                        if not rows:
+                            break
+                        dst.executemany(insert, [self.transform(plan, parents, row, k) for row in rows])
+                        added += len(rows)
+                    dst.commit()
+                report[plan.name] = (added, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for _, _, sql in deferred:
+                dst.execute(sql)
+            dst.execute("ANALYZE")
+            dst.commit()
+            report["(indexes, triggers, analyze)"] = (0, time.perf_counter() - start)
+            dst.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            src.close()
+            dst.close()
+        os.replace(tmp, self.out)
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grow the Sakila database by a factor.")
+    parser.add_argument("--factor", type=int, required=True)
+    parser.add_argument("--source", default=SOURCE_DB)
+    parser.add_argument("--out", help="output database (default data/sakila_x<factor>.db)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for customers (!= 1)")
+    parser.add_argument("--years", type=int, default=3, help="years of rental history to spread over")
+    parser.add_argument("--chunk-rows", type=int, default=10000)
+    args = parser.parse_args()
+    out = args.out or f"data/sakila_x{args.factor}.db"
+
+    print(f"Scaling {args.source} by x{args.factor} into {out} (seed {args.seed})...")
+    started = time.perf_counter()
+    report = ScaleUp(args.source, out, args.factor, seed=args.seed, skew=args.skew,
+                     years=args.years, chunk_rows=args.chunk_rows).run()
+    for table, (rows, seconds) in report.items():
+        rate = f"{rows / seconds:,.0f} rows/s" if rows and seconds > 0 else ""
+        print(f"  {table:<30} +{rows:>12,} rows  {seconds:8.2f}s  {rate}")
+    print(f"Done in {time.perf_counter() - started:.1f}s ({os.path.getsize(out) / 1e6:,.1f} MB).")